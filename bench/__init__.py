@@ -0,0 +1 @@
+"""Mesures hors réseau et doublures (dépôt GitHub en mémoire, modèle Gemini factice) ; hors de l'application."""
@@ -0,0 +1,5 @@
+import sys
+
+from bench.perf import main
+
+sys.exit(main())
@@ -0,0 +1,162 @@
+"""Dépôt GitHub en mémoire : remplace un `Repository` PyGithub pour les mesures et essais hors réseau.
+
+Couvre ce qu'utilisent StockageGithub et DepotGithub (API contents et Git
+Data). Chaque appel est compté dans `appels` ; `latence` (secondes) simule
+l'aller-retour réseau.
+"""
+import base64
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from github import GithubException
+
+from itb77.stockage import sha_blob
+
+
+def ErreurDepot(status, message):
+    return GithubException(status, {"message": message})
+
+
+class DepotMemoire:
+    default_branch = "main"
+
+    def __init__(self, fichiers=None, latence=0.0):
+        self.latence = latence
+        self.appels = Counter()
+        self.blobs = {}
+        self.arbres = {}
+        self.commits = {}
+        self.tete = self._nouveau_commit(dict(fichiers or {}), None)
+
+    # --- Utilitaires ---
+    def _appel(self, nom):
+        self.appels[nom] += 1
+        if self.latence: time.sleep(self.latence)
+
+    def _blob(self, data):
+        sha = sha_blob(data)
+        self.blobs[sha] = data
+        return sha
+
+    def _nouveau_commit(self, fichiers, parent):
+        arbre = {p: self._blob(d) if isinstance(d, bytes) else d for p, d in fichiers.items()}
+        sha_arbre = sha_blob(repr(sorted(arbre.items())).encode())
+        self.arbres[sha_arbre] = arbre
+        sha = sha_blob(f"{sha_arbre} {parent} {len(self.commits)}".encode())
+        self.commits[sha] = SimpleNamespace(sha=sha, tree=SimpleNamespace(sha=sha_arbre), parent=parent)
+        return sha
+
+    @property
+    def fichiers(self):
+        """{path: sha de blob} du commit de tête."""
+        return self.arbres[self.commits[self.tete].tree.sha]
+
+    def lire(self, path):
+        return self.blobs[self.fichiers[path]]
+
+    def _contenu(self, path, sha, avec_contenu):
+        data = self.blobs[sha] if avec_contenu else None
+        return SimpleNamespace(
+            name=path.rsplit("/", 1)[-1], path=path, type="file", sha=sha, encoding="base64",
+            content=base64.b64encode(data).decode() if avec_contenu else None, decoded_content=data,
+        )
+
+    def _ecrire(self, path, data):
+        fichiers = dict(self.fichiers)
+        if data is None: fichiers.pop(path)
+        else: fichiers[path] = data if isinstance(data, bytes) else data.encode("utf-8")
+        self.tete = self._nouveau_commit(fichiers, self.tete)
+        return sha_blob(fichiers[path]) if data is not None else None
+
+    # --- API contents ---
+    def get_contents(self, path, ref=None):
+        self._appel("get_contents")
+        fichiers = self.arbres[self.commits[ref or self.tete].tree.sha]
+        path = path.strip("/")
+        if path in fichiers:
+            return self._contenu(path, fichiers[path], True)
+        prefixe = f"{path}/" if path else ""
+        enfants = {}
+        for p, sha in fichiers.items():
+            if p.startswith(prefixe):
+                reste = p[len(prefixe):]
+                nom = reste.split("/")[0]
+                if "/" in reste:
+                    enfants[nom] = SimpleNamespace(name=nom, path=prefixe + nom, type="dir", sha=f"T:{prefixe}{nom}")
+                else:
+                    enfants[nom] = self._contenu(p, sha, False)
+        if not enfants:
+            raise ErreurDepot(404, f"{path} introuvable")
+        return list(enfants.values())
+
+    def create_file(self, path, message, content, branch=None):
+        self._appel("create_file")
+        if path in self.fichiers: raise ErreurDepot(422, f"{path} existe déjà")
+        self._ecrire(path, content)
+        return {"content": self._contenu(path, self.fichiers[path], False)}
+
+    def update_file(self, path, message, content, sha, branch=None):
+        self._appel("update_file")
+        if self.fichiers.get(path) != sha: raise ErreurDepot(409, f"{path} : sha périmé")
+        self._ecrire(path, content)
+        return {"content": self._contenu(path, self.fichiers[path], False)}
+
+    def delete_file(self, path, message, sha, branch=None):
+        self._appel("delete_file")
+        if self.fichiers.get(path) != sha: raise ErreurDepot(409, f"{path} : sha périmé")
+        self._ecrire(path, None)
+
+    # --- API Git Data ---
+    def get_git_blob(self, sha):
+        self._appel("get_git_blob")
+        return SimpleNamespace(sha=sha, encoding="base64", content=base64.b64encode(self.blobs[sha]).decode())
+
+    def get_git_tree(self, sha, recursive=False):
+        self._appel("get_git_tree")
+        prefixe = sha[2:] + "/"
+        return SimpleNamespace(tree=[
+            SimpleNamespace(path=p[len(prefixe):], type="blob", sha=s) for p, s in self.fichiers.items() if p.startswith(prefixe)
+        ])
+
+    def get_git_ref(self, ref):
+        self._appel("get_git_ref")
+        depot, parent = self, self.tete
+
+        def edit(sha, force=False):
+            depot._appel("edit_ref")
+            if depot.tete != parent and not force:
+                raise ErreurDepot(422, "Update is not a fast forward")
+            depot.tete = sha
+
+        return SimpleNamespace(object=SimpleNamespace(sha=parent), edit=edit)
+
+    def get_git_commit(self, sha):
+        self._appel("get_git_commit")
+        return self.commits[sha]
+
+    def create_git_blob(self, content, encoding):
+        self._appel("create_git_blob")
+        data = base64.b64decode(content) if encoding == "base64" else content.encode("utf-8")
+        return SimpleNamespace(sha=self._blob(data))
+
+    def create_git_tree(self, elements, base_tree=None):
+        self._appel("create_git_tree")
+        arbre = dict(self.arbres[base_tree.sha]) if base_tree is not None else {}
+        for e in elements:
+            ident = e._identity
+            if "content" in ident:
+                arbre[ident["path"]] = self._blob(ident["content"].encode("utf-8"))
+            elif ident.get("sha") is None:
+                arbre.pop(ident["path"], None)
+            else:
+                arbre[ident["path"]] = ident["sha"]
+        sha = sha_blob(repr(sorted(arbre.items())).encode())
+        self.arbres[sha] = arbre
+        return SimpleNamespace(sha=sha)
+
+    def create_git_commit(self, message, tree, parents):
+        self._appel("create_git_commit")
+        sha = sha_blob(f"{tree.sha} {parents[0].sha} {len(self.commits)}".encode())
+        self.commits[sha] = SimpleNamespace(sha=sha, tree=SimpleNamespace(sha=tree.sha), parent=parents[0].sha)
+        return self.commits[sha]
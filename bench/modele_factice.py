@@ -0,0 +1,101 @@
+"""Modèle Gemini factice : remplace `genai.GenerativeModel` pour les mesures et essais hors réseau.
+
+Les réponses sont scriptées (textes rejoués dans l'ordre, ou fonction du
+contenu envoyé) ; un entier dans le script lève l'erreur de ce code HTTP
+(429, 500...). Chaque appel est compté dans `appels`, la configuration
+reçue gardée dans `configs`. `installer` le branche sur itb77.ocr le temps
+d'un bloc `with`, modèles listés compris :
+
+    with installer(ModeleFactice([reponse_bon(COLS_BETON, 3), 429, abimer(txt, "tronque")])):
+        df, debug = extraire_bon(blob, prompt, schema=schema_reponse(COLS_BETON))
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from itb77 import ocr
+from itb77.schema import COLS_QUANTITES
+
+NOM_DEFAUT = "gemini-factice"
+DESIGNATIONS = ["Voile", "Poteau", "Dalle", "Semelle", "Longrine", "Plancher Haut", "Poutre"]
+DEFAUTS_ABIMES = ("markdown", "prose", "apostrophes", "tronque")
+
+
+class ErreurModele(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+
+class ModeleFactice:
+    def __init__(self, reponses, latence=0.0, schema_accepte=True):
+        self.reponses = reponses if callable(reponses) else list(reponses)
+        self.latence = latence
+        self.schema_accepte = schema_accepte
+        self.appels = Counter()
+        self.configs = []
+        self._rang = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, nom):
+        # Utilisé comme fabrique : FABRIQUE_MODELE(nom).generate_content(...)
+        return SimpleNamespace(generate_content=lambda contenu, generation_config=None: self._generer(nom, contenu, generation_config))
+
+    def _generer(self, nom, contenu, config):
+        with self._lock:
+            self.appels[nom] += 1
+            self.configs.append(config)
+            if callable(self.reponses):
+                reponse = self.reponses(contenu, config)
+            else:
+                reponse = self.reponses[min(self._rang, len(self.reponses) - 1)]
+                self._rang += 1
+        if self.latence: time.sleep(self.latence)
+        if config is not None and getattr(config, "response_schema", None) and not self.schema_accepte:
+            raise ErreurModele(400, "response_schema non pris en charge")
+        if isinstance(reponse, int):
+            raise ErreurModele(reponse)
+        return SimpleNamespace(text=reponse)
+
+
+@contextmanager
+def installer(modele, modeles=(f"models/{NOM_DEFAUT}",)):
+    """Branche `modele` sur itb77.ocr (génération et listage des modèles), puis rétablit Gemini."""
+    ancienne_fabrique, ancien_lister = ocr.FABRIQUE_MODELE, ocr.RESOLVEUR_MODELE.lister
+    ocr.FABRIQUE_MODELE = modele
+    ocr.RESOLVEUR_MODELE.lister = lambda: list(modeles)
+    ocr.RESOLVEUR_MODELE.invalider()
+    try:
+        yield modele
+    finally:
+        ocr.FABRIQUE_MODELE, ocr.RESOLVEUR_MODELE.lister = ancienne_fabrique, ancien_lister
+        ocr.RESOLVEUR_MODELE.invalider()
+
+
+def reponse_bon(colonnes, nb_lignes, seed=0):
+    """Réponse JSON valide de `nb_lignes` lignes aux clés `colonnes` (+ Doute)."""
+    rng = random.Random(seed)
+    lignes = []
+    for _ in range(nb_lignes):
+        ligne = {c: round(rng.uniform(0.5, 12), 1) if c in COLS_QUANTITES else
+                 (rng.choice(DESIGNATIONS) if c == "Designation" else f"{c} {rng.randint(1, 5)}") for c in colonnes}
+        ligne["Doute"] = rng.random() < 0.1
+        lignes.append(ligne)
+    return json.dumps(lignes, ensure_ascii=False)
+
+
+def abimer(txt, defaut):
+    """Défauts observés dans les réponses du modèle, appliqués à un JSON valide."""
+    if defaut == "markdown":
+        return f"```json\n{txt}\n```"
+    if defaut == "prose":
+        return f"Voici les données extraites du bon :\n{txt}\nN'hésitez pas si besoin."
+    if defaut == "apostrophes":
+        return txt.replace('"', "'")
+    if defaut == "tronque":
+        return txt[:int(len(txt) * 0.7)]
+    raise ValueError(defaut)
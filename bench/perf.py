@@ -0,0 +1,317 @@
+"""Mesures de performance sur des chantiers synthétiques, sans réseau.
+
+Chaque étape (sauvegarde, relecture, récap, correspondance, idem, exports,
+lecture des réponses OCR d'un modèle factice, pré-traitement d'une photo) est
+chronométrée puis rejouée sous tracemalloc pour le pic mémoire, sur un dépôt
+GitHub en mémoire (bench.depot_memoire). Les résultats sont écrits en JSON ;
+`--comparer` signale les étapes plus lentes qu'une référence, par défaut
+bench/baseline.json (versionnée, à régénérer avec `--sortie` quand la machine
+de mesure change ou qu'un gain est acquis) :
+
+    python -m bench --sortie bench/baseline.json
+    python -m bench --comparer
+    python -m bench --etapes idem --signes u U '"' id idem
+
+`--scans <dossier>` mesure à la place le pré-traitement de vraies photos
+(taille avant / après, durée ; latence Gemini brut vs pré-traité avec --api-key).
+"""
+import argparse
+import functools
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bench.depot_memoire import DepotMemoire
+from bench.modele_factice import DEFAUTS_ABIMES, ModeleFactice, abimer, installer, reponse_bon
+from itb77.correspondance import index_budget
+from itb77.demarrage import charger
+from itb77.exports import generer_excel_stylise, generer_pdf_recap
+from itb77.cache_ocr import CacheOCR
+from itb77.images import FORMATS, charger_image, pretraiter_image
+from itb77.nettoyage import DECLENCHEURS_DITTO, appliquer_correction_u, verifier_correspondance_budget
+from itb77.ocr import LimiteurDebit, extraire_bon, schema_reponse
+from itb77.portefeuille import indexer, version_chantier
+from itb77.recap import RecapMaterialise, calculer_recaps, ecrire_sidecar, feuilles_acier, feuilles_recap
+from itb77.schema import (BASE_DIR, COLS_ACIER, COLS_BETON, COLS_ETUDE_ACIER, COLS_ETUDE_BETON, COLS_PREV,
+                          STANDARD_ITEMS, lire_classeur, serialiser_classeur, typer_classeur)
+from itb77.stockage import StockageGithub
+
+TAILLES_DEFAUT = (100, 10_000, 100_000)
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SEUIL_REGRESSION = 1.5  # au-delà de ce rapport de durée, l'étape est signalée
+DUREE_MIN_COMPARAISON = 0.02  # s ; en dessous, le bruit domine
+REPETITIONS = 5
+BUDGET_REPETITIONS = 2.0  # s par étape ; on garde le meilleur temps des passes faites dans ce budget
+NIVEAUX = ["", " R-1", " RDC", " R+1", " R+2", " R+3", " Bât A", " Bât B"]
+TYPES_BETON = ["C25/30", "C30/37", "C35/45", "Gros béton", "Béton fibré"]
+TYPES_ACIER = ["HA", "TS", "HA8", "HA10", "HA12"]
+TAILLE_PHOTO = (4032, 3024)  # photo de téléphone 12 Mpx
+
+
+def _bruiter(designations, rng, taux):
+    """Fautes et pluriels comme sur les bons lus par OCR, sur une fraction `taux` des lignes."""
+    out = designations.astype(object)
+    for i in np.flatnonzero(rng.random(len(out)) < taux):
+        d = out[i]
+        k = rng.integers(3)
+        if k == 0: out[i] = d + "s"
+        elif k == 1 and len(d) > 4: out[i] = d[:2] + d[3:]
+        else: out[i] = d.lower()
+    return out
+
+
+def generer_chantier(nb_bons, nb_lignes_budget=40, nb_fournisseurs=5, seed=0, taux_idem=0.05, taux_fautes=0.1):
+    """Classeur {feuille: DataFrame} au format de l'application (COLS_*), reproductible par `seed`.
+
+    Le prévisionnel décline STANDARD_ITEMS par niveau jusqu'à `nb_lignes_budget`
+    lignes ; les bons reprennent ces désignations avec des fautes et des idem.
+    """
+    rng = np.random.default_rng(seed)
+    budget = []
+    for niveau in NIVEAUX * (nb_lignes_budget // (len(STANDARD_ITEMS) * len(NIVEAUX)) + 1):
+        for item in STANDARD_ITEMS:
+            if len(budget) < nb_lignes_budget:
+                budget.append({"Designation": item["Designation"] + niveau, "Zone": item["Zone"]})
+        if len(budget) >= nb_lignes_budget: break
+    df_prev = pd.DataFrame(budget)
+    df_prev["Prevu (m3)"] = rng.integers(5, 500, len(df_prev)).astype(float)
+    df_prev = df_prev[COLS_PREV]
+    df_etude = df_prev.rename(columns={"Prevu (m3)": "Etude (m3)"})[COLS_ETUDE_BETON]
+    df_etude["Etude (m3)"] = (df_etude["Etude (m3)"] * rng.uniform(0.9, 1.1, len(df_etude))).round(1)
+
+    fournisseurs = np.array([f"Fournisseur {i + 1}" for i in range(nb_fournisseurs)], dtype=object)
+    designations = _bruiter(df_prev["Designation"].to_numpy()[rng.integers(len(df_prev), size=nb_bons)], rng, taux_fautes)
+    types = np.array(TYPES_BETON, dtype=object)[rng.integers(len(TYPES_BETON), size=nb_bons)]
+    idem = rng.random(nb_bons) < taux_idem
+    idem[0] = False
+    designations[idem] = "u"
+    df_beton = pd.DataFrame({
+        "Fournisseur": fournisseurs[rng.integers(nb_fournisseurs, size=nb_bons)],
+        "Designation": designations,
+        "Type de Beton": types,
+        "Volume (m3)": rng.uniform(0.5, 12, nb_bons).round(2),
+    })[COLS_BETON]
+    nb_acier = max(1, nb_bons // 4)
+    df_acier = pd.DataFrame({
+        "Fournisseur": fournisseurs[rng.integers(nb_fournisseurs, size=nb_acier)],
+        "Type d Acier": np.array(TYPES_ACIER, dtype=object)[rng.integers(len(TYPES_ACIER), size=nb_acier)],
+        "Designation": df_prev["Designation"].to_numpy()[rng.integers(len(df_prev), size=nb_acier)],
+        "Poids (kg)": rng.uniform(20, 2000, nb_acier).round(1),
+    })[COLS_ACIER]
+    df_etude_acier = pd.DataFrame({"Designation": df_prev["Designation"], "Acier HA": rng.uniform(100, 5000, len(df_prev)).round(0),
+                                   "Acier TS": rng.uniform(0, 1000, len(df_prev)).round(0), "Zone": df_prev["Zone"]})[COLS_ETUDE_ACIER]
+    return {"Beton": df_beton, "Acier": df_acier, "Previsionnel": df_prev, "Etude_Beton": df_etude, "Etude_Acier": df_etude_acier}
+
+
+# --- Étapes : chacune reçoit le contexte du chantier (dépôt, stockage, feuilles) ---
+
+def _sauvegarde(ctx):
+    # Même chemin que sauvegarder_excel_github : classeur + sidecar + index en un lot
+    stockage, dossier = ctx["stockage"], ctx["dossier"]
+    with stockage.lot("Bench") as lot:
+        sha = lot.ecrire(ctx["path"], serialiser_classeur(ctx["sheets"]), stockage.sha(ctx["path"]))
+        etat = RecapMaterialise()
+        recaps = etat.recaps(*feuilles_recap(ctx["sheets"]), *feuilles_acier(ctx["sheets"]), version=version_chantier(sha))
+        ecrire_sidecar(lot, dossier, etat)
+        indexer(lot, stockage, BASE_DIR, ctx["nom"], ctx["sheets"], version_chantier(sha), recaps.beton)
+
+
+def _lecture(ctx):
+    ctx["relu"] = lire_classeur(ctx["stockage"].lire(ctx["path"]))
+
+
+def _recap(ctx):
+    ctx["df_recap"], _, ctx["df_recap_acier"] = calculer_recaps(*feuilles_recap(ctx["sheets"]), *feuilles_acier(ctx["sheets"]))
+
+
+def _recap_ajout(ctx):
+    # Récap incrémental après l'ajout d'un bon, l'état étant déjà à jour du reste
+    df_beton, df_prev, df_etude = feuilles_recap(ctx["sheets"])
+    ctx["etat"].recaps(pd.concat([df_beton, df_beton.tail(1)], ignore_index=True), df_prev, df_etude, *feuilles_acier(ctx["sheets"]))
+
+
+def _correspondance(ctx):
+    # Chemin de la relecture OCR : lignes brutes, non typées
+    df_beton, df_prev = ctx["brut"]["Beton"], ctx["sheets"]["Previsionnel"]
+    _, inconnus = verifier_correspondance_budget(df_beton.copy(), df_prev)
+    index_budget(df_prev).suggerer(inconnus)
+
+
+def _idem(ctx):
+    appliquer_correction_u(ctx["brut"]["Beton"].copy(), ["Designation", "Type de Beton"], ctx["declencheurs"])
+
+
+def _export_excel(ctx):
+    generer_excel_stylise({k: ctx["sheets"][k] for k in ("Beton", "Acier")} | {"Recap": ctx["df_recap"], "Recap Acier": ctx["df_recap_acier"]})
+
+
+def _export_pdf(ctx):
+    generer_pdf_recap(ctx["df_recap"], ctx["nom"], ctx["df_recap_acier"])
+
+
+def _ocr_json(ctx):
+    # Réponse valide puis chaque défaut connu, via extraire_bon : aucune ne doit finir vide
+    with installer(ModeleFactice(ctx["reponses_ocr"])):
+        for _ in ctx["reponses_ocr"]:
+            df, debug = extraire_bon({"mime_type": "image/jpeg", "data": b""}, "bench", ctx["limiteur"], CacheOCR(), ctx["schema_ocr"])
+            if df.empty: raise RuntimeError(debug)
+
+
+@functools.cache
+def photo_synthetique(taille=TAILLE_PHOTO):
+    """JPEG d'un bon photographié : dégradé de lumière et grain, indépendant de la taille du chantier."""
+    Image = charger("PIL.Image")
+    fond = Image.linear_gradient("L").resize(taille)
+    image = Image.merge("RGB", (fond, Image.effect_noise(taille, 40), fond))
+    sortie = io.BytesIO()
+    image.save(sortie, format="JPEG", quality=92)
+    return sortie.getvalue()
+
+
+def _pretraitement(ctx):
+    pretraiter_image("bon.jpg", photo_synthetique())
+
+
+ETAPES = {
+    "sauvegarde": _sauvegarde, "lecture": _lecture, "recap": _recap, "recap_ajout": _recap_ajout,
+    "correspondance": _correspondance, "idem": _idem, "export_excel": _export_excel, "export_pdf": _export_pdf,
+    "ocr_json": _ocr_json, "pretraitement": _pretraitement,
+}
+
+
+def _contexte(sheets, nom="Bench", declencheurs=DECLENCHEURS_DITTO):
+    depot = DepotMemoire()
+    dossier = f"{BASE_DIR}/{nom}"
+    ctx = {"depot": depot, "stockage": StockageGithub(depot), "nom": nom, "dossier": dossier,
+           "path": f"{dossier}/{nom}.xlsx", "brut": sheets, "sheets": typer_classeur(sheets), "etat": RecapMaterialise(),
+           "declencheurs": declencheurs}
+    ctx["etat"].recaps(*feuilles_recap(ctx["sheets"]), *feuilles_acier(ctx["sheets"]))
+    _recap(ctx)
+    # Une réponse par défaut, de la taille du chantier (plafonnée : un bon fait quelques dizaines de lignes)
+    txt = reponse_bon(COLS_BETON, min(len(sheets["Beton"]), 1000))
+    ctx["reponses_ocr"] = [txt] + [abimer(txt, d) for d in DEFAUTS_ABIMES]
+    ctx["schema_ocr"] = schema_reponse(COLS_BETON)
+    ctx["limiteur"] = LimiteurDebit(par_minute=10 ** 9, rafale=10 ** 9)
+    return ctx
+
+
+def mesurer(nb_bons, nb_lignes_budget=40, nb_fournisseurs=5, seed=0, memoire=True, etapes=None, declencheurs=DECLENCHEURS_DITTO):
+    """{étape: {"s": meilleure durée, "passes", "pic_mo": pic mémoire, "appels": appels au dépôt}} pour `nb_bons` bons."""
+    sheets = generer_chantier(nb_bons, nb_lignes_budget, nb_fournisseurs, seed)
+    ctx = _contexte(sheets, declencheurs=declencheurs)
+    _sauvegarde(ctx)  # le classeur doit exister pour la relecture
+    resultats = {}
+    for nom, fn in ETAPES.items():
+        if etapes and nom not in etapes: continue
+        durees = []
+        while len(durees) < REPETITIONS and sum(durees) < BUDGET_REPETITIONS:
+            ctx["depot"].appels.clear()
+            gc.collect()
+            t = time.perf_counter()
+            fn(ctx)
+            durees.append(time.perf_counter() - t)
+        res = {"s": round(min(durees), 5), "passes": len(durees)}
+        if ctx["depot"].appels: res["appels"] = dict(ctx["depot"].appels)
+        if memoire:
+            gc.collect()
+            tracemalloc.start()
+            fn(ctx)
+            res["pic_mo"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+        resultats[nom] = res
+    return resultats
+
+
+def comparer(actuel, reference, seuil=SEUIL_REGRESSION):
+    """Liste de (taille, étape, durée de référence, durée actuelle) pour les étapes plus lentes que `seuil` x."""
+    regressions = []
+    for taille, etapes in actuel["resultats"].items():
+        for etape, res in etapes.items():
+            ref = reference.get("resultats", {}).get(taille, {}).get(etape)
+            if ref and max(res["s"], ref["s"]) >= DUREE_MIN_COMPARAISON and res["s"] > ref["s"] * seuil:
+                regressions.append((taille, etape, ref["s"], res["s"]))
+    return regressions
+
+
+def rapport_scans(dossier, format="JPEG", api_key=""):
+    """Pré-traitement de chaque photo de `dossier` : octets avant / après, durée (et latence OCR si `api_key`)."""
+    fichiers = sorted(f for f in os.listdir(dossier) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.heic')))
+    if api_key:
+        from itb77 import ocr
+        ocr.configurer(api_key)
+    total_avant = total_apres = 0
+    print(f"{'fichier':40} {'avant':>10} {'après':>10} {'gain':>6} {'prétrait.':>10}" + (f" {'ocr brut':>9} {'ocr prét.':>9}" if api_key else ""))
+    for nom in fichiers:
+        with open(os.path.join(dossier, nom), "rb") as f:
+            data = f.read()
+        res = pretraiter_image(nom, data, format=format)
+        total_avant += res.octets_origine
+        total_apres += len(res.data)
+        ligne = f"{nom[:40]:40} {res.octets_origine:>10} {len(res.data):>10} {100 - len(res.data) * 100 / res.octets_origine:>5.0f}% {res.duree * 1000:>8.0f}ms"
+        if api_key:
+            t = time.perf_counter(); ocr.extraire_bon(charger_image(nom, data), "Donnees JSON")
+            t_brut = time.perf_counter() - t
+            t = time.perf_counter(); ocr.extraire_bon(res.blob(), "Donnees JSON")
+            ligne += f" {t_brut:>8.1f}s {time.perf_counter() - t:>8.1f}s"
+        print(ligne)
+    if fichiers:
+        print(f"Total : {total_avant} -> {total_apres} octets ({total_avant - total_apres} économisés sur {len(fichiers)} image(s))")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ITB77 sur chantiers synthétiques")
+    parser.add_argument("--tailles", type=int, nargs="+", default=list(TAILLES_DEFAUT), help="nombres de bons béton")
+    parser.add_argument("--budget", type=int, default=40, help="lignes de prévisionnel")
+    parser.add_argument("--fournisseurs", type=int, default=5)
+    parser.add_argument("--etapes", nargs="*", choices=list(ETAPES))
+    parser.add_argument("--sans-memoire", action="store_true", help="ne pas rejouer sous tracemalloc")
+    parser.add_argument("--sortie", help="fichier JSON des résultats")
+    parser.add_argument("--comparer", nargs="?", const=REFERENCE, metavar="JSON",
+                        help=f"JSON de référence (défaut : {os.path.relpath(REFERENCE)}) ; code retour 1 si régression")
+    parser.add_argument("--seuil", type=float, default=SEUIL_REGRESSION)
+    parser.add_argument("--signes", nargs="*", default=list(DECLENCHEURS_DITTO), help='signes idem de l\'étape idem, ex. : u U \" id idem')
+    parser.add_argument("--scans", help="dossier de photos : pré-traitement de chacune, à la place du chantier synthétique")
+    parser.add_argument("--format", default="JPEG", choices=sorted(FORMATS), help="format de sortie pour --scans")
+    parser.add_argument("--api-key", default="", help="avec --scans, mesure aussi la latence Gemini (brut vs pré-traité)")
+    args = parser.parse_args(argv)
+
+    if args.scans:
+        rapport_scans(args.scans, args.format, args.api_key)
+        return 0
+
+    resultats = {}
+    for n in args.tailles:
+        resultats[str(n)] = mesurer(n, args.budget, args.fournisseurs, memoire=not args.sans_memoire, etapes=args.etapes,
+                                   declencheurs=args.signes)
+        for etape, res in resultats[str(n)].items():
+            pic = f"{res['pic_mo']:>8.1f} Mo" if "pic_mo" in res else ""
+            print(f"{n:>7} bons  {etape:<15} {res['s'] * 1000:>10.1f} ms {pic}")
+    sortie = {
+        "meta": {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "pandas": pd.__version__, "numpy": np.__version__, "machine": platform.machine(),
+                 "budget": args.budget, "fournisseurs": args.fournisseurs},
+        "resultats": resultats,
+    }
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(sortie, f, ensure_ascii=False, indent=1)
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            regressions = comparer(sortie, json.load(f), args.seuil)
+        for taille, etape, ref, actuel in regressions:
+            print(f"RÉGRESSION {taille} bons / {etape} : {ref * 1000:.1f} ms -> {actuel * 1000:.1f} ms")
+        if regressions: return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Modules métier de l'application GESTION ITB77 (importables sans Streamlit)."""
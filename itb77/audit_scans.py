@@ -0,0 +1,286 @@
+"""Relecture de l'archive des scans (SCANS_BETON / SCANS_ACIER) et écart avec les classeurs.
+
+Quand le prompt, le modèle ou le nettoyage changent, chaque scan archivé est
+relu (pool OCR, limiteur de débit et cache OCR de l'application) et ses
+lignes sont comparées à la feuille Beton / Acier du chantier : le CSV de
+sortie a une ligne par ligne relue (identique, quantité différente, absente
+du classeur), une par ligne du classeur qu'aucun scan n'explique et une par
+scan non relu.
+
+Les réponses brutes du modèle sont ajoutées au fichier de reprise (JSON
+lines) au fil de l'eau : un passage interrompu reprend là où il s'était
+arrêté. Un scan est relu à nouveau si son contenu change ou si ce qui
+détermine la réponse (prompt, schéma, modèles préférés) change ; le
+nettoyage et la comparaison sont refaits à chaque passage, sans appel.
+
+    GOOGLE_API_KEY=... python -m itb77.audit_scans --racine /copie/du/depot --sortie audit.csv
+    GOOGLE_API_KEY=... GITHUB_TOKEN=... python -m itb77.audit_scans --depot owner/ITB --chantiers "Chantier A" --limite 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from itb77 import doublons, mesures
+from itb77.cache_ocr import CACHE_OCR, OCTETS_MAX_DEFAUT as CACHE_OCR_OCTETS_DEFAUT
+from itb77.ingestion import DOCUMENTS
+from itb77.mesures import propager
+from itb77.nettoyage import DECLENCHEURS_DITTO, preparer_relecture, remove_accents
+from itb77.ocr import LIMITEUR_OCR, OCR_WORKERS_DEFAUT, PREFERENCES_MODELES, analyser_lot, construire_prompt, schema_reponse
+from itb77.rapports import charger_chantier, lister_chantiers
+from itb77.schema import BASE_DIR, typer_feuille
+from itb77.stockage import ajouter_options_stockage, stockage_depuis_options
+
+REPRISE_DEFAUT = "audit_scans.jsonl"
+TOLERANCE_DEFAUT = 0.01   # écart de quantité en dessous duquel deux lignes sont identiques
+WORKERS_TELECHARGEMENT = 8
+COLONNES = ["Chantier", "Feuille", "Scan", "Statut", "Ligne", "Doute", "Fournisseur", "Designation",
+            "Type de Beton", "Type d Acier", "Relu", "Enregistré", "Motif"]
+
+_NOM_SCAN = re.compile(r"^(\d{2}-\d{2}-\d{4}) -- .* -- (\d{2}-\d{2}-\d{2})(?:-(\d+))?\.\w+$")
+
+
+def date_scan(nom):
+    """Clé de tri chronologique d'un scan archivé (voir ingestion.chemin_scan)."""
+    m = _NOM_SCAN.match(nom)
+    if not m:
+        return datetime.min, 0, nom
+    return datetime.strptime(f"{m[1]} {m[2]}", "%d-%m-%Y %H-%M-%S"), int(m[3] or 1), nom
+
+
+def empreinte_lecture(document):
+    """Ce qui détermine la réponse du modèle pour un `document` ; un scan lu sous une autre empreinte est relu."""
+    cle = json.dumps([construire_prompt(document.prompt), schema_reponse(document.colonnes), PREFERENCES_MODELES],
+                     sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(cle.encode("utf-8")).hexdigest()[:16]
+
+
+def scans_archives(stockage, dossier_chantier, document):
+    try:
+        entrees = stockage.lister(f"{dossier_chantier}/{document.dossier_scans}")
+    except Exception:
+        return []  # dossier pas encore créé
+    scans = [e for e in entrees if e.type == "file" and e.name.lower().endswith(doublons.EXTENSIONS)]
+    return sorted(scans, key=lambda e: date_scan(e.name))
+
+
+def lire_reprise(chemin):
+    """{(chemin du scan, sha, empreinte de lecture): entrée} des scans déjà relus."""
+    faits = {}
+    try:
+        with open(chemin, encoding="utf-8") as f:
+            for ligne in f:
+                try:
+                    e = json.loads(ligne)
+                except ValueError:
+                    continue  # dernière ligne tronquée par un arrêt brutal
+                faits[(e["scan"], e["sha"], e["lecture"])] = e
+    except FileNotFoundError:
+        pass
+    return faits
+
+
+def ouvrir_reprise(chemin):
+    f = open(chemin, "a+", encoding="utf-8")
+    if f.tell():
+        f.seek(f.tell() - 1)
+        if f.read(1) != "\n":
+            f.write("\n")  # ne pas coller la prochaine entrée à une ligne tronquée
+    return f
+
+
+def relire(stockage, scans, document, api_key, reprise, workers=OCR_WORKERS_DEFAUT, suivi=None):
+    """Relit `scans` (entrées du stockage) par paquets ; chaque scan lu est ajouté au fichier `reprise`.
+
+    Le paquet suivant est téléchargé pendant la lecture du courant. Retourne
+    ({clé de reprise: entrée} des scans lus, {chemin: motif} des scans non lus).
+    `suivi(scan)` est appelé à chaque scan traité.
+    """
+    lecture = empreinte_lecture(document)
+    schema = schema_reponse(document.colonnes)
+    taille = max(1, workers) * 4
+    paquets = [scans[i:i + taille] for i in range(0, len(scans), taille)]
+    lus, echecs = {}, {}
+
+    def telecharger(e):
+        try:
+            return stockage.lire_blob(e.path, e.sha)
+        except Exception as ex:
+            return ex
+
+    with ThreadPoolExecutor(max_workers=WORKERS_TELECHARGEMENT, thread_name_prefix="audit") as pool:
+        telecharger = propager(telecharger)
+        a_venir = [pool.submit(telecharger, e) for e in paquets[0]] if paquets else []
+        for k, paquet in enumerate(paquets):
+            courants = a_venir
+            a_venir = [pool.submit(telecharger, e) for e in paquets[k + 1]] if k + 1 < len(paquets) else []
+            entrees, fichiers = [], []
+            for e, fut in zip(paquet, courants):
+                data = fut.result()
+                if isinstance(data, Exception):
+                    echecs[e.path] = f"téléchargement : {data}"
+                    if suivi: suivi(e)
+                else:
+                    entrees.append(e)
+                    fichiers.append((e.name, data))
+            for i, _, df, debug, _ in analyser_lot(fichiers, api_key, document.prompt, workers, schema=schema):
+                e = entrees[i]
+                if df.empty:
+                    echecs[e.path] = debug.splitlines()[0] if debug else "réponse vide"
+                else:
+                    entete = debug.splitlines()[0] if debug else ""
+                    entree = {"scan": e.path, "sha": e.sha, "lecture": lecture, "le": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+                              "modele": entete.removeprefix("Modèle: "), "lignes": df.to_dict("records")}
+                    reprise.write(json.dumps(entree, ensure_ascii=False, default=str) + "\n")
+                    reprise.flush()
+                    lus[(e.path, e.sha, lecture)] = entree
+                if suivi: suivi(e)
+    return lus, echecs
+
+
+def _cle(ligne, cols_texte):
+    return tuple(" ".join(remove_accents(str(ligne[c])).lower().split()) for c in cols_texte)
+
+
+def comparer(relus, feuille, document, tolerance=TOLERANCE_DEFAUT):
+    """Écart entre les lignes relues, [(scan, DataFrame nettoyé)], et la `feuille` enregistrée.
+
+    Chaque ligne de la feuille sert au plus une fois : d'abord à une ligne
+    relue de mêmes textes et de même quantité (à `tolerance` près), puis à
+    la ligne relue de mêmes textes la plus proche en quantité.
+    """
+    col, cols_texte = document.col_num, document.cols_texte
+    enregistres = feuille.reindex(columns=document.colonnes).to_dict("records")
+    libres = {}
+    for pos, r in enumerate(enregistres):
+        libres.setdefault(_cle(r, cols_texte), []).append(pos)
+    lignes = [(scan, r) for scan, df in relus for r in df.to_dict("records")]
+    apparies = [None] * len(lignes)
+    for passe in ("identique", "quantite"):
+        for k, (_, r) in enumerate(lignes):
+            candidats = libres.get(_cle(r, cols_texte))
+            if apparies[k] is not None or not candidats: continue
+            ecarts = [abs(float(r[col]) - float(enregistres[p][col])) for p in candidats]
+            j = min(range(len(candidats)), key=ecarts.__getitem__)
+            if passe == "identique" and ecarts[j] > tolerance: continue
+            apparies[k] = (passe, candidats.pop(j))
+    sortie = []
+    for (scan, r), apparie in zip(lignes, apparies):
+        statut, pos = apparie or ("absente", None)
+        sortie.append({"Scan": scan, "Statut": statut, "Ligne": pos + 2 if pos is not None else None, "Doute": r["Doute"],
+                       **{c: r[c] for c in cols_texte}, "Relu": r[col],
+                       "Enregistré": enregistres[pos][col] if pos is not None else None})
+    # Lignes du classeur (ligne Excel = position + 2) qu'aucun scan relu n'explique
+    for pos in sorted(p for positions in libres.values() for p in positions):
+        r = enregistres[pos]
+        sortie.append({"Scan": "", "Statut": "sans scan", "Ligne": pos + 2, **{c: r[c] for c in cols_texte},
+                       "Enregistré": r[col]})
+    return pd.DataFrame(sortie, columns=COLONNES[2:])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relecture des scans archivés et écart avec les classeurs ITB77")
+    ajouter_options_stockage(parser)
+    parser.add_argument("--base", default=BASE_DIR, help="dossier des chantiers")
+    parser.add_argument("--chantiers", nargs="+", help="sous-ensemble de chantiers (défaut : tous)")
+    parser.add_argument("--type", choices=sorted(DOCUMENTS), nargs="+", default=sorted(DOCUMENTS))
+    parser.add_argument("--journal", action="store_true", help="fusionner le journal (STOCKAGE_MODE = journal)")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS_DEFAUT, help="appels OCR en parallèle")
+    parser.add_argument("--requetes-par-minute", type=float, default=LIMITEUR_OCR.par_minute)
+    parser.add_argument("--cache-ocr", default=".cache_ocr", help="dossier du cache OCR (vide : désactivé)")
+    parser.add_argument("--limite", type=int, help="nombre maximal de scans relus par ce passage")
+    parser.add_argument("--reprise", default=REPRISE_DEFAUT, help="fichier des réponses déjà obtenues (JSON lines)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_DEFAUT)
+    parser.add_argument("--signes-ditto", nargs="*", default=list(DECLENCHEURS_DITTO))
+    parser.add_argument("--sortie", default=f"audit_scans_{datetime.now():%Y-%m-%d}.csv")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        parser.error("GOOGLE_API_KEY absent de l'environnement")
+    stockage = stockage_depuis_options(args, parser)
+    LIMITEUR_OCR.par_minute = args.requetes_par_minute
+    CACHE_OCR.configurer(args.cache_ocr, CACHE_OCR_OCTETS_DEFAUT)
+    releve = mesures.Releve("audit_scans")
+    mesures.activer(releve)
+
+    faits = lire_reprise(args.reprise)
+    plan = []
+    for nom in args.chantiers or lister_chantiers(stockage, args.base):
+        sheets = charger_chantier(stockage, args.base, nom, args.journal)
+        if sheets is None:
+            print(f"{nom} : classeur introuvable", file=sys.stderr)
+            continue
+        for type_doc in args.type:
+            document = DOCUMENTS[type_doc]
+            plan.append((nom, sheets, document, scans_archives(stockage, f"{args.base}/{nom}", document), empreinte_lecture(document)))
+    a_lire = [[e for e in scans if (e.path, e.sha, lecture) not in faits] for _, _, _, scans, lecture in plan]
+    total, reste = sum(map(len, a_lire)), args.limite
+    if reste is not None:
+        for i, scans in enumerate(a_lire):
+            a_lire[i], reste = scans[:reste], max(0, reste - len(scans))
+    print(f"{sum(len(s) for _, _, _, s, _ in plan)} scan(s) archivé(s), {total} à relire"
+          + (f", {sum(map(len, a_lire))} dans ce passage" if args.limite is not None else ""), file=sys.stderr)
+
+    echecs, interrompu = {}, False
+    debut = time.perf_counter()
+    compte = {"n": 0}
+    a_traiter = sum(map(len, a_lire))
+
+    def suivi(_):
+        compte["n"] += 1
+        print(f"\r{compte['n']}/{a_traiter} scan(s) relus", end="", file=sys.stderr, flush=True)
+
+    try:
+        with ouvrir_reprise(args.reprise) as reprise:
+            for (_, _, document, _, _), scans in zip(plan, a_lire):
+                if not scans: continue
+                lus, non_lus = relire(stockage, scans, document, api_key, reprise, args.workers, suivi)
+                faits.update(lus)
+                echecs.update(non_lus)
+    except KeyboardInterrupt:
+        interrompu = True
+    print(file=sys.stderr)
+    duree = time.perf_counter() - debut
+
+    ecarts = []
+    for nom, sheets, document, scans, lecture in plan:
+        budget = typer_feuille("Previsionnel", sheets.get("Previsionnel"))
+        relus, non_relus = [], []
+        for e in scans:
+            entree = faits.get((e.path, e.sha, lecture))
+            if entree is None:
+                non_relus.append({"Scan": e.path, "Statut": "non relu", "Motif": echecs.get(e.path, "pas encore relu")})
+                continue
+            df, _ = preparer_relecture(pd.DataFrame(entree["lignes"]), document.colonnes, document.cols_texte, document.col_num,
+                                       document.cols_ditto, budget, tuple(args.signes_ditto))
+            relus.append((e.path, df))
+        groupe = comparer(relus, typer_feuille(document.feuille, sheets.get(document.feuille)), document, args.tolerance)
+        for df in (groupe, pd.DataFrame(non_relus)):
+            if not df.empty: ecarts.append(df.assign(Chantier=nom, Feuille=document.feuille))
+    ecarts = pd.concat(ecarts or [pd.DataFrame(columns=COLONNES)], ignore_index=True).reindex(columns=COLONNES)
+    ecarts["Ligne"] = ecarts["Ligne"].astype("Int64")
+    ecarts.to_csv(args.sortie, index=False, encoding="utf-8-sig")
+
+    appels = {nom: v[0] for nom, v in releve.stats.items()}
+    lus = compte["n"] - len(echecs)
+    if compte["n"]:
+        print(f"{compte['n']} scan(s) traités en {duree:.1f} s ({compte['n'] / duree * 60:.1f} scans/min, "
+              f"{args.workers} worker(s)) : {lus} relu(s), {len(echecs)} non lu(s), {appels.get('gemini.generation', 0)} appel(s) "
+              f"au modèle, {CACHE_OCR.stats()['hits']} réponse(s) du cache OCR")
+    if not ecarts.empty:
+        with pd.option_context("display.width", 200, "display.max_rows", None):
+            print(pd.crosstab([ecarts["Chantier"], ecarts["Feuille"]], ecarts["Statut"]).to_string())
+    print(f"{len(ecarts)} ligne(s) -> {args.sortie}" + (" (passage interrompu : relancer la même commande pour reprendre)" if interrompu else ""))
+    return 130 if interrompu else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
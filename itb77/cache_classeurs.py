@@ -0,0 +1,66 @@
+"""Cache mémoire des classeurs Excel lus sur GitHub.
+
+Les feuilles parsées sont indexées par (chemin, sha du blob) : un sha identique
+garantit un contenu identique, donc une entrée n'est jamais périmée. Le cache est
+partagé par toutes les sessions du processus (le module n'est importé qu'une fois).
+"""
+import threading
+from collections import OrderedDict
+
+TAILLE_MAX_DEFAUT = 16
+
+
+def _copier(sheets):
+    # Les pages modifient les DataFrames en place (ajout de colonnes, concat...) :
+    # on ne rend jamais l'objet stocké lui-même.
+    return {nom: df.copy() for nom, df in sheets.items()}
+
+
+class CacheClasseurs:
+    def __init__(self, taille_max=TAILLE_MAX_DEFAUT):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, sha):
+        with self._lock:
+            key = (path, sha)
+            if key in self._entrees:
+                self._entrees.move_to_end(key)
+                self.hits += 1
+                return _copier(self._entrees[key])
+            self.misses += 1
+            return None
+
+    def put(self, path, sha, sheets):
+        with self._lock:
+            # Une seule version par fichier : l'ancien sha ne sera plus demandé
+            for key in [k for k in self._entrees if k[0] == path]:
+                del self._entrees[key]
+            self._entrees[(path, sha)] = _copier(sheets)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+                self.evictions += 1
+
+    def invalider(self, path):
+        with self._lock:
+            for key in [k for k in self._entrees if k[0] == path]:
+                del self._entrees[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entrees": len(self._entrees),
+                "taille_max": self.taille_max,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "taux_hit": (self.hits / total * 100) if total else 0.0,
+            }
+
+
+CACHE_CLASSEURS = CacheClasseurs()
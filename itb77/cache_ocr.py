@@ -0,0 +1,109 @@
+"""Cache disque des réponses OCR, indexé par le contenu de l'image pré-traitée et le prompt.
+
+Une même photo (renvoyée après une remise à zéro, scannée par deux
+utilisateurs) donne les mêmes octets après pré-traitement : la réponse du
+modèle est relue sur disque au lieu d'un nouvel appel. Un fichier JSON par
+entrée ; au-delà de `octets_max`, les entrées lues le moins récemment (mtime)
+sont supprimées. Seules les réponses dont le JSON a pu être lu sont gardées.
+"""
+import hashlib
+import json
+import os
+import threading
+
+OCTETS_MAX_DEFAUT = 50 * 1024 * 1024
+VERSION = 1  # à changer si le format des entrées change
+
+
+def cle_ocr(data, prompt):
+    h = hashlib.sha256(f"{VERSION}\0{prompt}\0".encode("utf-8"))
+    h.update(data)
+    return h.hexdigest()
+
+
+class CacheOCR:
+    def __init__(self, dossier=None, octets_max=OCTETS_MAX_DEFAUT):
+        self.dossier = dossier  # None : cache désactivé
+        self.octets_max = octets_max
+        self._octets = None     # total sur disque, compté au premier ajout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configurer(self, dossier, octets_max=OCTETS_MAX_DEFAUT):
+        with self._lock:
+            if dossier != self.dossier:
+                self._octets = None
+            self.dossier = dossier or None
+            self.octets_max = octets_max
+
+    @property
+    def actif(self):
+        return self.dossier is not None
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, f"{cle}.json")
+
+    def get(self, cle):
+        if not self.actif: return None
+        chemin = self._chemin(cle)
+        try:
+            with open(chemin, encoding="utf-8") as f:
+                entree = json.load(f)
+            os.utime(chemin)  # LRU : la date de modification sert de date de dernier accès
+        except (OSError, ValueError):
+            with self._lock: self.misses += 1
+            return None
+        with self._lock: self.hits += 1
+        return entree
+
+    def put(self, cle, entree):
+        if not self.actif: return
+        data = json.dumps(entree, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            try:
+                os.makedirs(self.dossier, exist_ok=True)
+                if self._octets is None:
+                    self._octets = sum(e.stat().st_size for e in os.scandir(self.dossier) if e.name.endswith(".json"))
+                chemin = self._chemin(cle)
+                ancien = os.path.getsize(chemin) if os.path.exists(chemin) else 0
+                # Écriture atomique : une lecture concurrente ne voit jamais un fichier tronqué
+                tmp = f"{chemin}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, chemin)
+            except OSError:
+                return  # disque plein, dossier en lecture seule : la réponse n'est simplement pas gardée
+            self._octets += len(data) - ancien
+            if self._octets > self.octets_max:
+                self._evincer(chemin)
+
+    def _evincer(self, garder):
+        entrees = sorted((e for e in os.scandir(self.dossier) if e.name.endswith(".json")), key=lambda e: e.stat().st_mtime_ns)
+        for e in entrees:
+            if self._octets <= self.octets_max: break
+            if e.path == garder: continue
+            try:
+                taille = e.stat().st_size
+                os.remove(e.path)
+            except OSError:
+                continue
+            self._octets -= taille
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "actif": self.actif,
+                "octets": self._octets or 0,
+                "octets_max": self.octets_max,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "taux_hit": (self.hits / total * 100) if total else 0.0,
+            }
+
+
+CACHE_OCR = CacheOCR()
@@ -0,0 +1,151 @@
+"""Publication de plusieurs fichiers en un seul commit (API Git Data).
+
+Un lot (scan + classeur, ou scan + journal) devient : un blob par fichier
+binaire, un arbre basé sur celui du commit de tête, un commit et une seule mise
+à jour de la branche. La mise à jour de la référence n'est pas forcée : si la
+branche a avancé entre-temps, rien n'est publié (tout ou rien).
+
+DepotGithub parle à GitHub via PyGithub ; DepotGitLocal fait la même chose sur
+un dépôt git nu local avec les commandes de plomberie git, ce qui permet
+d'essayer les lots sans réseau :
+
+    git init --bare /tmp/depot.git
+    publier_lot(DepotGitLocal("/tmp/depot.git"), "Bon béton", {path: (data, None)})
+"""
+import base64
+import os
+import subprocess
+import tempfile
+
+from itb77.stockage import ConflitStockage, SANS_VERIFICATION
+
+MODE_FICHIER = "100644"
+AUTEUR_DEFAUT = {"GIT_AUTHOR_NAME": "ITB77", "GIT_AUTHOR_EMAIL": "itb77@localhost",
+                 "GIT_COMMITTER_NAME": "ITB77", "GIT_COMMITTER_EMAIL": "itb77@localhost"}
+
+
+def _texte(data):
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class DepotGithub:
+    def __init__(self, repo, branche=None):
+        self.repo = repo
+        self.branche = branche or repo.default_branch
+        self._ref = None
+
+    def tete(self):
+        self._ref = self.repo.get_git_ref(f"heads/{self.branche}")
+        return self._ref.object.sha
+
+    def sha_fichiers(self, commit, paths):
+        """{path: sha du blob dans `commit`, ou None} ; un listing par dossier parent."""
+        shas = dict.fromkeys(paths)
+        for parent in {p.rsplit("/", 1)[0] for p in paths}:
+            try:
+                contents = self.repo.get_contents(parent, ref=commit)
+            except Exception:
+                continue
+            for c in contents if isinstance(contents, list) else [contents]:
+                if c.path in shas: shas[c.path] = c.sha
+        return shas
+
+    def commit(self, parent, message, operations):
+        from github import GithubException, InputGitTreeElement
+        elements = []
+        for path, (data, _) in operations.items():
+            if data is None:
+                elements.append(InputGitTreeElement(path, MODE_FICHIER, "blob", sha=None))
+                continue
+            texte = _texte(data)
+            if texte is not None:
+                # Texte (journal) : contenu passé dans l'arbre, sans appel blob séparé
+                elements.append(InputGitTreeElement(path, MODE_FICHIER, "blob", content=texte))
+            else:
+                blob = self.repo.create_git_blob(base64.b64encode(data).decode("ascii"), "base64")
+                elements.append(InputGitTreeElement(path, MODE_FICHIER, "blob", sha=blob.sha))
+        base = self.repo.get_git_commit(parent)
+        arbre = self.repo.create_git_tree(elements, base.tree)
+        nouveau = self.repo.create_git_commit(message, arbre, [base])
+        try:
+            self._ref.edit(nouveau.sha)
+        except GithubException as e:
+            if e.status in (409, 422): raise ConflitStockage(f"{self.branche} a avancé : {e}") from e
+            raise
+        return nouveau.sha
+
+
+class DepotGitLocal:
+    """Même interface que DepotGithub sur un dépôt git (nu ou non) local."""
+
+    def __init__(self, chemin, branche="main"):
+        self.chemin = chemin
+        self.branche = branche
+
+    def _git(self, *args, entree=None, env=None):
+        res = subprocess.run(
+            ["git", "--git-dir", self.chemin, *args], input=entree, capture_output=True,
+            env={**AUTEUR_DEFAUT, **os.environ, **(env or {})},
+        )
+        if res.returncode != 0:
+            raise RuntimeError(f"git {' '.join(args)} : {res.stderr.decode().strip()}")
+        return res.stdout.decode().strip()
+
+    def tete(self):
+        try:
+            return self._git("rev-parse", "--verify", "-q", f"refs/heads/{self.branche}")
+        except RuntimeError:
+            return None  # dépôt vide
+
+    def sha_fichiers(self, commit, paths):
+        shas = dict.fromkeys(paths)
+        if commit and paths:
+            for ligne in self._git("ls-tree", "-r", commit, "--", *paths).splitlines():
+                meta, path = ligne.split("\t", 1)
+                shas[path] = meta.split()[2]
+        return shas
+
+    def lire(self, commit, path):
+        res = subprocess.run(["git", "--git-dir", self.chemin, "cat-file", "blob", f"{commit}:{path}"], capture_output=True, check=True)
+        return res.stdout
+
+    def commit(self, parent, message, operations):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GIT_INDEX_FILE": os.path.join(tmp, "index")}
+            if parent: self._git("read-tree", parent, env=env)
+            for path, (data, _) in operations.items():
+                if data is None:
+                    self._git("update-index", "--force-remove", "--", path, env=env)
+                else:
+                    sha = self._git("hash-object", "-w", "--stdin", entree=data)
+                    self._git("update-index", "--add", "--cacheinfo", f"{MODE_FICHIER},{sha},{path}", env=env)
+            arbre = self._git("write-tree", env=env)
+        nouveau = self._git("commit-tree", arbre, *(["-p", parent] if parent else []), "-m", message)
+        try:
+            # Compare-and-swap : échoue si la branche n'est plus sur `parent`
+            self._git("update-ref", f"refs/heads/{self.branche}", nouveau, parent or "0" * 40)
+        except RuntimeError as e:
+            raise ConflitStockage(str(e)) from e
+        return nouveau
+
+
+def publier_lot(depot, message, operations, verifier=True):
+    """Publie {path: (bytes ou None pour supprimer, sha attendu)} en un commit.
+
+    Avec `verifier`, chaque sha attendu (None = le fichier ne doit pas exister,
+    SANS_VERIFICATION = écraser) est comparé au commit de tête avant d'écrire
+    quoi que ce soit.
+    Retourne le sha du commit ; lève ConflitStockage sans rien publier sinon.
+    """
+    parent = depot.tete()
+    if verifier:
+        a_verifier = [p for p, (_, attendu) in operations.items() if attendu != SANS_VERIFICATION]
+        actuels = depot.sha_fichiers(parent, a_verifier)
+        perimes = [p for p in a_verifier if actuels.get(p) != operations[p][1]]
+        if perimes:
+            raise ConflitStockage(f"Fichier(s) modifié(s) entre-temps : {', '.join(perimes)}")
+    return depot.commit(parent, message, operations)
+
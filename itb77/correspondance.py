@@ -0,0 +1,85 @@
+"""Rapprochement des désignations lues sur les bons avec celles du budget.
+
+Un terme est « connu » s'il est égal à une désignation du budget, au "s" final
+près (règle historique). Pour les autres, un index de trigrammes de caractères
+propose les désignations les plus proches (similarité de Jaccard sur les
+trigrammes, façon pg_trgm) : "Longrinne" -> "Longrine", "Poutres BA" ->
+"Poutre BA". L'index est construit une fois par version du budget.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from itb77.nettoyage import remove_accents
+
+SEUIL_DEFAUT = 0.3
+NB_SUGGESTIONS = 3
+
+
+def _norme(texte):
+    return remove_accents(str(texte).strip().lower())
+
+
+def _singulier(texte):
+    return texte[:-1] if texte.endswith('s') else texte
+
+
+def trigrammes(texte):
+    """Trigrammes de chaque mot (complété par des espaces), mots ramenés au singulier."""
+    mots = [_singulier(m) if len(m) > 3 else m for m in re.findall(r"[a-z0-9]+", _norme(texte))]
+    return {f"  {m} "[i:i + 3] for m in mots for i in range(len(m) + 2)}
+
+
+class IndexTrigrammes:
+    def __init__(self, designations):
+        self.designations = []
+        vues = set()
+        for d in designations:
+            if _norme(d) not in vues:
+                vues.add(_norme(d))
+                self.designations.append(d)
+        self.connus = {_singulier(_norme(d)) for d in self.designations}
+        listes = {}
+        self.tailles = np.zeros(len(self.designations), dtype=np.int64)
+        for j, d in enumerate(self.designations):
+            tri = trigrammes(d)
+            self.tailles[j] = len(tri)
+            for t in tri:
+                listes.setdefault(t, []).append(j)
+        self.postings = {t: np.array(js, dtype=np.int64) for t, js in listes.items()}
+
+    def est_connu(self, texte):
+        return _singulier(_norme(texte)) in self.connus
+
+    def scores(self, texte):
+        """Similarité de `texte` avec chaque désignation du budget (tableau aligné sur self.designations)."""
+        tri = trigrammes(texte)
+        listes = [self.postings[t] for t in tri if t in self.postings]
+        if not listes or not len(self.designations):
+            return np.zeros(len(self.designations))
+        communs = np.bincount(np.concatenate(listes), minlength=len(self.designations))
+        return communs / (len(tri) + self.tailles - communs)
+
+    def suggerer(self, textes, n=NB_SUGGESTIONS, seuil=SEUIL_DEFAUT):
+        """{texte: [(désignation, score), ...]} par score décroissant, chaque texte distinct calculé une fois."""
+        resultat = {}
+        for texte in dict.fromkeys(textes):
+            s = self.scores(texte)
+            meilleurs = np.argpartition(-s, n)[:n] if len(s) > n else np.arange(len(s))
+            meilleurs = meilleurs[np.argsort(-s[meilleurs], kind="stable")]
+            resultat[texte] = [(self.designations[j], float(s[j])) for j in meilleurs if s[j] >= seuil]
+        return resultat
+
+
+@lru_cache(maxsize=16)
+def _index(designations):
+    return IndexTrigrammes(designations)
+
+
+def index_budget(df_budget):
+    """Index du budget, mis en cache par contenu de la colonne Designation."""
+    if "Designation" not in df_budget.columns:
+        return _index(())
+    # Une désignation vide du budget rendrait « connue » une désignation vide lue sur un bon
+    return _index(tuple(str(d) for d in df_budget["Designation"].dropna().unique() if str(d).strip()))
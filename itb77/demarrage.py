@@ -0,0 +1,108 @@
+"""Démarrage de l'application : dépendances lourdes chargées au premier usage, rapport des imports.
+
+Le script Streamlit est réexécuté à chaque rerun et n'a besoin, pour la page
+d'accueil, que du stockage et de pandas. Gemini, FPDF, PIL / HEIC et PyGithub
+sont importés par `charger` au premier appel qui s'en sert ; la durée de ce
+premier import est enregistrée dans les mesures (import.<module>), comme
+celle des imports du script au premier run du processus (demarrage.imports).
+
+Rapport d'import à froid des modules du script, dans un processus neuf :
+
+    python -m itb77.demarrage
+    python -m itb77.demarrage --max-ms 1500   # code de sortie 1 au-delà, ou si un module lourd est chargé d'emblée
+"""
+import argparse
+import ast
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+from itb77.mesures import enregistrer, mesurer
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+# Ne doivent pas être importés au démarrage : chargés par `charger` quand une page s'en sert
+MODULES_LOURDS = ("google.generativeai", "fpdf", "pillow_heif", "PIL", "github", "xlsxwriter", "openpyxl", "requests")
+TOP_DEFAUT = 15
+
+DUREE_IMPORTS = None  # s, imports du script au premier run du processus
+
+
+def charger(nom):
+    """Module `nom`, importé au premier appel ; la durée de cet import est mesurée.
+
+    Toujours via import_module : son verrou par module fait attendre les autres
+    threads jusqu'à la fin de l'import (sys.modules contient le module dès le début).
+    """
+    if nom in sys.modules:
+        return importlib.import_module(nom)
+    with mesurer(f"import.{nom}"):
+        return importlib.import_module(nom)
+
+
+def noter_imports(duree):
+    """Durée des imports du script ; seule celle du premier run (à froid) est gardée."""
+    global DUREE_IMPORTS
+    if DUREE_IMPORTS is None:
+        DUREE_IMPORTS = duree
+        enregistrer("demarrage.imports", duree)
+
+
+def modules_du_script(chemin=SCRIPT):
+    """Modules importés au niveau supérieur du script."""
+    with open(chemin, encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    modules = []
+    for noeud in arbre.body:
+        if isinstance(noeud, ast.Import):
+            modules += [a.name for a in noeud.names]
+        elif isinstance(noeud, ast.ImportFrom) and noeud.module and not noeud.level:
+            modules.append(noeud.module)
+    return list(dict.fromkeys(modules))
+
+
+def rapport_imports(modules, python=sys.executable):
+    """Importe `modules` dans un processus neuf (python -X importtime).
+
+    Retourne (durée totale en s, [(paquet, nb de modules, ms propres)] par
+    durée décroissante, modules de MODULES_LOURDS chargés).
+    """
+    code = "; ".join(["import sys"] + [f"import {m}" for m in modules]
+                     + [f"print(' '.join(m for m in {MODULES_LOURDS!r} if m in sys.modules))"])
+    debut = time.perf_counter()
+    res = subprocess.run([python, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                         cwd=os.path.dirname(SCRIPT), check=True)
+    total = time.perf_counter() - debut
+    paquets = {}
+    for ligne in res.stderr.splitlines():
+        if not ligne.startswith("import time:"): continue
+        propre, _, nom = ligne[len("import time:"):].split("|")
+        if not propre.strip().isdigit(): continue  # en-tête
+        racine = nom.strip().split(".")[0]
+        n, us = paquets.get(racine, (0, 0))
+        paquets[racine] = (n + 1, us + int(propre))
+    classement = sorted(((p, n, us / 1000) for p, (n, us) in paquets.items()), key=lambda p: -p[2])
+    return total, classement, res.stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durée d'import à froid des modules de l'application")
+    parser.add_argument("--modules", nargs="+", help="modules à importer (défaut : ceux de main.py, hors streamlit)")
+    parser.add_argument("--avec-streamlit", action="store_true", help="compter aussi l'import de streamlit")
+    parser.add_argument("--top", type=int, default=TOP_DEFAUT)
+    parser.add_argument("--max-ms", type=float, help="durée totale au-delà de laquelle le code de sortie est 1")
+    args = parser.parse_args(argv)
+
+    modules = args.modules or [m for m in modules_du_script() if args.avec_streamlit or m.split(".")[0] != "streamlit"]
+    total, classement, lourds = rapport_imports(modules)
+    for paquet, n, ms in classement[:args.top]:
+        print(f"{ms:9.1f} ms  {paquet} ({n} module(s))")
+    print(f"{len(modules)} module(s) importé(s) en {total * 1000:.0f} ms (processus compris)")
+    if lourds:
+        print(f"Chargés dès l'import : {', '.join(lourds)}")
+    return 1 if lourds or (args.max_ms is not None and total * 1000 > args.max_ms) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
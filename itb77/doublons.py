@@ -0,0 +1,108 @@
+"""Bons en double : empreinte perceptuelle des scans archivés (SCANS_BETON / SCANS_ACIER).
+
+Avant l'enregistrement, chaque photo envoyée est comparée aux scans déjà
+archivés du chantier et aux autres photos du même envoi : une faible distance
+de Hamming entre empreintes (dHash) signale la même photo, même ré-encodée ou
+réduite, sans appel au modèle. Les empreintes sont gardées dans
+`<chantier>/_scans.json` ({chemin relatif: [sha du blob, empreinte hex]}) et
+complétées dans le commit de chaque enregistrement ; un scan absent de
+l'index ou dont le sha a changé est téléchargé et haché une fois par
+processus.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from itb77.images import empreinte_perceptuelle
+from itb77.mesures import propager
+from itb77.stockage import SANS_VERIFICATION
+
+NOM_INDEX = "_scans.json"
+DOSSIERS_SCANS = ("SCANS_BETON", "SCANS_ACIER")
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.heic', '.webp')
+SEUIL_DEFAUT = 6          # bits différents (sur 64) en dessous desquels deux photos sont « la même »
+WORKERS_DEFAUT = 8
+
+_par_sha = {}             # sha du blob -> empreinte ; un sha désigne toujours le même contenu
+_lock = threading.Lock()
+
+
+def chemin_index(dossier_chantier):
+    return f"{dossier_chantier}/{NOM_INDEX}"
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def lire_index(stockage, dossier_chantier):
+    try:
+        return json.loads(stockage.lire(chemin_index(dossier_chantier)).decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def _hacher(stockage, path, sha):
+    with _lock:
+        if sha in _par_sha: return _par_sha[sha]
+    try:
+        empreinte = f"{empreinte_perceptuelle(path, stockage.lire_blob(path, sha)):016x}"
+    except Exception:
+        empreinte = None  # image illisible : indexée sans empreinte, pour ne pas la retélécharger
+    with _lock:
+        _par_sha[sha] = empreinte
+    return empreinte
+
+
+def actualiser_index(stockage, dossier_chantier, workers=WORKERS_DEFAUT):
+    """Retourne (index à jour des scans archivés, True s'il diffère de l'index publié)."""
+    publie = lire_index(stockage, dossier_chantier)
+    scans = []
+    for sous in DOSSIERS_SCANS:
+        try:
+            scans += [e for e in stockage.lister(f"{dossier_chantier}/{sous}")
+                      if e.type == "file" and e.name.lower().endswith(EXTENSIONS)]
+        except Exception:
+            pass  # dossier pas encore créé
+    index, a_hacher = {}, []
+    for e in scans:
+        rel = e.path[len(dossier_chantier) + 1:]
+        connu = publie.get(rel)
+        if connu is not None and connu[0] == e.sha:
+            index[rel] = connu
+        else:
+            a_hacher.append((rel, e))
+    if a_hacher:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(a_hacher))), thread_name_prefix="doublons") as pool:
+            hacher = propager(lambda e: _hacher(stockage, e.path, e.sha))
+            for (rel, e), empreinte in zip(a_hacher, pool.map(hacher, [e for _, e in a_hacher])):
+                index[rel] = [e.sha, empreinte]
+    return index, index != publie
+
+
+def comparer(index, empreintes, seuil=SEUIL_DEFAUT):
+    """[(nom, semblable, distance)] pour chaque photo `empreintes` = [(nom, int)] proche d'un scan
+    de l'index (semblable = chemin relatif) ou d'une photo précédente du même envoi (semblable = nom)."""
+    archives = [(rel, int(e, 16)) for rel, (_, e) in index.items() if e is not None]
+    resultats, vus = [], []
+    for nom, empreinte in empreintes:
+        if empreinte is None: continue
+        proches = [(autre, distance(empreinte, e)) for autre, e in archives + vus]
+        proches = sorted((p for p in proches if p[1] <= seuil), key=lambda p: p[1])
+        resultats += [(nom, autre, d) for autre, d in proches]
+        vus.append((nom, empreinte))
+    return resultats
+
+
+def indexer(lot, dossier_chantier, index, empreintes):
+    """Ajoute au `lot` l'index complété des scans qu'il publie : `empreintes` = {chemin complet: int}."""
+    shas = lot.shas()
+    index = dict(index)
+    for path, empreinte in empreintes.items():
+        if path in shas and empreinte is not None:
+            index[path[len(dossier_chantier) + 1:]] = [shas[path], f"{empreinte:016x}"]
+            with _lock:
+                _par_sha[shas[path]] = f"{empreinte:016x}"
+    # Dernier écrit gagne : une entrée perdue est simplement recalculée au prochain envoi
+    data = json.dumps(index, ensure_ascii=False, sort_keys=True, indent=1).encode("utf-8")
+    lot.ecrire(chemin_index(dossier_chantier), data, SANS_VERIFICATION)
@@ -0,0 +1,231 @@
+"""Exports du récapitulatif (PDF FPDF, Excel xlsxwriter), générés à la demande.
+
+Les fichiers sont mémorisés par empreinte du contenu des DataFrames : tant que
+les données ne changent pas, un nouveau clic ne régénère rien. Les gros exports
+sont construits par un worker en arrière-plan pour ne pas bloquer la page.
+"""
+import functools
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from itb77.demarrage import charger
+from itb77.mesures import chronometre
+from itb77.nettoyage import remove_accents
+from itb77.schema import pour_ecriture
+
+TAILLE_MEMO = 32
+SEUIL_ARRIERE_PLAN = 5000  # nombre total de lignes au-delà duquel on génère en tâche de fond
+
+def largeurs_colonnes(df):
+    """Largeur d'affichage de chaque colonne (contenu le plus long ou en-tête, + 2).
+
+    Seules les valeurs distinctes sont converties en texte (désignations,
+    fournisseurs et types se répètent sur des milliers de bons).
+    """
+    largeurs = []
+    for i, col in enumerate(df.columns):
+        longueur = df.iloc[:, i].drop_duplicates().astype(str).str.len().max()
+        if pd.isna(longueur): longueur = 0  # colonne vide ou sans valeur
+        largeurs.append(int(max(longueur, len(str(col)))) + 2)
+    return largeurs
+
+@chronometre("export.excel", octets=lambda data, *args: len(data))
+def generer_excel_stylise(dfs_dict):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        workbook = writer.book
+        for sheet_name, df in dfs_dict.items():
+            if df.empty: continue
+            df = pour_ecriture(df)
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            worksheet = writer.sheets[sheet_name]
+            (max_row, max_col) = df.shape
+            column_settings = [{'header': column} for column in df.columns]
+            worksheet.add_table(0, 0, max_row, max_col - 1, {'columns': column_settings, 'style': 'TableStyleMedium2', 'name': f"Table_{remove_accents(sheet_name).replace(' ', '_')}"})
+            for i, max_len in enumerate(largeurs_colonnes(df)):
+                worksheet.set_column(i, i, max_len)
+    return output.getvalue()
+
+def donnees_excel(recaps, df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier):
+    """Feuilles de l'export Excel d'un chantier, dans l'ordre du classeur."""
+    return {
+        "Récapitulatif": recaps.beton,
+        "Récap Acier": recaps.acier,
+        "Béton": df_beton,
+        "Acier": df_acier,
+        "Prévisionnel": df_prev,
+        "Étude Béton": df_etude_beton,
+        "Étude Acier": df_etude_acier,
+    }
+
+@functools.cache
+def classe_pdf():
+    # FPDF n'est importé qu'au premier export PDF
+    class PDF(charger("fpdf").FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 15)
+            self.cell(0, 10, 'RECAPITULATIF CHANTIER', 0, 1, 'C')
+            self.ln(5)
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+    return PDF
+
+@chronometre("export.pdf", octets=lambda data, *args: len(data))
+def generer_pdf_recap(df_target, nom_chantier, df_acier=None):
+    pdf = classe_pdf()()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 10, f"Chantier : {nom_chantier}", 0, 1, 'L')
+    pdf.cell(0, 10, f"Date : {datetime.now().strftime('%d/%m/%Y')}", 0, 1, 'L')
+    pdf.ln(5)
+    for zone in ["INFRA", "SUPER"]:
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_fill_color(230, 126, 34)
+        pdf.cell(0, 10, f"{zone}STRUCTURE", 0, 1, 'L', fill=False)
+        pdf.ln(2)
+        df_zone = df_target[df_target["Zone"] == zone]
+        df_active = df_zone[(df_zone["Prevu (m3)"] > 0) | (df_zone["Volume Reel"] > 0) | (df_zone.get("Etude (m3)", 0) > 0)]
+        if df_active.empty:
+            pdf.set_font("Arial", 'I', 10)
+            pdf.cell(0, 10, "Aucune donnée.", 0, 1)
+        else:
+            pdf.set_font("Arial", 'B', 10)
+            pdf.cell(50, 8, "Désignation", 1)
+            pdf.cell(30, 8, "Budget", 1, 0, 'C')
+            pdf.cell(30, 8, "Conso", 1, 0, 'C')
+            pdf.cell(30, 8, "Etude", 1, 0, 'C')
+            pdf.cell(30, 8, "Reste", 1, 0, 'C')
+            pdf.cell(20, 8, "%", 1, 1, 'C')
+            pdf.set_font("Arial", size=10)
+            for _, row in df_active.iterrows():
+                nom = str(row['Designation']).encode('latin-1', 'replace').decode('latin-1')
+                prev = row['Prevu (m3)']
+                reel = row['Volume Reel']
+                etude = row.get('Etude (m3)', 0.0)
+                delta = prev - reel 
+                pct = (reel / prev * 100) if prev > 0 else 0.0
+                pdf.cell(50, 8, nom, 1)
+                pdf.cell(30, 8, f"{prev:.1f}", 1, 0, 'C')
+                pdf.cell(30, 8, f"{reel:.1f}", 1, 0, 'C')
+                pdf.cell(30, 8, f"{etude:.1f}", 1, 0, 'C')
+                if delta < 0:
+                    pdf.set_text_color(255, 0, 0)
+                else:
+                    pdf.set_text_color(0, 0, 0)
+                pdf.cell(30, 8, f"{delta:.1f}", 1, 0, 'C')
+                pdf.cell(20, 8, f"{pct:.0f}%", 1, 1, 'C')
+                pdf.set_text_color(0, 0, 0)
+        pdf.ln(5)
+    if df_acier is not None and not df_acier.empty:
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "ACIER", 0, 1, 'L')
+        pdf.ln(2)
+        df_active = df_acier[(df_acier["Etude (kg)"] > 0) | (df_acier["Poids Reel (kg)"] > 0)]
+        if df_active.empty:
+            pdf.set_font("Arial", 'I', 10)
+            pdf.cell(0, 10, "Aucune donnée.", 0, 1)
+        else:
+            pdf.set_font("Arial", 'B', 10)
+            pdf.cell(50, 8, "Désignation", 1)
+            pdf.cell(20, 8, "Zone", 1, 0, 'C')
+            pdf.cell(30, 8, "Etude (kg)", 1, 0, 'C')
+            pdf.cell(30, 8, "Livré (kg)", 1, 0, 'C')
+            pdf.cell(30, 8, "Reste (kg)", 1, 0, 'C')
+            pdf.cell(20, 8, "%", 1, 1, 'C')
+            pdf.set_font("Arial", size=10)
+            for _, row in df_active.iterrows():
+                nom = str(row['Designation']).encode('latin-1', 'replace').decode('latin-1')
+                pdf.cell(50, 8, nom, 1)
+                pdf.cell(20, 8, str(row['Zone']), 1, 0, 'C')
+                pdf.cell(30, 8, f"{row['Etude (kg)']:.0f}", 1, 0, 'C')
+                pdf.cell(30, 8, f"{row['Poids Reel (kg)']:.0f}", 1, 0, 'C')
+                pdf.set_text_color(*((255, 0, 0) if row['Reste (kg)'] < 0 else (0, 0, 0)))
+                pdf.cell(30, 8, f"{row['Reste (kg)']:.0f}", 1, 0, 'C')
+                pdf.cell(20, 8, f"{row['Avancement (%)']:.0f}%", 1, 1, 'C')
+                pdf.set_text_color(0, 0, 0)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+# --- MÉMOÏSATION ET GÉNÉRATION EN ARRIÈRE-PLAN ---
+_memo = OrderedDict()
+_en_cours = {}
+_lock = threading.Lock()
+_executeur = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+
+def empreinte(*objets):
+    """Hash du contenu (valeurs, index, colonnes, types) des DataFrames et des autres arguments."""
+    h = hashlib.sha1()
+    for obj in objets:
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                h.update(repr(k).encode())
+                h.update(empreinte(v).encode())
+        elif isinstance(obj, pd.DataFrame):
+            h.update(repr((list(obj.columns), [str(t) for t in obj.dtypes])).encode())
+            try:
+                h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+            except TypeError:
+                # Cellules non hachables (listes...) : on retombe sur la sérialisation
+                h.update(obj.to_json(orient="split", date_format="iso").encode())
+        else:
+            h.update(repr(obj).encode())
+    return h.hexdigest()
+
+def _memoriser(cle, data):
+    with _lock:
+        _memo[cle] = data
+        _memo.move_to_end(cle)
+        while len(_memo) > TAILLE_MEMO:
+            _memo.popitem(last=False)
+
+def etat(cle):
+    """("pret", bytes), ("en_cours", None), ("erreur", exception) ou ("absent", None)."""
+    with _lock:
+        if cle in _memo:
+            _memo.move_to_end(cle)
+            return "pret", _memo[cle]
+        fut = _en_cours.get(cle)
+    if fut is None:
+        return "absent", None
+    if not fut.done():
+        return "en_cours", None
+    with _lock:
+        _en_cours.pop(cle, None)
+    exc = fut.exception()
+    if exc is not None:
+        return "erreur", exc
+    _memoriser(cle, fut.result())
+    return "pret", fut.result()
+
+def generer(cle, fn, *args):
+    """Génère tout de suite (ou relit la mémoire) et retourne les octets."""
+    statut, data = etat(cle)
+    if statut == "pret":
+        return data
+    data = fn(*args)
+    _memoriser(cle, data)
+    return data
+
+def _copier(obj):
+    if isinstance(obj, pd.DataFrame): return obj.copy()
+    if isinstance(obj, dict): return {k: _copier(v) for k, v in obj.items()}
+    return obj
+
+def lancer(cle, fn, *args):
+    """Soumet la génération au worker ; un seul calcul par clé à la fois."""
+    with _lock:
+        if cle in _memo or cle in _en_cours:
+            return
+        # La page continue de modifier ses DataFrames pendant la génération
+        _en_cours[cle] = _executeur.submit(fn, *[_copier(a) for a in args])
+
+def est_lourd(*dfs):
+    return sum(len(df) for df in dfs) > SEUIL_ARRIERE_PLAN
@@ -0,0 +1,128 @@
+"""Enregistrements concurrents : la modification locale est rejouée sur le classeur le plus récent.
+
+Un `Delta` retient ce que l'utilisateur a fait depuis le chargement de la
+page — lignes ajoutées (bons Béton / Acier), cellules modifiées, lignes
+ajoutées ou supprimées d'un tableau édité (Prévisionnel, Étude) — et non
+le classeur entier. Si la publication échoue parce que le classeur a changé
+entre-temps, `publier_avec_reprise` le relit, y réapplique le delta et
+republie, un nombre borné de fois.
+
+Les lignes d'un tableau édité sont identifiées par leurs colonnes clés
+(Désignation, Zone) et leur rang parmi les lignes de même clé.
+"""
+import random
+import time
+
+import pandas as pd
+
+from itb77.stockage import ConflitStockage
+
+CLES_DEFAUT = ("Designation", "Zone")
+ESSAIS_DEFAUT = 4         # publication initiale + 3 reprises
+ATTENTE_DEFAUT = 0.3      # s, multipliée par le rang de la reprise (avec gigue)
+
+
+def _cles(df, cles):
+    k = pd.DataFrame({c: df[c].astype(str) if c in df.columns else "" for c in cles}, index=df.index)
+    rang = k.groupby(list(cles), sort=False).cumcount()
+    return list(zip(*[k[c] for c in cles], rang))
+
+
+def _egal(a, b):
+    if pd.isna(a) or pd.isna(b):
+        return pd.isna(a) and pd.isna(b)
+    return a == b
+
+
+def _renseignee(v):
+    return not (pd.isna(v) or v == 0 or v == "")
+
+
+class Delta:
+    def __init__(self):
+        self.ajouts = {}   # feuille -> (DataFrame, colonnes si la feuille est vide)
+        self.editions = {}  # feuille -> (cles, [(clé, ligne, colonnes modifiées ou None si nouvelle)], {clés supprimées})
+
+    def __bool__(self):
+        return bool(self.ajouts or self.editions)
+
+    def ajouter(self, feuille, lignes, colonnes=None):
+        """Lignes ajoutées en fin de feuille (bons)."""
+        if feuille in self.ajouts:
+            lignes = pd.concat([self.ajouts[feuille][0], lignes], ignore_index=True)
+        self.ajouts[feuille] = (lignes, colonnes)
+        return self
+
+    def modifier(self, feuille, avant, apres, cles=CLES_DEFAUT):
+        """Différence ligne à ligne entre le tableau chargé (`avant`) et le tableau édité (`apres`)."""
+        cles = tuple(cles)
+        cles_avant, cles_apres = _cles(avant, cles), _cles(apres, cles)
+        lignes_avant = dict(zip(cles_avant, avant.to_dict("records")))
+        changements = []
+        for k, ligne in zip(cles_apres, apres.to_dict("records")):
+            ancienne = lignes_avant.get(k)
+            if ancienne is None:
+                changements.append((k, ligne, None))
+                continue
+            modifiees = [c for c, v in ligne.items() if c not in cles and not _egal(v, ancienne.get(c))]
+            if modifiees:
+                changements.append((k, ligne, modifiees))
+        supprimees = set(cles_avant) - set(cles_apres)
+        if changements or supprimees:
+            self.editions[feuille] = (cles, changements, supprimees)
+        return self
+
+    def appliquer(self, sheets):
+        """Nouveau dict de feuilles : `sheets` (non modifié) plus le delta.
+
+        Une cellule modifiée écrase la valeur actuelle ; une ligne ajoutée dont
+        la clé existe déjà (ajoutée ailleurs entre-temps) n'y reporte que ses
+        valeurs renseignées ; une ligne modifiée supprimée ailleurs est recréée.
+        """
+        sheets = dict(sheets)
+        for feuille, (cles, changements, supprimees) in self.editions.items():
+            df = sheets.get(feuille)
+            df = pd.DataFrame(columns=list(cles)) if df is None else df
+            colonnes = list(df.columns)
+            lignes = df.to_dict("records")
+            position = {k: i for i, k in enumerate(_cles(df, cles))}
+            for k, ligne, modifiees in changements:
+                i = position.get(k)
+                if i is None:
+                    lignes.append(dict(ligne))
+                    position[k] = len(lignes) - 1
+                else:
+                    for c in (modifiees if modifiees is not None else [c for c, v in ligne.items() if _renseignee(v)]):
+                        lignes[i][c] = ligne[c]
+                colonnes += [c for c in ligne if c not in colonnes]
+            retirees = {position[k] for k in supprimees if k in position}
+            sheets[feuille] = pd.DataFrame([l for i, l in enumerate(lignes) if i not in retirees], columns=colonnes)
+        for feuille, (ajout, colonnes) in self.ajouts.items():
+            df = sheets.get(feuille)
+            if df is None or df.empty:
+                df = pd.DataFrame(columns=colonnes if colonnes is not None else ajout.columns)
+            sheets[feuille] = pd.concat([df, ajout], ignore_index=True)
+        return sheets
+
+
+def publier_avec_reprise(delta, base, publier, recharger, essais=ESSAIS_DEFAUT, attente=ATTENTE_DEFAUT):
+    """Applique `delta` à `base` = (sheets, etat) et appelle publier(sheets, etat).
+
+    Sur ConflitStockage : recharger() -> (sheets, etat) à jour, delta
+    réappliqué, nouvel essai ; au plus `essais` publications, puis l'erreur
+    remonte. Retourne (sheets publiées, nombre de reprises).
+    """
+    sheets, etat = base
+    for tentative in range(essais):
+        fusion = delta.appliquer(sheets)
+        try:
+            publier(fusion, etat)
+            return fusion, tentative
+        except ConflitStockage:
+            if tentative == essais - 1:
+                raise
+        # Gigue : deux sessions en conflit ne repartent pas au même instant
+        time.sleep(attente * (tentative + 1) * random.uniform(0.5, 1.5))
+        sheets, etat = recharger()
+        if sheets is None:
+            raise ConflitStockage("Classeur introuvable après rechargement")
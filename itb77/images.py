@@ -0,0 +1,127 @@
+"""Pré-traitement des photos de bons, partagé par l'OCR et l'archivage des scans.
+
+Une photo de téléphone (12 Mpx, HEIC...) est traitée une seule fois :
+orientation EXIF, réduction à une résolution suffisante pour l'OCR, niveaux de
+gris / contraste en option, puis ré-encodage compact (JPEG ou WebP). Les mêmes
+octets partent vers Gemini et vers SCANS_BETON / SCANS_ACIER.
+
+Mesures : python -m bench --scans <dossier> [--format WEBP] [--api-key CLE]
+"""
+import io
+import time
+
+from itb77.demarrage import charger
+
+COTE_MAX_OCR = 2000      # plus grand côté visé (px)
+COTE_MIN_OCR = 1000      # petit côté minimal : un ticket étroit n'est pas réduit en dessous
+QUALITE_DEFAUT = 80
+COTE_MINIATURE = 160
+FORMATS = {"JPEG": ("jpg", "image/jpeg"), "WEBP": ("webp", "image/webp")}
+MIME_PAR_EXT = {ext: mime for ext, mime in FORMATS.values()}
+
+
+def blob_image(data, ext):
+    # Envoyé tel quel à Gemini (sinon le SDK ré-encode une image PIL en WebP sans perte)
+    return {"mime_type": MIME_PAR_EXT[ext], "data": data}
+
+
+def _pil():
+    # PIL n'est importé qu'au premier traitement d'image
+    return charger("PIL.Image"), charger("PIL.ImageOps")
+
+
+def charger_image(nom_fichier, data):
+    """Ouvre une image (bytes ou fichier) ; les HEIC passent par pillow_heif."""
+    Image, _ = _pil()
+    source = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+    if nom_fichier.lower().endswith('.heic'):
+        heif_file = charger("pillow_heif").read_heif(source)
+        return Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw")
+    return Image.open(source)
+
+
+def facteur_reduction(largeur, hauteur, cote_max=COTE_MAX_OCR, cote_min=COTE_MIN_OCR):
+    """Échelle (<= 1) : plus grand côté ramené à cote_max, sauf si le petit côté passerait sous cote_min."""
+    grand, petit = max(largeur, hauteur), min(largeur, hauteur)
+    if grand <= cote_max:
+        return 1.0
+    return min(1.0, max(cote_max / grand, cote_min / petit))
+
+
+class ImagePretraitee:
+    def __init__(self, image, data, format, octets_origine, duree):
+        self.image = image
+        self.data = data
+        self.format = format
+        self.octets_origine = octets_origine
+        self.duree = duree
+
+    @property
+    def ext(self):
+        return FORMATS[self.format][0]
+
+    @property
+    def mime_type(self):
+        return FORMATS[self.format][1]
+
+    def blob(self):
+        return blob_image(self.data, self.ext)
+
+
+def pretraiter_image(nom_fichier, data, cote_max=COTE_MAX_OCR, niveaux_gris=False, contraste=False,
+                     format="JPEG", qualite=QUALITE_DEFAUT):
+    debut = time.perf_counter()
+    Image, ImageOps = _pil()
+    image = charger_image(nom_fichier, data)
+    image = ImageOps.exif_transpose(image)
+
+    echelle = facteur_reduction(*image.size, cote_max=cote_max)
+    if echelle < 1.0:
+        taille = (max(1, round(image.width * echelle)), max(1, round(image.height * echelle)))
+        image = image.resize(taille, Image.LANCZOS)
+
+    if niveaux_gris:
+        image = ImageOps.grayscale(image)
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if contraste:
+        image = ImageOps.autocontrast(image, cutoff=1)
+
+    sortie = io.BytesIO()
+    image.save(sortie, format=format, quality=qualite, optimize=format == "JPEG")
+    return ImagePretraitee(image, sortie.getvalue(), format, len(data), time.perf_counter() - debut)
+
+
+def miniature(nom_fichier, data, cote=COTE_MINIATURE, qualite=70):
+    """Vignette JPEG (plus grand côté `cote`) ; les JPEG sont décodés directement à basse résolution."""
+    _, ImageOps = _pil()
+    image = charger_image(nom_fichier, data)
+    if image.format == "JPEG":
+        image.draft("RGB", (cote, cote))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((cote, cote))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    sortie = io.BytesIO()
+    image.save(sortie, format="JPEG", quality=qualite)
+    return sortie.getvalue()
+
+
+def empreinte_perceptuelle(nom_fichier, data, cote=8):
+    """dHash (cote x cote bits, int) : signe du gradient horizontal d'une réduction en niveaux de gris.
+
+    Insensible au ré-encodage, à la réduction et à l'orientation EXIF : une même
+    photo archivée (pré-traitée ou non) et renvoyée donne une distance de Hamming ~0.
+    """
+    Image, ImageOps = _pil()
+    image = charger_image(nom_fichier, data)
+    if image.format == "JPEG":
+        image.draft("L", (cote * 8, cote * 8))
+    image = ImageOps.exif_transpose(image).convert("L").resize((cote + 1, cote), Image.LANCZOS)
+    px = image.tobytes()
+    bits = 0
+    for y in range(cote):
+        ligne = px[y * (cote + 1):(y + 1) * (cote + 1)]
+        for x in range(cote):
+            bits = bits << 1 | (ligne[x] > ligne[x + 1])
+    return bits
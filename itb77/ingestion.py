@@ -0,0 +1,266 @@
+"""Saisie de bons hors Streamlit : un dossier de scans -> un enregistrement du chantier.
+
+Même chaîne que les onglets Béton / Acier : repérage des doublons parmi les
+scans archivés (avant tout appel au modèle), pré-traitement et lecture sur un
+pool (analyser_lot, cache OCR compris), nettoyage de relecture (idem,
+correspondance au budget), puis un seul commit : scans, classeur (ou
+journal), récap matérialisé et index du portefeuille. Les lignes en doute,
+les bons en doublon probable et les bons illisibles partent dans un CSV de
+relecture au lieu d'être enregistrés.
+
+    GOOGLE_API_KEY=... python -m itb77.ingestion "Chantier A" scans/ --racine /copie/du/depot
+    GOOGLE_API_KEY=... GITHUB_TOKEN=... python -m itb77.ingestion "Chantier A" scans/ --depot owner/ITB --type acier --essai
+"""
+import argparse
+import functools
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from itb77 import doublons, mesures
+from itb77.cache_ocr import CACHE_OCR, OCTETS_MAX_DEFAUT as CACHE_OCR_OCTETS_DEFAUT
+from itb77.fusion import ESSAIS_DEFAUT, Delta, publier_avec_reprise
+from itb77.images import empreinte_perceptuelle, pretraiter_image
+from itb77.journal import ajouter_entree, fusionner, lire_journal
+from itb77.nettoyage import DECLENCHEURS_DITTO, preparer_relecture, remove_accents
+from itb77.ocr import LIMITEUR_OCR, OCR_WORKERS_DEFAUT, analyser_lot, schema_reponse
+from itb77.portefeuille import indexer, shas_journal, version_chantier
+from itb77.recap import ecrire_sidecar, feuilles_acier, feuilles_recap, recap_materialise
+from itb77.schema import BASE_DIR, COLS_ACIER, COLS_BETON, lire_classeur, serialiser_classeur, typer_feuille
+from itb77.stockage import ajouter_options_stockage, stockage_depuis_options
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic')
+
+# Paramètres de lecture et de nettoyage d'un genre de bon, partagés avec l'application
+Document = namedtuple("Document", "feuille prompt colonnes cols_texte col_num cols_ditto dossier_scans")
+DOCUMENTS = {
+    "Beton": Document("Beton", f"Donnees beton JSON. Colonnes: {COLS_BETON}", COLS_BETON,
+                      ["Fournisseur", "Designation", "Type de Beton"], "Volume (m3)", ["Designation", "Type de Beton"], "SCANS_BETON"),
+    "Acier": Document("Acier", f"Donnees acier JSON. Colonnes: {COLS_ACIER}", COLS_ACIER,
+                      ["Fournisseur", "Designation", "Type d Acier"], "Poids (kg)", ["Designation"], "SCANS_ACIER"),
+}
+
+# lignes : DataFrame nettoyé (avec Doute) ; image : ImagePretraitee ou None si illisible
+Bon = namedtuple("Bon", "nom data lignes debug image")
+
+
+def chemin_scan(base_dir, nom_chantier, dossier_scans, ext, lot=None, maintenant=None):
+    """Chemin horodaté d'un scan archivé ; suffixe -2, -3... si le lot a déjà un scan de la même seconde."""
+    maintenant = maintenant or datetime.now()
+    nom_clean = remove_accents(nom_chantier).replace(" ", "_")
+    racine = f"{base_dir}/{nom_chantier}/{dossier_scans}/{maintenant:%d-%m-%Y} -- {nom_clean} -- {maintenant:%H-%M-%S}"
+    path, n = f"{racine}.{ext}", 2
+    while lot is not None and path in lot:
+        path, n = f"{racine}-{n}.{ext}", n + 1
+    return path
+
+
+def materialiser(lot, stockage, base_dir, dossier, sheets, version):
+    # Récap matérialisé (sidecar) et entrée du portefeuille, publiés avec le lot
+    etat = recap_materialise(stockage, dossier)
+    recaps = etat.recaps(*feuilles_recap(sheets), *feuilles_acier(sheets), version=version)
+    ecrire_sidecar(lot, dossier, etat)
+    indexer(lot, stockage, base_dir, dossier.rsplit("/", 1)[-1], sheets, version, recaps.beton)
+
+
+def recharger_chantier(stockage, base_dir, nom, avec_journal=False):
+    """Classeur (+ journal) tel qu'il est publié : (sheets, (sha, fichiers de journal)), sheets None s'il n'existe pas."""
+    dossier = f"{base_dir}/{nom}"
+    path = f"{dossier}/{nom}.xlsx"
+    sha = stockage.sha(path)
+    if not sha:
+        return None, (None, [])
+    sheets = lire_classeur(stockage.lire_blob(path, sha))
+    fichiers = []
+    if avec_journal:
+        journal, fichiers = lire_journal(stockage, dossier)
+        sheets = fusionner(sheets, journal)
+    return sheets, (sha, fichiers)
+
+
+def lister_scans(dossier):
+    return sorted(f for f in os.listdir(dossier) if f.lower().endswith(EXTENSIONS) and os.path.isfile(os.path.join(dossier, f)))
+
+
+def _empreinte(nom, data):
+    try:
+        return empreinte_perceptuelle(nom, data)
+    except Exception:
+        return None
+
+
+def empreintes(fichiers, workers=OCR_WORKERS_DEFAUT):
+    """{nom: empreinte perceptuelle (None si l'image est illisible)} des fichiers [(nom, bytes)]."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="empreintes") as pool:
+        return dict(zip((n for n, _ in fichiers), pool.map(lambda f: _empreinte(*f), fichiers)))
+
+
+def reperer_doublons(index_scans, empreintes_bons, seuil=doublons.SEUIL_DEFAUT):
+    """{nom: motif} des bons qui ressemblent à un scan archivé ou à un bon précédent du lot."""
+    suspects = {}
+    for nom, semblable, d in doublons.comparer(index_scans, list(empreintes_bons.items()), seuil):
+        suspects.setdefault(nom, f"doublon probable de {semblable} ({d} bit(s) d'écart)")
+    return suspects
+
+
+def lire_bons(fichiers, document, df_budget, api_key, workers=OCR_WORKERS_DEFAUT, options_pretraitement=None,
+              signes_ditto=DECLENCHEURS_DITTO, suivi=None):
+    """Lit [(nom, bytes)] sur le pool OCR et nettoie chaque bon : [Bon] dans l'ordre des fichiers.
+
+    `suivi(faits, total)` est appelé à chaque bon lu.
+    """
+    pretraiter = functools.partial(pretraiter_image, **(options_pretraitement or {}))
+    bons = [None] * len(fichiers)
+    resultats = analyser_lot(fichiers, api_key, document.prompt, workers, pretraiter=pretraiter,
+                             schema=schema_reponse(document.colonnes))
+    for faits, (i, nom, res, debug, image) in enumerate(resultats, 1):
+        if not res.empty:
+            # Nettoyage bon par bon : un "u" ne reprend jamais la valeur du bon précédent
+            res, _ = preparer_relecture(res, document.colonnes, document.cols_texte, document.col_num,
+                                        document.cols_ditto, df_budget, signes_ditto)
+        bons[i] = Bon(nom, fichiers[i][1], res, debug, image)
+        if suivi: suivi(faits, len(fichiers))
+    return bons
+
+
+def trier(bons, document, suspects=None):
+    """(lignes à enregistrer, lignes à relire avec leur motif, bons dont au moins une ligne est enregistrée).
+
+    Les bons `suspects` ({nom: motif}, non lus) sont renvoyés à la relecture.
+    """
+    a_relire = [pd.DataFrame([{"Bon": nom, "Motif": motif} for nom, motif in (suspects or {}).items()])]
+    valides, retenus = [], []
+    for b in bons:
+        if b.lignes.empty:
+            a_relire.append(pd.DataFrame([{"Bon": b.nom, "Motif": f"illisible : {b.debug.splitlines()[0] if b.debug else ''}"}]))
+            continue
+        lignes = b.lignes.assign(Bon=b.nom)
+        doute = lignes["Doute"].astype(bool)
+        if doute.any():
+            a_relire.append(lignes[doute].assign(Motif="doute"))
+        if not doute.all():
+            valides.append(lignes[~doute])
+            retenus.append(b)
+    colonnes = ["Bon", "Motif"] + document.colonnes
+    a_relire = pd.concat([df for df in a_relire if not df.empty] or [pd.DataFrame(columns=colonnes)], ignore_index=True).reindex(columns=colonnes)
+    valides = pd.concat(valides, ignore_index=True)[document.colonnes] if valides else pd.DataFrame(columns=document.colonnes)
+    return valides, a_relire, retenus
+
+
+def enregistrer(stockage, base_dir, nom, document, lignes, bons, base, index_scans, empreintes_bons, avec_journal=False,
+                originaux=False, essais=ESSAIS_DEFAUT):
+    """Un commit : scans des `bons`, lignes ajoutées à la feuille (classeur ou journal), récap et index des scans.
+
+    `base` = (sheets, (sha, fichiers de journal)) ; un enregistrement concurrent est
+    fusionné comme dans l'application. Retourne (sheets publiées, reprises).
+    """
+    dossier = f"{base_dir}/{nom}"
+    path = f"{dossier}/{nom}.xlsx"
+
+    def publier(sheets_f, etat):
+        sha_f, fichiers_f = etat
+        with stockage.lot(f"Ajout {len(bons)} bon(s) {document.feuille.lower()} {nom} (saisie par lot)") as lot:
+            empreintes = {}
+            for b in bons:
+                data, ext = (b.data, b.nom.rsplit(".", 1)[-1].lower()) if originaux else (b.image.data, b.image.ext)
+                p = chemin_scan(base_dir, nom, document.dossier_scans, ext, lot)
+                lot.ecrire(p, data)
+                empreintes[p] = empreintes_bons.get(b.nom)
+            doublons.indexer(lot, dossier, index_scans, empreintes)
+            if avec_journal:
+                ajouter_entree(stockage, dossier, document.feuille, lignes, lot)
+                sha_classeur = sha_f
+            else:
+                sha_classeur = lot.ecrire(path, serialiser_classeur(sheets_f), sha_f)
+            materialiser(lot, stockage, base_dir, dossier, sheets_f, version_chantier(sha_classeur, shas_journal(dossier, fichiers_f, lot)))
+
+    delta = Delta().ajouter(document.feuille, lignes, document.colonnes)
+    return publier_avec_reprise(delta, base, publier, lambda: recharger_chantier(stockage, base_dir, nom, avec_journal), essais)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Saisie d'un dossier de bons scannés dans un chantier ITB77")
+    parser.add_argument("chantier")
+    parser.add_argument("dossier", help="dossier des scans (jpg, png, heic)")
+    ajouter_options_stockage(parser)
+    parser.add_argument("--type", choices=sorted(DOCUMENTS), default="Beton")
+    parser.add_argument("--base", default=BASE_DIR, help="dossier des chantiers")
+    parser.add_argument("--journal", action="store_true", help="ajouter au journal (STOCKAGE_MODE = journal)")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS_DEFAUT, help="appels OCR en parallèle")
+    parser.add_argument("--requetes-par-minute", type=float, default=LIMITEUR_OCR.par_minute)
+    parser.add_argument("--cache-ocr", default=".cache_ocr", help="dossier du cache OCR (vide : désactivé)")
+    parser.add_argument("--seuil-doublons", type=int, default=doublons.SEUIL_DEFAUT)
+    parser.add_argument("--signes-ditto", nargs="*", default=list(DECLENCHEURS_DITTO), help='ex. : u U \" id idem')
+    parser.add_argument("--originaux", action="store_true", help="archiver les fichiers d'origine plutôt que les images pré-traitées")
+    parser.add_argument("--revue", help="CSV des lignes à relire (défaut : <dossier>/revue_<chantier>.csv)")
+    parser.add_argument("--essai", action="store_true", help="tout lire, ne rien enregistrer")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        parser.error("GOOGLE_API_KEY absent de l'environnement")
+    stockage = stockage_depuis_options(args, parser)
+    LIMITEUR_OCR.par_minute = args.requetes_par_minute
+    CACHE_OCR.configurer(args.cache_ocr, CACHE_OCR_OCTETS_DEFAUT)
+    releve = mesures.Releve("ingestion")
+    mesures.activer(releve)
+    document = DOCUMENTS[args.type]
+
+    sheets, etat = recharger_chantier(stockage, args.base, args.chantier, args.journal)
+    if sheets is None:
+        print(f"Chantier introuvable : {args.base}/{args.chantier}/{args.chantier}.xlsx", file=sys.stderr)
+        return 2
+    noms = lister_scans(args.dossier)
+    fichiers = []
+    for n in noms:
+        with open(os.path.join(args.dossier, n), "rb") as f:
+            fichiers.append((n, f.read()))
+    if not fichiers:
+        print(f"Aucun scan dans {args.dossier}", file=sys.stderr)
+        return 2
+
+    debut = time.perf_counter()
+    dossier_chantier = f"{args.base}/{args.chantier}"
+    index_scans, _ = doublons.actualiser_index(stockage, dossier_chantier)
+    empreintes_bons = empreintes(fichiers, args.workers)
+    suspects = reperer_doublons(index_scans, empreintes_bons, args.seuil_doublons)
+    suivi = lambda faits, total: print(f"\r{faits}/{total} bon(s) lus", end="", file=sys.stderr, flush=True)
+    bons = lire_bons([f for f in fichiers if f[0] not in suspects], document,
+                     typer_feuille("Previsionnel", sheets.get("Previsionnel")), api_key, args.workers,
+                     signes_ditto=tuple(args.signes_ditto), suivi=suivi)
+    print(file=sys.stderr)
+    duree_lecture = time.perf_counter() - debut
+    valides, a_relire, retenus = trier(bons, document, suspects)
+
+    chemin_revue = args.revue or os.path.join(args.dossier, f"revue_{remove_accents(args.chantier).replace(' ', '_')}.csv")
+    if not a_relire.empty:
+        a_relire.to_csv(chemin_revue, index=False, encoding="utf-8-sig")
+    if valides.empty:
+        bilan = "rien à enregistrer"
+    elif args.essai:
+        bilan = "à enregistrer (essai : rien n'est publié)"
+    else:
+        _, reprises = enregistrer(stockage, args.base, args.chantier, document, valides, retenus, (sheets, etat),
+                                  index_scans, empreintes_bons, args.journal, args.originaux)
+        bilan = "enregistrée(s) en un commit" + (f" après {reprises} reprise(s)" if reprises else "")
+
+    appels = {nom: v[0] for nom, v in releve.stats.items()}
+    print(f"{len(fichiers)} bon(s) en {duree_lecture:.1f} s ({len(fichiers) / duree_lecture * 60:.1f} bons/min, {args.workers} worker(s)) : "
+          f"{appels.get('gemini.generation', 0)} appel(s) au modèle, {CACHE_OCR.stats()['hits']} réponse(s) du cache OCR, "
+          f"{len(suspects)} doublon(s) probable(s) non lus")
+    print("Réponses : " + ", ".join(f"{s} {appels.get(f'ocr.json.{s}', 0)}" for s in ("ok", "repare", "partiel", "echec")))
+    print(f"{len(valides)} ligne(s) de {len(retenus)} bon(s) {bilan}")
+    if not a_relire.empty:
+        motifs = a_relire["Motif"].str.split(" ").str[0].value_counts()
+        print(f"{len(a_relire)} ligne(s) à relire -> {chemin_revue} (" + ", ".join(f"{m} {n}" for m, n in motifs.items()) + ")")
+    print(f"Total : {time.perf_counter() - debut:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Journal en ajout seul des bons validés (mode de stockage "journal").
+
+Chaque bon validé est ajouté comme un petit enregistrement JSON à
+`<chantier>/JOURNAL/<Feuille>/<AAAA-MM>.jsonl` au lieu de réécrire tout le
+classeur. La lecture fusionne le journal avec le dernier instantané
+`<chantier>.xlsx`, qui reste l'export de référence ; le compactage replie le
+journal dans le classeur et supprime les fichiers du journal dans le même lot.
+
+Les identifiants des enregistrements déjà repliés sont mémorisés dans la
+feuille technique `_Journal` du classeur : un fichier de journal qui n'aurait
+pas pu être supprimé n'est ainsi jamais compté deux fois.
+"""
+import json
+import uuid
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+
+from itb77.schema import concatener, typer_feuille
+
+DOSSIER_JOURNAL = "JOURNAL"
+FEUILLE_IDS = "_Journal"
+
+
+def chemin_journal(dossier_chantier, feuille, now=None):
+    now = now or datetime.now()
+    return f"{dossier_chantier}/{DOSSIER_JOURNAL}/{feuille}/{now.strftime('%Y-%m')}.jsonl"
+
+
+def ajouter_entree(stockage, dossier_chantier, feuille, df_lignes, lot=None):
+    """Ajoute un bon (une ou plusieurs lignes) au journal de la feuille ; retourne l'id.
+
+    Avec un `lot` (itb77.stockage.Lot), l'écriture part dans le même commit que le reste du lot.
+    """
+    entree = {
+        "id": uuid.uuid4().hex,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "lignes": json.loads(df_lignes.to_json(orient="records", force_ascii=False)),
+    }
+    ligne = json.dumps(entree, ensure_ascii=False) + "\n"
+    path = chemin_journal(dossier_chantier, feuille)
+    try:
+        sha = stockage.sha(path)
+    except Exception:
+        sha = None
+    if sha is None:
+        contenu = ligne
+    else:
+        texte = stockage.lire(path).decode("utf-8")
+        if texte and not texte.endswith("\n"): texte += "\n"
+        contenu = texte + ligne
+    if lot is not None:
+        lot.ecrire(path, contenu.encode("utf-8"), sha)
+    else:
+        stockage.ecrire(path, contenu.encode("utf-8"), f"Journal {feuille}", sha)
+    return entree["id"]
+
+
+@lru_cache(maxsize=256)
+def _lire_blob(stockage, path, sha):
+    # Un sha de blob identifie un contenu immuable : le cache n'est jamais périmé
+    texte = stockage.lire_blob(path, sha).decode("utf-8")
+    return tuple(json.loads(l) for l in texte.splitlines() if l.strip())
+
+
+def _fichiers_journal(stockage, dossier_chantier):
+    try:
+        fichiers = stockage.lister_recursif(f"{dossier_chantier}/{DOSSIER_JOURNAL}")
+        return sorted((f for f in fichiers if f.path.endswith(".jsonl")), key=lambda f: f.path)
+    except Exception:
+        return []
+
+
+def lire_journal(stockage, dossier_chantier):
+    """Retourne {feuille: [entrées dans l'ordre]} et la liste des fichiers lus."""
+    fichiers = _fichiers_journal(stockage, dossier_chantier)
+    journal = {}
+    for f in fichiers:
+        feuille = f.path.split("/")[0]
+        path = f"{dossier_chantier}/{DOSSIER_JOURNAL}/{f.path}"
+        journal.setdefault(feuille, []).extend(_lire_blob(stockage, path, f.sha))
+    return journal, fichiers
+
+
+def ids_compactes(sheets):
+    df_ids = sheets.get(FEUILLE_IDS)
+    if df_ids is None or df_ids.empty or "id" not in df_ids.columns:
+        return set()
+    return set(df_ids["id"].astype(str))
+
+
+def fusionner(sheets, journal):
+    """Ajoute aux feuilles de l'instantané les entrées du journal pas encore repliées.
+
+    La feuille `_Journal` du résultat liste tous les ids du journal courant :
+    toute sauvegarde du classeur fusionné vaut donc compactage de ces entrées.
+    """
+    deja = ids_compactes(sheets)
+    fusion = dict(sheets)
+    tous_ids = []
+    for feuille, entrees in journal.items():
+        tous_ids.extend(e["id"] for e in entrees)
+        lignes = [l for e in entrees if e["id"] not in deja for l in e["lignes"]]
+        if not lignes: continue
+        df_journal = pd.DataFrame(lignes)
+        df_base = fusion.get(feuille)
+        if df_base is None or df_base.empty:
+            fusion[feuille] = typer_feuille(feuille, df_journal)
+        else:
+            fusion[feuille] = concatener(feuille, df_base, df_journal)
+    fusion[FEUILLE_IDS] = pd.DataFrame({"id": tous_ids}, dtype=object)
+    return fusion
+
+
+def nb_entrees_en_attente(sheets, journal):
+    deja = ids_compactes(sheets)
+    return {f: sum(1 for e in entrees if e["id"] not in deja) for f, entrees in journal.items()}
+
+
+def compacter(stockage, dossier_chantier, sheets_fusionnes, fichiers, path, sha, sauvegarder):
+    """Replie le journal dans le classeur et supprime les fichiers du journal, en un seul lot.
+
+    `sheets_fusionnes` et `fichiers` viennent de la même lecture (`fusionner`,
+    `lire_journal`). `sauvegarder(sheets, path, sha, lot=...)` écrit le classeur
+    dans le lot. Si le classeur ou un fichier du journal a changé depuis cette
+    lecture, ConflitStockage remonte et rien n'est publié : ni classeur, ni
+    suppression. Retourne le nombre de fichiers supprimés.
+    """
+    with stockage.lot("Compactage journal") as lot:
+        for f in fichiers:
+            lot.supprimer(f"{dossier_chantier}/{DOSSIER_JOURNAL}/{f.path}", f.sha)
+        sauvegarder(sheets_fusionnes, path, sha, lot=lot)
+    return len(fichiers)
@@ -0,0 +1,186 @@
+"""Durées et volumes des appels coûteux : GitHub, Excel, récap, exports, Gemini.
+
+Chaque mesure (`with mesurer(nom):` ou `@chronometre(nom)`) est ajoutée au
+relevé actif — un par rerun, activé par l'application en tête de script — et
+au cumul du processus. Les pools de threads héritent du relevé de l'appelant
+via `propager`. Avec `configurer_journal`, chaque mesure est aussi écrite sur
+une ligne JSON d'un fichier tournant, pour l'analyse hors ligne.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+OCTETS_JOURNAL_DEFAUT = 5 * 1024 * 1024
+SAUVEGARDES_JOURNAL_DEFAUT = 3
+
+_RELEVE = contextvars.ContextVar("releve", default=None)
+_journal = logging.getLogger("itb77.mesures")
+_journal.propagate = False
+
+
+class Releve:
+    """{nom: [appels, durée totale, durée max, octets]}, partagé entre threads."""
+
+    def __init__(self, etiquette=""):
+        self.etiquette = etiquette
+        self.debut = time.perf_counter()
+        self.duree = None  # durée du rerun, si le script est allé au bout
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def ajouter(self, nom, duree, octets=0):
+        with self._lock:
+            s = self.stats.setdefault(nom, [0, 0.0, 0.0, 0])
+            s[0] += 1
+            s[1] += duree
+            s[2] = max(s[2], duree)
+            s[3] += octets
+
+    def fusionner(self, autre):
+        with autre._lock:
+            stats = {nom: list(s) for nom, s in autre.stats.items()}
+        with self._lock:
+            for nom, (n, total, pic, octets) in stats.items():
+                s = self.stats.setdefault(nom, [0, 0.0, 0.0, 0])
+                s[0] += n
+                s[1] += total
+                s[2] = max(s[2], pic)
+                s[3] += octets
+
+    def terminer(self):
+        self.duree = time.perf_counter() - self.debut
+
+    def tableau(self):
+        with self._lock:
+            lignes = [(nom, n, total * 1000, total * 1000 / n, pic * 1000, octets / 1024)
+                      for nom, (n, total, pic, octets) in self.stats.items()]
+        df = pd.DataFrame(lignes, columns=["Mesure", "Appels", "Total (ms)", "Moyenne (ms)", "Max (ms)", "Ko"])
+        return df.sort_values("Total (ms)", ascending=False, ignore_index=True)
+
+
+CUMUL_PROCESSUS = Releve("processus")
+
+
+def activer(releve):
+    """Rend `releve` actif pour le thread courant (et les pools lancés via `propager`)."""
+    _RELEVE.set(releve)
+
+
+def releve_actif():
+    return _RELEVE.get()
+
+
+def propager(fn):
+    """`fn` exécutée dans un autre thread enregistre dans le relevé de l'appelant."""
+    releve = _RELEVE.get()
+
+    @functools.wraps(fn)
+    def avec_releve(*args, **kwargs):
+        jeton = _RELEVE.set(releve)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _RELEVE.reset(jeton)
+    return avec_releve
+
+
+def enregistrer(nom, duree, octets=0):
+    releve = _RELEVE.get()
+    if releve is not None: releve.ajouter(nom, duree, octets)
+    CUMUL_PROCESSUS.ajouter(nom, duree, octets)
+    if _journal.handlers:
+        _journal.info(json.dumps({
+            "t": datetime.now().isoformat(timespec="milliseconds"), "rerun": releve.etiquette if releve else None,
+            "nom": nom, "ms": round(duree * 1000, 3), "octets": octets,
+        }, ensure_ascii=False))
+
+
+class _Mesure:
+    __slots__ = ("octets",)
+
+    def __init__(self, octets):
+        self.octets = octets
+
+
+@contextmanager
+def mesurer(nom, octets=0):
+    """Chronomètre le bloc ; `m.octets` peut être renseigné dans le bloc. Enregistré même en cas d'exception."""
+    m = _Mesure(octets)
+    t = time.perf_counter()
+    try:
+        yield m
+    finally:
+        enregistrer(nom, time.perf_counter() - t, m.octets)
+
+
+def chronometre(nom, octets=None):
+    """Décorateur ; `octets(resultat, *args)` donne le volume traité."""
+    def decorer(fn):
+        @functools.wraps(fn)
+        def mesuree(*args, **kwargs):
+            with mesurer(nom) as m:
+                resultat = fn(*args, **kwargs)
+                if octets is not None: m.octets = octets(resultat, *args)
+                return resultat
+        return mesuree
+    return decorer
+
+
+def taille(obj):
+    """Octets d'un argument ou d'un résultat PyGithub, sans déclencher de requête supplémentaire."""
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum(taille(o) for o in obj)
+    brut = getattr(obj, "_rawData", None)  # lire `.size` compléterait un objet partiel par un GET
+    return (brut.get("size") or 0) if isinstance(brut, dict) else 0
+
+
+class Instrumente:
+    """Enveloppe un objet (le `Repository` PyGithub) : chaque appel de méthode est mesuré.
+
+    `sous_objets` : {méthode: préfixe} pour les résultats dont les méthodes
+    sont aussi des appels réseau (la référence git et son `edit`).
+    """
+
+    def __init__(self, cible, prefixe="github", sous_objets=None):
+        self._cible = cible
+        self._prefixe = prefixe
+        self._sous_objets = {"get_git_ref": f"{prefixe}.ref"} if sous_objets is None else sous_objets
+
+    def __getattr__(self, nom):
+        attr = getattr(self._cible, nom)
+        if not callable(attr):
+            return attr
+        sous_prefixe = self._sous_objets.get(nom)
+
+        @functools.wraps(attr)
+        def appel(*args, **kwargs):
+            with mesurer(f"{self._prefixe}.{nom}", taille(list(args) + list(kwargs.values()))) as m:
+                resultat = attr(*args, **kwargs)
+                m.octets += taille(resultat)
+            return Instrumente(resultat, sous_prefixe, {}) if sous_prefixe else resultat
+        return appel
+
+
+def configurer_journal(chemin, octets_max=OCTETS_JOURNAL_DEFAUT, sauvegardes=SAUVEGARDES_JOURNAL_DEFAUT):
+    """Active l'écriture JSONL (une fois par processus ; sans effet si déjà configuré sur `chemin`)."""
+    if os.path.abspath(chemin) in journal_actif():
+        return
+    handler = RotatingFileHandler(chemin, maxBytes=octets_max, backupCount=sauvegardes, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _journal.addHandler(handler)
+    _journal.setLevel(logging.INFO)
+
+
+def journal_actif():
+    return [h.baseFilename for h in _journal.handlers if hasattr(h, "baseFilename")]
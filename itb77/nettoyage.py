@@ -0,0 +1,84 @@
+"""Nettoyage des textes et des lignes extraites des bons (sans dépendance Streamlit)."""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+def remove_accents(input_str):
+    if not isinstance(input_str, str): return str(input_str)
+    nfkd_form = unicodedata.normalize('NFKD', input_str)
+    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+
+MOTS_INFRA = ["r-", "s-sol", "sous-sol", "fondation", "radier", "pieux", "semelle", "longrine", "infra", "gros beton"]
+
+def detecter_zone_automatique(texte):
+    texte = remove_accents(str(texte).lower().strip())
+    for mot in MOTS_INFRA:
+        if mot in texte:
+            return "INFRA"
+    return "SUPER"
+
+DECLENCHEURS_DITTO = ("u", "U", '"')
+
+def appliquer_correction_u(df, colonnes_a_verifier, declencheurs=DECLENCHEURS_DITTO):
+    """Remplace les signes "idem" (u, U, ") par la valeur de la ligne au-dessus.
+
+    Les idem enchaînés remontent jusqu'à la dernière vraie valeur ; la première
+    ligne n'est jamais remplacée. Vectorisé : masque des idem, puis pour chaque
+    ligne la position de la dernière ligne non-idem (maximum cumulé).
+    Suppose un index 0..n-1, comme la boucle d'origine.
+    """
+    declencheurs = set(declencheurs)
+    for col in colonnes_a_verifier:
+        if col in df.columns and len(df) > 1:
+            masque = np.array(df[col].map(str).str.strip().isin(declencheurs), dtype=bool)
+            masque[0] = False
+            if not masque.any(): continue
+            positions = np.where(masque, 0, np.arange(len(df)))
+            # take sur le tableau de la colonne : valeurs et dtype conservés tels quels
+            df[col] = df[col].array.take(np.maximum.accumulate(positions))
+    return df
+
+def verifier_correspondance_budget(df_scan, df_budget, col_scan="Designation"):
+    """Coche "Doute" sur les lignes dont la désignation n'est pas au budget (au "s" final près)."""
+    from itb77.correspondance import index_budget
+    index = index_budget(df_budget)
+    if "Doute" not in df_scan.columns:
+        df_scan["Doute"] = False
+    if col_scan not in df_scan.columns:
+        inconnu = pd.Series(not index.est_connu(""), index=df_scan.index)
+        df_scan.loc[inconnu, "Doute"] = True
+        return df_scan, ["Inconnu"] * int(inconnu.sum())
+    valeurs = df_scan[col_scan]
+    # Chaque valeur distincte n'est testée qu'une fois
+    connus = {v: index.est_connu(v) for v in valeurs.astype(str).unique()}
+    inconnu = ~valeurs.astype(str).map(connus).astype(bool)
+    df_scan.loc[inconnu, "Doute"] = True
+    return df_scan, valeurs[inconnu].tolist()
+
+def preparer_relecture(res, colonnes, cols_texte, col_num, cols_ditto, df_budget, declencheurs=DECLENCHEURS_DITTO):
+    """Nettoie un résultat OCR brut pour la grille de relecture : (DataFrame, termes inconnus)."""
+    # --- BLOC DE NETTOYAGE ET CONVERSION ---
+    if not res.empty:
+        # 1. Conversion des colonnes TEXTE (str) pour éviter l'erreur FLOAT
+        for col in cols_texte:
+            if col in res.columns:
+                res[col] = res[col].fillna("").astype(str).replace('nan', '')
+            else:
+                res[col] = "" # Force creation si manquant
+
+        # 2. Conversion des colonnes NUMERIQUES (float)
+        if col_num in res.columns:
+            res[col_num] = pd.to_numeric(res[col_num], errors='coerce').fillna(0.0).astype(float)
+        else:
+            res[col_num] = 0.0
+
+        # 3. Colonne Doute
+        if "Doute" not in res.columns:
+            res["Doute"] = False
+        else:
+            res["Doute"] = res["Doute"].astype(bool)
+
+    res = res.reindex(columns=["Doute"] + colonnes)
+    res = appliquer_correction_u(res, cols_ditto, declencheurs)
+    return verifier_correspondance_budget(res, df_budget, col_scan="Designation")
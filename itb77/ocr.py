@@ -0,0 +1,399 @@
+"""Lecture des bons par Gemini : un bon ou un lot de bons en parallèle.
+
+Les fonctions de ce module n'appellent jamais Streamlit : elles peuvent tourner
+dans des threads de travail (lots) ou hors de l'application.
+"""
+import ast
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from itb77.cache_ocr import CACHE_OCR, cle_ocr
+from itb77.demarrage import charger
+from itb77.images import pretraiter_image
+from itb77.mesures import enregistrer, mesurer, propager
+from itb77.schema import COLS_QUANTITES
+
+OCR_WORKERS_DEFAUT = 4
+OCR_REQUETES_PAR_MINUTE_DEFAUT = 15
+CODES_TRANSITOIRES = {429, 500, 502, 503, 504}
+
+
+class LimiteurDebit:
+    """Seau à jetons partagé par tous les threads : au plus `par_minute` appels par minute."""
+
+    def __init__(self, par_minute=OCR_REQUETES_PAR_MINUTE_DEFAUT, rafale=1):
+        self.par_minute = par_minute
+        self.rafale = rafale
+        self._jetons = float(rafale)
+        self._dernier = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquerir(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._jetons = min(self.rafale, self._jetons + (now - self._dernier) * self.par_minute / 60.0)
+                self._dernier = now
+                if self._jetons >= 1:
+                    self._jetons -= 1
+                    return
+                attente = (1 - self._jetons) * 60.0 / self.par_minute
+            time.sleep(attente)
+
+
+LIMITEUR_OCR = LimiteurDebit()
+
+
+def code_erreur(e):
+    code = getattr(e, "code", None)
+    if callable(code):  # grpc : code() renvoie un StatusCode
+        return None
+    return code
+
+
+def est_transitoire(e, codes=CODES_TRANSITOIRES):
+    return code_erreur(e) in codes
+
+
+def appeler_avec_reprise(fn, limiteur=None, essais=5, base=2.0, plafond=60.0, codes=CODES_TRANSITOIRES):
+    """Appelle fn() après un jeton du limiteur ; backoff exponentiel sur 429/5xx."""
+    limiteur = limiteur or LIMITEUR_OCR
+    for tentative in range(essais):
+        with mesurer("gemini.attente_debit"):
+            limiteur.acquerir()
+        try:
+            return fn()
+        except Exception as e:
+            if not est_transitoire(e, codes) or tentative == essais - 1:
+                raise
+            time.sleep(min(plafond, base * 2 ** tentative) * random.uniform(0.5, 1.0))
+
+
+# Liste de préférence (UNIQUEMENT LES STABLES)
+PREFERENCES_MODELES = [
+    "models/gemini-1.5-flash",      # Priorité absolue : le plus stable et gratuit
+    "models/gemini-1.5-flash-001",
+    "models/gemini-1.5-flash-002",
+    "models/gemini-1.5-flash-latest",
+    "models/gemini-pro"
+]
+MODELE_SECOURS = "gemini-1.5-flash"
+MODELE_TTL_DEFAUT = 3600          # secondes avant de relister les modèles
+MODELE_TTL_ECHEC_LISTAGE = 60     # on retente plus tôt si list_models a échoué
+MISE_A_L_ECART_429 = 60           # un modèle en quota dépassé est évité pendant ce délai
+
+
+def classer_modeles(available_models):
+    """
+    Ordre de bascule parmi les modèles disponibles : préférences STABLES, puis les
+    "flash" (hors expérimentaux), puis le reste.
+    On a retiré les modèles expérimentaux (2.0-flash-exp) pour éviter l'erreur 429.
+    """
+    ordre = [p for p in PREFERENCES_MODELES if p in available_models]
+    ordre += [m for m in available_models if "flash" in m and "exp" not in m and m not in ordre]
+    ordre += [m for m in available_models if m not in ordre]
+    return [m.replace("models/", "") for m in ordre]
+
+
+def lister_modeles_genai():
+    return [m.name for m in charger("google.generativeai").list_models() if 'generateContent' in m.supported_generation_methods]
+
+
+class ResolveurModele:
+    """Modèle Gemini résolu une fois par processus (TTL), avec bascule sans relister."""
+
+    def __init__(self, ttl=MODELE_TTL_DEFAUT, lister=lister_modeles_genai):
+        self.ttl = ttl
+        self.lister = lister
+        self._candidats = []
+        self._expire = 0.0
+        self._ecartes = {}
+        self._lock = threading.Lock()
+        self.listages = 0
+        self.hits = 0
+        self.bascules = 0
+
+    def _lister(self, now):
+        self.listages += 1
+        self._ecartes.clear()
+        try:
+            available_models = self.lister()
+            self._candidats = classer_modeles(available_models) or [MODELE_SECOURS]
+            self._expire = now + self.ttl
+        except Exception:
+            # Fallback ultime (Stable)
+            self._candidats = [MODELE_SECOURS]
+            self._expire = now + MODELE_TTL_ECHEC_LISTAGE
+
+    def _premier_disponible(self, now):
+        for nom in self._candidats:
+            if self._ecartes.get(nom, 0) <= now:
+                return nom
+        return None
+
+    def modele(self):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expire or not self._candidats:
+                self._lister(now)
+            else:
+                self.hits += 1
+            # Tous écartés : on reprend le préféré, l'appel fera son backoff
+            return self._premier_disponible(now) or self._candidats[0]
+
+    def basculer(self, nom, duree=None):
+        """Écarte `nom` et retourne le candidat suivant, ou None s'il n'en reste aucun."""
+        with self._lock:
+            now = time.monotonic()
+            self._ecartes[nom] = now + (duree if duree is not None else self.ttl)
+            self.bascules += 1
+            return self._premier_disponible(now)
+
+    def invalider(self):
+        with self._lock:
+            self._candidats = []
+            self._expire = 0.0
+
+    def rapport(self):
+        with self._lock:
+            now = time.monotonic()
+            ecartes = [n for n, t in self._ecartes.items() if t > now]
+            return (
+                f"Cache modèle : {self.hits} hit(s), {self.listages} listage(s), {self.bascules} bascule(s), "
+                f"expire dans {max(0, int(self._expire - now))} s"
+                + (f", écartés : {', '.join(ecartes)}" if ecartes else "")
+            )
+
+
+RESOLVEUR_MODELE = ResolveurModele()
+
+
+def modele_gemini(nom):
+    return charger("google.generativeai").GenerativeModel(nom)
+
+
+# Construit le modèle à partir de son nom ; remplacé par un modèle factice hors réseau (bench.modele_factice)
+FABRIQUE_MODELE = modele_gemini
+_cle_configuree = None
+_lock_config = threading.Lock()
+
+
+def configurer(api_key):
+    """genai.configure une seule fois par clé et par processus."""
+    global _cle_configuree
+    with _lock_config:
+        if api_key != _cle_configuree:
+            charger("google.generativeai").configure(api_key=api_key)
+            if _cle_configuree is not None:
+                RESOLVEUR_MODELE.invalider()
+            _cle_configuree = api_key
+
+
+def get_best_available_model():
+    return RESOLVEUR_MODELE.modele()
+
+
+def _modele_introuvable(e):
+    return code_erreur(e) == 404 or "not found" in str(e).lower()
+
+
+def construire_prompt(prompt):
+    # Prompt renforcé
+    return (
+        f"{prompt}. "
+        "IMPORTANT : Retourne UNIQUEMENT une liste JSON brute (tableau d'objets) compatible Python."
+        "Ne mets PAS de Markdown (pas de ```json ... ```)."
+        "Les clés du JSON doivent être EXACTEMENT celles demandées dans le prompt (respecte majuscules/accents)."
+        "Si une valeur est absente, mets null ou 0."
+        "Ajoute une clé 'Doute' (boolean) : true si incertain, sinon false."
+    )
+
+
+def schema_reponse(colonnes):
+    """Schéma de sortie structurée : liste d'objets aux clés `colonnes` + Doute, quantités en nombres."""
+    proprietes = {c: {"type": "NUMBER" if c in COLS_QUANTITES else "STRING", "nullable": True} for c in colonnes}
+    proprietes["Doute"] = {"type": "BOOLEAN"}
+    return {"type": "ARRAY", "items": {"type": "OBJECT", "properties": proprietes, "required": list(proprietes)}}
+
+
+def _en_liste(data):
+    if isinstance(data, dict):
+        if "data" in data: data = data["data"]
+        elif "result" in data: data = data["result"]
+        else: data = [data]
+    return [d for d in data if isinstance(d, dict)] if isinstance(data, list) else []
+
+
+def _objet(fragment):
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    # Apostrophes à la Python : {'Designation': 'Voile', 'Doute': false}
+    try:
+        objet = ast.literal_eval(re.sub(r"\b(true|false|null)\b", lambda m: {"true": "True", "false": "False", "null": "None"}[m.group(1)], fragment))
+    except (ValueError, SyntaxError):
+        return None
+    return objet if isinstance(objet, dict) else None
+
+
+def _objets(txt, debut):
+    """Objets {...} de premier niveau lus un à un depuis `debut` : (fragments, True si la liste est fermée).
+
+    Guillemets et apostrophes sont suivis pour ignorer les accolades des
+    chaînes ; un tableau tronqué rend les objets complets qui précèdent la coupure.
+    """
+    fragments, profondeur, ouvrant, chaine, echappe = [], 0, None, None, False
+    for i in range(debut, len(txt)):
+        c = txt[i]
+        if chaine:
+            if echappe: echappe = False
+            elif c == "\\": echappe = True
+            elif c == chaine: chaine = None
+        elif c in "\"'":
+            chaine = c
+        elif c == "{":
+            if profondeur == 0: ouvrant = i
+            profondeur += 1
+        elif c == "}" and profondeur:
+            profondeur -= 1
+            if profondeur == 0:
+                fragments.append(txt[ouvrant:i + 1])
+                if txt[debut] == "{": return fragments, True
+        elif c == "]" and profondeur == 0:
+            return fragments, True
+    return fragments, False
+
+
+def extraire_json(txt):
+    """Objets lus dans une réponse du modèle, même imparfaite : (liste de dicts, statut).
+
+    statut : "ok" (JSON valide), "repare" (Markdown, texte autour, apostrophes),
+    "partiel" (réponse tronquée : objets complets seulement) ou "echec".
+    """
+    txt = txt.strip()
+    try:
+        return _en_liste(json.loads(txt)), "ok"
+    except ValueError:
+        pass
+    bloc = re.search(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", txt, re.S)
+    if bloc: txt = bloc.group(1)
+    debut = min((i for i in (txt.find("["), txt.find("{")) if i >= 0), default=-1)
+    if debut < 0:
+        return [], "echec"
+    try:
+        # Texte après le JSON (« Voici les données... ») ignoré
+        return _en_liste(json.JSONDecoder().raw_decode(txt, debut)[0]), "repare"
+    except ValueError:
+        pass
+    fragments, fermee = _objets(txt, debut)
+    objets = [o for o in map(_objet, fragments) if o is not None]
+    if not objets:
+        return [], "echec"
+    return objets, "repare" if fermee and len(objets) == len(fragments) else "partiel"
+
+
+def parser_reponse(txt):
+    """Texte brut du modèle -> (DataFrame, statut) ; lève ValueError si rien n'est lisible.
+
+    Chaque lecture est comptée dans les mesures (ocr.json.<statut>).
+    """
+    debut = time.perf_counter()
+    objets, statut = extraire_json(txt)
+    enregistrer(f"ocr.json.{statut}", time.perf_counter() - debut, len(txt))
+    if statut == "echec":
+        raise ValueError("Réponse du modèle illisible (aucun objet JSON)")
+    return pd.DataFrame(objets), statut
+
+
+def _generer(model_name, contenu, limiteur, schema=None):
+    """Appel avec bascule : 429 ou modèle introuvable -> candidat suivant, 5xx -> backoff.
+
+    Quand il ne reste aucun candidat, un 429 repasse par le backoff exponentiel.
+    Un modèle qui refuse la sortie structurée (400) est rappelé sans schéma.
+    Retourne (réponse, modèle effectivement utilisé).
+    """
+    codes_5xx = CODES_TRANSITOIRES - {429}
+    while True:
+        config = charger("google.generativeai").GenerationConfig(response_mime_type="application/json", response_schema=schema) if schema else None
+        appel = lambda: FABRIQUE_MODELE(model_name).generate_content(contenu, generation_config=config)
+        try:
+            return appeler_avec_reprise(appel, limiteur, codes=codes_5xx), model_name
+        except Exception as e:
+            if schema and code_erreur(e) == 400:
+                enregistrer("gemini.sans_schema", 0)
+                schema = None
+                continue
+            quota = code_erreur(e) == 429
+            if not (quota or _modele_introuvable(e)):
+                raise
+            suivant = RESOLVEUR_MODELE.basculer(model_name, MISE_A_L_ECART_429 if quota else None)
+            if suivant is None:
+                if not quota: raise
+                return appeler_avec_reprise(appel, limiteur), model_name
+            model_name = suivant
+
+
+def extraire_bon(image, prompt, limiteur=None, cache=None, schema=None):
+    """Un appel au modèle pour une image : retourne (DataFrame, texte de debug).
+
+    `schema` (voir schema_reponse) demande une sortie JSON structurée. Une
+    image déjà encodée (blob) est d'abord cherchée dans le cache OCR.
+    """
+    cache = CACHE_OCR if cache is None else cache
+    prompt_complet = construire_prompt(prompt)
+    cle = None
+    if cache.actif and isinstance(image, dict):
+        cle = cle_ocr(image["data"], prompt_complet + json.dumps(schema, sort_keys=True))
+        with mesurer("ocr.cache"):
+            entree = cache.get(cle)
+        if entree is not None:
+            df, _ = parser_reponse(entree["texte"])
+            return df, f"Modèle: {entree['modele']} (cache OCR)\n\n{entree['texte']}"
+    txt = ""
+    try:
+        # Résolution du modèle (listage éventuel) et génération mesurées séparément
+        with mesurer("gemini.modele"):
+            model_name = RESOLVEUR_MODELE.modele()
+        with mesurer("gemini.generation", len(image.get("data", b"")) if isinstance(image, dict) else 0):
+            response, model_name = _generer(model_name, [prompt_complet, image], limiteur, schema)
+        txt = response.text
+        df, statut = parser_reponse(txt)
+        # Une réponse tronquée n'est pas gardée : un nouvel envoi peut faire mieux
+        if cle is not None and statut != "partiel":
+            cache.put(cle, {"modele": model_name, "texte": txt})
+        note = {"repare": "JSON réparé\n", "partiel": f"Réponse tronquée : {len(df)} ligne(s) récupérée(s)\n"}.get(statut, "")
+        return df, f"Modèle: {model_name}\n{RESOLVEUR_MODELE.rapport()}\n{note}\n{txt}"
+    except Exception as e:
+        return pd.DataFrame(), f"{e}\n{RESOLVEUR_MODELE.rapport()}" + (f"\n\n{txt}" if txt else "")
+
+
+def analyser_lot(fichiers, api_key, prompt, workers=OCR_WORKERS_DEFAUT, limiteur=None, pretraiter=pretraiter_image, schema=None):
+    """Analyse une liste de (nom, bytes) sur un pool borné.
+
+    Générateur : produit (position, nom, DataFrame, debug, image pré-traitée ou
+    None) dans l'ordre d'arrivée des résultats, pour afficher les lignes au fil
+    de l'eau. Le pré-traitement tourne aussi dans le pool.
+    """
+    configurer(api_key)
+
+    def traiter(nom, data):
+        try:
+            image = pretraiter(nom, data)
+        except Exception as e:
+            return pd.DataFrame(), f"Erreur lecture image : {e}", None
+        df, debug = extraire_bon(image.blob(), prompt, limiteur, schema=schema)
+        return df, debug, image
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ocr") as pool:
+        futures = {pool.submit(propager(traiter), nom, data): (i, nom) for i, (nom, data) in enumerate(fichiers)}
+        for fut in as_completed(futures):
+            i, nom = futures[fut]
+            df, debug, image = fut.result()
+            yield i, nom, df, debug, image
@@ -0,0 +1,138 @@
+"""Photos de pointage (Admin -> Pointages) : liste paginée, vignettes, contenu à la demande.
+
+Seules les photos de la page affichée sont touchées. Chaque photo a une
+vignette JPEG stockée à côté (`<mois>/.miniatures/<nom>.jpg`), générée une
+fois puis gardée en mémoire dans un cache borné en octets ; la photo
+elle-même n'est téléchargée que si l'utilisateur clique sur le bouton.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from itb77.images import miniature
+from itb77.mesures import propager
+from itb77.stockage import SANS_VERIFICATION, sha_blob
+
+DOSSIER_MINIATURES = ".miniatures"
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.heic')
+PAR_PAGE_DEFAUT = 12
+OCTETS_CACHE_MINIATURES = 8 * 1024 * 1024
+
+
+class CacheOctets:
+    """LRU par sha, borné par la taille totale des contenus."""
+
+    def __init__(self, octets_max=OCTETS_CACHE_MINIATURES):
+        self.octets_max = octets_max
+        self._data = OrderedDict()
+        self._octets = 0
+        self._lock = threading.Lock()
+
+    def get(self, sha):
+        with self._lock:
+            data = self._data.get(sha)
+            if data is not None: self._data.move_to_end(sha)
+            return data
+
+    def put(self, sha, data):
+        with self._lock:
+            if sha in self._data: return
+            self._data[sha] = data
+            self._octets += len(data)
+            while self._octets > self.octets_max and len(self._data) > 1:
+                _, ancien = self._data.popitem(last=False)
+                self._octets -= len(ancien)
+
+
+CACHE_MINIATURES = CacheOctets()
+
+
+def chemin_miniature(dossier, nom):
+    return f"{dossier}/{DOSSIER_MINIATURES}/{nom}.jpg"
+
+
+def lister_photos(stockage, dossier):
+    """Métadonnées seules (nom, chemin, sha), triées par nom."""
+    return sorted((e for e in stockage.lister(dossier) if e.type == "file" and e.name.lower().endswith(EXTENSIONS)),
+                  key=lambda e: e.name)
+
+
+def paginer(photos, page, par_page=PAR_PAGE_DEFAUT):
+    """(photos de la page, nombre de pages) ; `page` commence à 1."""
+    nb_pages = max(1, -(-len(photos) // par_page))
+    page = min(max(1, page), nb_pages)
+    return photos[(page - 1) * par_page:page * par_page], nb_pages
+
+
+def _miniatures_existantes(stockage, dossier):
+    try:
+        return {e.name: e for e in stockage.lister(f"{dossier}/{DOSSIER_MINIATURES}")}
+    except Exception:
+        return {}
+
+
+def miniatures(stockage, dossier, photos, workers=4):
+    """{nom: octets JPEG ou None} pour les photos données.
+
+    Les vignettes manquantes sont générées (lecture de l'original, en
+    parallèle) et publiées ensemble en un seul lot.
+    """
+    existantes = _miniatures_existantes(stockage, dossier)
+    resultat, a_lire, a_creer = {}, [], []
+    for p in photos:
+        e = existantes.get(f"{p.name}.jpg")
+        if e is None:
+            a_creer.append(p)
+        else:
+            resultat[p.name] = CACHE_MINIATURES.get(e.sha)
+            if resultat[p.name] is None: a_lire.append((p.name, e))
+
+    def lire(item):
+        nom, e = item
+        data = stockage.lire_blob(e.path, e.sha)
+        CACHE_MINIATURES.put(e.sha, data)
+        return nom, data
+
+    def creer(p):
+        try:
+            return p.name, miniature(p.name, stockage.lire(p.path))
+        except Exception as e:
+            print(f"Erreur vignette {p.path}: {e}")
+            return p.name, None
+
+    if a_lire or a_creer:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="miniatures") as pool:
+            resultat.update(pool.map(propager(lire), a_lire))
+            crees = [(nom, data) for nom, data in pool.map(propager(creer), a_creer)]
+        nouvelles = [(nom, data) for nom, data in crees if data is not None]
+        if nouvelles:
+            try:
+                with stockage.lot(f"Vignettes pointages ({len(nouvelles)})") as lot:
+                    for nom, data in nouvelles:
+                        lot.ecrire(chemin_miniature(dossier, nom), data, SANS_VERIFICATION)
+            except Exception as e:
+                # Affichées quand même ; elles seront recréées à la prochaine visite
+                print(f"Erreur sauvegarde vignettes {dossier}: {e}")
+        for nom, data in crees:
+            resultat[nom] = data
+            if data is not None: CACHE_MINIATURES.put(sha_blob(data), data)
+    return resultat
+
+
+def ajouter_photo(stockage, dossier, nom, data):
+    """Photo et vignette dans le même commit."""
+    with stockage.lot(f"Add img {nom}") as lot:
+        lot.ecrire(f"{dossier}/{nom}", data)
+        try:
+            lot.ecrire(chemin_miniature(dossier, nom), miniature(nom, data), SANS_VERIFICATION)
+        except Exception as e:
+            print(f"Erreur vignette {nom}: {e}")
+
+
+def supprimer_photo(stockage, dossier, photo):
+    """Supprime la photo et sa vignette éventuelle en un commit."""
+    vignette = _miniatures_existantes(stockage, dossier).get(f"{photo.name}.jpg")
+    with stockage.lot(f"Delete {photo.name}") as lot:
+        lot.supprimer(photo.path, photo.sha)
+        if vignette is not None:
+            lot.supprimer(vignette.path, vignette.sha)
@@ -0,0 +1,128 @@
+"""Vue portefeuille : Prévu / Consommé / Étude / Reste béton par chantier et par zone.
+
+Les totaux de chaque chantier sont gardés dans un fichier d'index
+(`CHANTIERS_ITB77/_portefeuille.json`) mis à jour dans le même commit que
+chaque sauvegarde : le tableau de bord coûte une lecture. Chaque entrée porte
+la version du chantier (sha du classeur + sha des fichiers de journal) ; un
+chantier absent de l'index, ou périmé quand on demande la vérification, est
+rechargé, les chantiers en parallèle.
+"""
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from itb77.journal import DOSSIER_JOURNAL
+from itb77.mesures import propager
+from itb77.recap import calculer_recap, feuilles_recap
+from itb77.stockage import SANS_VERIFICATION
+
+NOM_INDEX = "_portefeuille.json"
+WORKERS_DEFAUT = 8
+COLONNES = {"Prevu (m3)": "prevu", "Volume Reel": "consomme", "Etude (m3)": "etude", "Reste (m3)": "reste"}
+
+
+def chemin_index(base_dir):
+    return f"{base_dir}/{NOM_INDEX}"
+
+
+def version_chantier(sha_classeur, shas_journal=()):
+    h = hashlib.sha1((sha_classeur or "").encode())
+    for sha in sorted(s for s in shas_journal if s):
+        h.update(sha.encode())
+    return h.hexdigest()
+
+
+def shas_journal(dossier_chantier, fichiers, lot=None):
+    """Sha des fichiers de journal du chantier, après application du `lot` s'il y en a un."""
+    shas = {f"{dossier_chantier}/{DOSSIER_JOURNAL}/{f.path}": f.sha for f in fichiers}
+    if lot is not None:
+        prefixe = f"{dossier_chantier}/{DOSSIER_JOURNAL}/"
+        shas.update((p, s) for p, s in lot.shas().items() if p.startswith(prefixe))
+    return list(shas.values())
+
+
+def resumer(sheets, df_recap=None):
+    """{zone: {prevu, consomme, etude, reste}} à partir des feuilles d'un classeur (ou de son récap)."""
+    if df_recap is None:
+        df_recap, _ = calculer_recap(*feuilles_recap(sheets))
+    if df_recap.empty: return {}
+    par_zone = df_recap.groupby("Zone")[list(COLONNES)].sum()
+    return {str(zone): {COLONNES[c]: float(v) for c, v in ligne.items()} for zone, ligne in par_zone.iterrows()}
+
+
+def entree(sheets, version, df_recap=None):
+    return {"version": version, "maj": datetime.now().isoformat(timespec="seconds"), "zones": resumer(sheets, df_recap)}
+
+
+def lire_index(stockage, base_dir):
+    try:
+        return json.loads(stockage.lire(chemin_index(base_dir)).decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def _ecrire_index(lot, base_dir, index):
+    # Dernier écrit gagne : une mise à jour perdue rend seulement l'entrée périmée
+    data = json.dumps(index, ensure_ascii=False, sort_keys=True, indent=1).encode("utf-8")
+    lot.ecrire(chemin_index(base_dir), data, SANS_VERIFICATION)
+
+
+def indexer(lot, stockage, base_dir, nom, sheets, version, df_recap=None):
+    """Ajoute au `lot` la mise à jour de l'entrée `nom` de l'index."""
+    index = lire_index(stockage, base_dir)
+    index[nom] = entree(sheets, version, df_recap)
+    _ecrire_index(lot, base_dir, index)
+
+
+def versions_actuelles(stockage, base_dir, avec_journal):
+    """{chantier: version} d'après un listage récursif (un arbre git sur GitHub)."""
+    classeurs, journaux = {}, {}
+    for f in stockage.lister_recursif(base_dir):
+        parties = f.path.split("/")
+        if len(parties) == 2 and parties[1] == f"{parties[0]}.xlsx":
+            classeurs[parties[0]] = f.sha
+        elif avec_journal and len(parties) > 2 and parties[1] == DOSSIER_JOURNAL and f.path.endswith(".jsonl"):
+            journaux.setdefault(parties[0], []).append(f.sha)
+    return {nom: version_chantier(sha, journaux.get(nom, ())) for nom, sha in classeurs.items()}
+
+
+def charger_portefeuille(stockage, base_dir, chantiers, lire_chantier, verifier=False, avec_journal=False,
+                         workers=WORKERS_DEFAUT):
+    """Retourne ({chantier: entrée}, chantiers rechargés).
+
+    `lire_chantier(nom)` -> (sheets, version) ou (None, None) ; appelé en
+    parallèle pour les chantiers absents de l'index, et pour les périmés si
+    `verifier`. L'index est réécrit (un commit) s'il a fallu recharger.
+    """
+    index = lire_index(stockage, base_dir)
+    a_charger = [n for n in chantiers if n not in index]
+    if verifier:
+        versions = versions_actuelles(stockage, base_dir, avec_journal)
+        a_charger += [n for n in chantiers if n in index and index[n].get("version") != versions.get(n)]
+    if a_charger:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(a_charger))), thread_name_prefix="portefeuille") as pool:
+            for nom, (sheets, version) in zip(a_charger, pool.map(propager(lire_chantier), a_charger)):
+                if sheets is not None:
+                    index[nom] = entree(sheets, version)
+        with stockage.lot(f"Index portefeuille ({len(a_charger)} chantier(s))") as lot:
+            _ecrire_index(lot, base_dir, index)
+    return {n: index[n] for n in chantiers if n in index}, a_charger
+
+
+def tableau(index):
+    """DataFrame Chantier x Zone (+ total par chantier) pour l'affichage."""
+    lignes = []
+    for nom, e in index.items():
+        zones = e.get("zones", {})
+        for zone, v in zones.items():
+            lignes.append({"Chantier": nom, "Zone": zone, **v})
+        if zones:
+            lignes.append({"Chantier": nom, "Zone": "TOTAL", **{k: sum(v[k] for v in zones.values()) for k in COLONNES.values()}})
+    df = pd.DataFrame(lignes, columns=["Chantier", "Zone", *COLONNES.values()])
+    df = df.rename(columns={"prevu": "Prévu (m3)", "consomme": "Consommé (m3)", "etude": "Étude (m3)", "reste": "Reste (m3)"})
+    prevu = df["Prévu (m3)"].astype(float)
+    df["Avancement (%)"] = (df["Consommé (m3)"].astype(float) / prevu.where(prevu > 0)).fillna(0) * 100
+    return df
@@ -0,0 +1,180 @@
+"""Rapports de fin de mois : récap PDF (et Excel) de tous les chantiers, dans un ZIP.
+
+Les classeurs sont lus en parallèle (threads : appels réseau) et les récaps
+calculés au fil de l'eau ; le rendu des PDF et des Excel, du Python pur
+cellule par cellule, part sur un pool de processus. Chaque chantier a ses
+durées (lecture, récap, PDF, Excel) dans le tableau retourné.
+
+Hors Streamlit :
+
+    python -m itb77.rapports --racine /copie/du/depot --sortie rapports.zip --excel
+    GITHUB_TOKEN=... python -m itb77.rapports --depot owner/ITB --sortie rapports.zip
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import types
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+
+import pandas as pd
+
+from itb77 import mesures
+from itb77.exports import donnees_excel, generer_excel_stylise, generer_pdf_recap
+from itb77.journal import fusionner, lire_journal
+from itb77.mesures import propager
+from itb77.recap import calculer_recaps, feuilles_acier, feuilles_recap
+from itb77.schema import lire_classeur
+from itb77.stockage import ajouter_options_stockage, stockage_depuis_options
+
+BASE_DIR_DEFAUT = "CHANTIERS_ITB77"
+WORKERS_LECTURE = 8
+WORKERS_RENDU = max(1, min(4, (os.cpu_count() or 2) - 1))
+COLONNES = ["Chantier", "Statut", "Lecture (ms)", "Récap (ms)", "PDF (ms)", "Excel (ms)", "Ko"]
+
+
+def lister_chantiers(stockage, base_dir):
+    try:
+        return sorted(c.name for c in stockage.lister(base_dir) if c.type == "dir")
+    except Exception:
+        return []
+
+
+def charger_chantier(stockage, base_dir, nom, avec_journal=False):
+    """Feuilles typées du classeur publié (+ journal), None si le chantier n'a pas de classeur."""
+    dossier = f"{base_dir}/{nom}"
+    try:
+        data = stockage.lire(f"{dossier}/{nom}.xlsx")
+    except Exception:
+        return None
+    sheets = lire_classeur(data)
+    if avec_journal:
+        journal, _ = lire_journal(stockage, dossier)
+        sheets = fusionner(sheets, journal)
+    return sheets
+
+
+def _preparer(lire_chantier, nom):
+    # Exécuté dans les threads de lecture ; l'exception est retournée pour ne pas arrêter le lot
+    try:
+        t0 = time.perf_counter()
+        sheets = lire_chantier(nom)
+        t1 = time.perf_counter()
+        recaps = calculer_recaps(*feuilles_recap(sheets), *feuilles_acier(sheets)) if sheets is not None else None
+        return sheets, recaps, t1 - t0, time.perf_counter() - t1
+    except Exception as e:
+        return e
+
+
+def _rendre(nom, recaps, excel):
+    # Exécuté dans un processus du pool : arguments et résultat passent par pickle
+    t0 = time.perf_counter()
+    pdf = generer_pdf_recap(recaps.beton, nom, recaps.acier)
+    t1 = time.perf_counter()
+    xlsx = generer_excel_stylise(excel) if excel is not None else None
+    return pdf, xlsx, t1 - t0, time.perf_counter() - t1
+
+
+@contextmanager
+def _pool_rendu(workers):
+    """Pool de processus (spawn : pas de fork d'un serveur qui tourne des threads).
+
+    Sous Streamlit, __main__ est le script de l'application, chargé par chemin :
+    un processus spawn le réexécuterait en entier avant de rendre quoi que ce
+    soit. Tous les workers sont donc démarrés d'emblée, __main__ masqué le
+    temps du démarrage.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    principal = sys.modules["__main__"]
+    if getattr(principal, "__spec__", None) is None:
+        sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        # Aucun worker n'est encore libre : chaque soumission en démarre un
+        for _ in range(workers):
+            pool.submit(os.getpid)
+    finally:
+        sys.modules["__main__"] = principal
+    with pool:
+        yield pool
+
+
+def generer_rapports(chantiers, lire_chantier, avec_excel=False, workers=WORKERS_RENDU,
+                     workers_lecture=WORKERS_LECTURE):
+    """Retourne (octets du ZIP, DataFrame des durées par chantier).
+
+    `lire_chantier(nom)` -> feuilles typées ou None ; appelé en parallèle.
+    Un chantier illisible, sans prévisionnel ou dont le rendu échoue est
+    signalé dans le tableau sans interrompre les autres.
+    """
+    lignes = {nom: {"Chantier": nom, "Statut": "ok"} for nom in chantiers}
+    fichiers = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers_lecture, len(chantiers) or 1)), thread_name_prefix="rapports") as lecture, \
+            _pool_rendu(max(1, min(workers, len(chantiers) or 1))) as rendu:
+        rendus = {}
+        for nom, prep in zip(chantiers, lecture.map(propager(partial(_preparer, lire_chantier)), chantiers)):
+            if isinstance(prep, Exception):
+                lignes[nom]["Statut"] = f"erreur lecture : {prep}"
+                continue
+            sheets, recaps, d_lecture, d_recap = prep
+            lignes[nom].update({"Lecture (ms)": d_lecture * 1000, "Récap (ms)": d_recap * 1000})
+            mesures.enregistrer("rapports.lecture", d_lecture)
+            mesures.enregistrer("rapports.recap", d_recap)
+            if sheets is None:
+                lignes[nom]["Statut"] = "classeur introuvable"
+            elif recaps.beton.empty:
+                lignes[nom]["Statut"] = "sans prévisionnel"
+            else:
+                excel = donnees_excel(recaps, *feuilles_recap(sheets), *feuilles_acier(sheets)) if avec_excel else None
+                rendus[nom] = rendu.submit(_rendre, nom, recaps, excel)
+        for nom, fut in rendus.items():
+            try:
+                pdf, xlsx, d_pdf, d_excel = fut.result()
+            except Exception as e:
+                lignes[nom]["Statut"] = f"erreur rendu : {e}"
+                continue
+            fichiers[f"Recap_{nom}.pdf"] = pdf
+            mesures.enregistrer("rapports.pdf", d_pdf, len(pdf))
+            lignes[nom].update({"PDF (ms)": d_pdf * 1000, "Ko": len(pdf) / 1024})
+            if xlsx is not None:
+                fichiers[f"Donnees_{nom}.xlsx"] = xlsx
+                mesures.enregistrer("rapports.excel", d_excel, len(xlsx))
+                lignes[nom].update({"Excel (ms)": d_excel * 1000, "Ko": lignes[nom]["Ko"] + len(xlsx) / 1024})
+    tampon = io.BytesIO()
+    with zipfile.ZipFile(tampon, "w", zipfile.ZIP_DEFLATED) as zf:
+        for chemin in sorted(fichiers):
+            zf.writestr(chemin, fichiers[chemin])
+    return tampon.getvalue(), pd.DataFrame(list(lignes.values()), columns=COLONNES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapports PDF (et Excel) de tous les chantiers ITB77 dans un ZIP")
+    ajouter_options_stockage(parser)
+    parser.add_argument("--base", default=BASE_DIR_DEFAUT, help="dossier des chantiers")
+    parser.add_argument("--chantiers", nargs="+", help="sous-ensemble de chantiers (défaut : tous)")
+    parser.add_argument("--journal", action="store_true", help="fusionner le journal (STOCKAGE_MODE = journal)")
+    parser.add_argument("--excel", action="store_true", help="ajouter le classeur Excel de chaque chantier")
+    parser.add_argument("--workers", type=int, default=WORKERS_RENDU, help="processus de rendu")
+    parser.add_argument("--sortie", default=f"Rapports_{datetime.now():%Y-%m}.zip")
+    args = parser.parse_args(argv)
+
+    stockage = stockage_depuis_options(args, parser)
+    chantiers = args.chantiers or lister_chantiers(stockage, args.base)
+    debut = time.perf_counter()
+    data, durees = generer_rapports(chantiers, partial(charger_chantier, stockage, args.base, avec_journal=args.journal),
+                                    args.excel, args.workers)
+    with open(args.sortie, "wb") as f:
+        f.write(data)
+    with pd.option_context("display.width", 200, "display.max_rows", None, "display.float_format", "{:.1f}".format):
+        print(durees.to_string(index=False))
+    print(f"{len(chantiers)} chantier(s), {len(data) / 1024:.0f} Ko -> {args.sortie} en {time.perf_counter() - debut:.1f} s")
+    return 1 if durees["Statut"].str.startswith("erreur").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""Moteur des récapitulatifs béton et acier (prévisionnel / étude vs quantités livrées).
+
+Règle d'attribution : un bon est affecté à la PREMIÈRE ligne du prévisionnel de
+même zone dont la désignation normalisée est contenue dans la désignation ou
+dans le type (de béton, d'acier) du bon. Les mots-clés du budget sont
+normalisés une seule fois, les textes distincts des deux feuilles de bons sont
+réunis et attribués en une passe, et le test de sous-chaîne est fait colonne
+par colonne (une passe vectorisée par mot-clé distinct) au lieu d'une double
+boucle bons x lignes budget. Les quantités sont ensuite cumulées par ligne :
+volumes béton face au prévu, poids acier face à l'étude acier (HA + TS).
+
+RecapMaterialise garde ces cumuls entre deux affichages (et dans le fichier
+`<chantier>/_recap.json`) : l'ajout de bons ne traite que les nouvelles lignes,
+une modification du prévisionnel ne réattribue que les zones touchées.
+"""
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from itb77.mesures import chronometre
+from itb77.nettoyage import remove_accents, detecter_zone_automatique
+from itb77.schema import typer_feuille
+from itb77.stockage import SANS_VERIFICATION
+
+NOM_SIDECAR = "_recap.json"
+VERSION_SIDECAR = 3
+# Feuille de bons -> (colonne type, colonne quantité)
+FEUILLES_BONS = {"Beton": ("Type de Beton", "Volume (m3)"), "Acier": ("Type d Acier", "Poids (kg)")}
+
+Recaps = namedtuple("Recaps", ["beton", "fondation", "acier"])
+
+
+def _normaliser(texte):
+    return remove_accents(texte.lower())
+
+
+class IndexBudget:
+    """Mots-clés et zones du prévisionnel, normalisés une fois par version du budget."""
+
+    def __init__(self, df_target):
+        self.mots_cles = [_normaliser(str(d).strip()) for d in df_target["Designation"]]
+        self.zones = df_target["Zone"].to_numpy(dtype=object)
+
+    def attribuer(self, noms_clean, types_clean, zones_bons):
+        """Position de la première ligne budget correspondante pour chaque texte (-1 si aucune)."""
+        positions = np.full(len(noms_clean), -1, dtype=np.int64)
+        if len(noms_clean) == 0:
+            return positions
+        s_noms = pd.Series(noms_clean, dtype=object)
+        s_types = pd.Series(types_clean, dtype=object)
+        contient = {}
+        for j, (mot_cle, zone) in enumerate(zip(self.mots_cles, self.zones)):
+            candidats = (positions == -1) & (zones_bons == zone)
+            # Une ligne budget sans désignation ne doit pas absorber tous les bons ("" est contenu partout)
+            if not mot_cle or not candidats.any():
+                continue
+            if mot_cle not in contient:
+                contient[mot_cle] = (
+                    s_noms.str.contains(mot_cle, regex=False).to_numpy(dtype=bool)
+                    | s_types.str.contains(mot_cle, regex=False).to_numpy(dtype=bool)
+                )
+            positions[candidats & contient[mot_cle]] = j
+            if (positions != -1).all():
+                break
+        return positions
+
+
+def _textes_bons(df_calc, col_type="Type de Beton"):
+    noms = df_calc["Designation"].map(str).str.strip()
+    if col_type in df_calc.columns:
+        types = df_calc[col_type].map(str).str.strip()
+    else:
+        types = pd.Series("", index=df_calc.index, dtype=object)
+    return noms, types
+
+
+def attribuer_feuilles(feuilles, index_budget):
+    """Positions budget des lignes de plusieurs feuilles [(df, colonne type)].
+
+    Les textes distincts de toutes les feuilles sont attribués ensemble : un
+    texte présent sur un bon béton et un bon acier n'est traité qu'une fois.
+    """
+    textes = [_textes_bons(df, col_type) for df, col_type in feuilles]
+    tailles = [len(noms) for noms, _ in textes]
+    if not sum(tailles):
+        return [np.empty(0, dtype=np.int64) for _ in feuilles]
+    paires = pd.DataFrame({
+        "nom": np.concatenate([noms.to_numpy(dtype=object) for noms, _ in textes]),
+        "type": np.concatenate([types.to_numpy(dtype=object) for _, types in textes]),
+    })
+    codes = paires.groupby(["nom", "type"], sort=False).ngroup().to_numpy()
+    uniques = paires.drop_duplicates()
+    zones = np.array(
+        [detecter_zone_automatique(n + " " + t) for n, t in zip(uniques["nom"], uniques["type"])],
+        dtype=object,
+    )
+    positions_uniques = index_budget.attribuer(
+        [_normaliser(n) for n in uniques["nom"]],
+        [_normaliser(t) for t in uniques["type"]],
+        zones,
+    )
+    return np.split(positions_uniques[codes], np.cumsum(tailles)[:-1])
+
+
+def _cumuler_quantites(quantites, positions, nb_lignes):
+    cumul = np.zeros(nb_lignes, dtype=np.float64)
+    attribues = positions >= 0
+    # np.add.at cumule dans l'ordre des bons : mêmes arrondis que l'addition ligne à ligne
+    np.add.at(cumul, positions[attribues], quantites[attribues])
+    return cumul
+
+
+def _cumuler(df_calc, df_target, positions):
+    """Volume Reel par ligne budget et détail des fondations par type de béton."""
+    volumes = df_calc["Volume (m3)"].to_numpy(dtype=np.float64)
+    volume_reel = _cumuler_quantites(volumes, positions, len(df_target))
+
+    fondation_details = {}
+    mots_fondation = [j for j, d in enumerate(df_target["Designation"]) if _normaliser(str(d).strip()) == "fondation"]
+    if mots_fondation:
+        masque = np.isin(positions, mots_fondation)
+        if masque.any():
+            types = df_calc["Type de Beton"].to_numpy(dtype=object)[masque]
+            codes, labels = pd.factorize(pd.Series(types, dtype=object), use_na_sentinel=False)
+            sommes = np.zeros(len(labels), dtype=np.float64)
+            np.add.at(sommes, codes, volumes[masque])
+            fondation_details = dict(zip(labels, sommes))
+    return volume_reel, fondation_details
+
+
+def _typer(df_beton, df_prev, df_etude_beton, df_acier=None, df_etude_acier=None):
+    """Entrées aux types du schéma ; sans copie ni conversion pour des feuilles lues par lire_classeur.
+
+    Feuilles acier : None reste None si les deux sont absentes (récap béton seul).
+    """
+    beton = (typer_feuille("Beton", df_beton), typer_feuille("Previsionnel", df_prev), typer_feuille("Etude_Beton", df_etude_beton))
+    if df_acier is None and df_etude_acier is None:
+        return beton + (None, None)
+    return beton + (typer_feuille("Acier", df_acier), typer_feuille("Etude_Acier", df_etude_acier))
+
+
+def _preparer(df_beton, df_prev, df_etude_beton):
+    return (df_beton,) + _preparer_cibles(df_prev, df_etude_beton)
+
+
+def _preparer_cibles(df_prev, df_etude_beton):
+    df_target = df_prev.copy()
+    df_target["Volume Reel"] = 0.0
+    return df_target, df_etude_beton
+
+
+def _finaliser(df_target, df_etude_val):
+    df_target = pd.merge(df_target, df_etude_val[["Designation", "Zone", "Etude (m3)"]], on=["Designation", "Zone"], how="left").fillna(0)
+    df_target["Reste (m3)"] = df_target["Prevu (m3)"] - df_target["Volume Reel"]
+    prevu = df_target["Prevu (m3)"].to_numpy(dtype=np.float64)
+    reel = df_target["Volume Reel"].to_numpy(dtype=np.float64)
+    avancement = np.zeros(len(df_target), dtype=np.float64)
+    np.divide(reel, prevu, out=avancement, where=prevu > 0)
+    df_target["Avancement (%)"] = avancement * 100
+    return df_target
+
+
+def _poids(df_acier):
+    return df_acier["Poids (kg)"].to_numpy(dtype=np.float64)
+
+
+def _finaliser_acier(df_target, poids_reel, df_etude_acier):
+    """Récap acier : étude HA / TS, poids livré, reste, avancement.
+
+    Une ligne par ligne du prévisionnel (les bons y sont attribués), puis une par
+    poste de l'étude acier absent du prévisionnel (rien de livré n'y est attribué).
+    """
+    # L'étude a une ligne par poste (quelques dizaines) : cumul par clé sans groupby / merge
+    etude = {}
+    ha_ts = [df_etude_acier[c].to_numpy(dtype=np.float64) for c in ("Acier HA", "Acier TS")]
+    for cle, ha, ts in zip(zip(df_etude_acier["Designation"], df_etude_acier["Zone"]), *ha_ts):
+        cumul = etude.setdefault(cle, [0.0, 0.0])
+        cumul[0] += ha
+        cumul[1] += ts
+    prevues = set(zip(df_target["Designation"], df_target["Zone"]))
+    hors_prev = [cle for cle in etude if cle not in prevues]
+    designations = np.array(list(df_target["Designation"]) + [d for d, _ in hors_prev], dtype=object)
+    zones = np.array(list(df_target["Zone"]) + [z for _, z in hors_prev], dtype=object)
+    poids_reel = np.concatenate([poids_reel, np.zeros(len(hors_prev), dtype=np.float64)])
+    ha, ts = np.array([etude.get(cle, (0.0, 0.0)) for cle in zip(designations, zones)], dtype=np.float64).reshape(-1, 2).T
+    etude_kg = ha + ts
+    avancement = np.zeros(len(etude_kg), dtype=np.float64)
+    np.divide(poids_reel, etude_kg, out=avancement, where=etude_kg > 0)
+    return pd.DataFrame({
+        "Designation": designations, "Zone": zones, "Acier HA": ha, "Acier TS": ts, "Etude (kg)": etude_kg,
+        "Poids Reel (kg)": poids_reel, "Reste (kg)": etude_kg - poids_reel, "Avancement (%)": avancement * 100,
+    })
+
+
+@chronometre("recap.complet")
+def calculer_recaps(df_beton, df_prev, df_etude_beton, df_acier=None, df_etude_acier=None):
+    """Récaps béton et acier en une passe : Recaps(beton, fondation, acier).
+
+    Vides si pas de prévisionnel ; `acier` vide si `df_acier` n'est pas fourni.
+    """
+    if df_prev.empty:
+        return Recaps(pd.DataFrame(), {}, pd.DataFrame())
+    sans_acier = df_acier is None
+    df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier = _typer(df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier)
+    df_calc, df_target, df_etude_val = _preparer(df_beton, df_prev, df_etude_beton)
+    if sans_acier:
+        # Béton seul (calculer_recap) : pas de récap acier
+        pos_beton, = attribuer_feuilles([(df_calc, "Type de Beton")], IndexBudget(df_target))
+    else:
+        pos_beton, pos_acier = attribuer_feuilles([(df_calc, "Type de Beton"), (df_acier, "Type d Acier")], IndexBudget(df_target))
+    volume_reel, fondation_details = _cumuler(df_calc, df_target, pos_beton)
+    df_target["Volume Reel"] = volume_reel
+    if sans_acier:
+        return Recaps(_finaliser(df_target, df_etude_val), fondation_details, pd.DataFrame())
+    poids_reel = _cumuler_quantites(_poids(df_acier), pos_acier, len(df_target))
+    return Recaps(_finaliser(df_target, df_etude_val), fondation_details, _finaliser_acier(df_target, poids_reel, df_etude_acier))
+
+
+def calculer_recap(df_beton, df_prev, df_etude_beton):
+    """Retourne (df_recap, fondation_details) ; df_recap est vide si pas de prévisionnel."""
+    recaps = calculer_recaps(df_beton, df_prev, df_etude_beton)
+    return recaps.beton, recaps.fondation
+
+
+def _feuille(sheets, nom):
+    # Feuille sans désignation : ignorée (une désignation vide correspondrait à tous les bons)
+    df = sheets.get(nom)
+    return typer_feuille(nom, df if df is not None and "Designation" in df.columns else None)
+
+
+def feuilles_recap(sheets):
+    """(df_beton, df_prev, df_etude_beton) d'un classeur, typées ; feuilles absentes remplacées par des feuilles vides."""
+    return _feuille(sheets, "Beton"), _feuille(sheets, "Previsionnel"), _feuille(sheets, "Etude_Beton")
+
+
+def feuilles_acier(sheets):
+    """(df_acier, df_etude_acier) d'un classeur, à la suite de feuilles_recap."""
+    return _feuille(sheets, "Acier"), _feuille(sheets, "Etude_Acier")
+
+
+def _budget(df_prev):
+    """Index et [(mot-clé, zone)] du prévisionnel, dans l'ordre des lignes."""
+    index = IndexBudget(df_prev[["Designation", "Zone"]])
+    return index, [(m, str(z)) for m, z in zip(index.mots_cles, index.zones)]
+
+
+def _rangs(budget):
+    """Rang de chaque ligne parmi les lignes de sa zone : l'attribution d'un bon ne dépend que de sa zone."""
+    vus, rangs = {}, []
+    for _, zone in budget:
+        rangs.append(vus.get(zone, 0))
+        vus[zone] = rangs[-1] + 1
+    return rangs
+
+
+def _empreinte(hashes):
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+class _Suivi:
+    """Cumuls d'une feuille de bons : (désignation, type, type brut) -> [zone du bon, rang, quantité cumulée]."""
+
+    def __init__(self):
+        self.nb_bons = 0
+        self.version = None
+        self.empreinte = _empreinte(np.empty(0, dtype=np.uint64))
+        self.paires = {}
+
+    @classmethod
+    def depuis_dict(cls, d):
+        suivi = cls()
+        suivi.nb_bons, suivi.empreinte, suivi.version = d["nb_bons"], d["empreinte"], d.get("version_chantier")
+        suivi.paires = {(n, t, b): [z, r, v] for n, t, b, z, r, v in d["paires"]}
+        return suivi
+
+    def en_dict(self):
+        return {"nb_bons": self.nb_bons, "empreinte": self.empreinte, "version_chantier": self.version,
+                "paires": [[*k, *v] for k, v in self.paires.items()]}
+
+
+class RecapMaterialise:
+    """Quantités cumulées par texte de bon distinct (béton et acier), tenues à jour au fil des ajouts.
+
+    Pour chaque feuille de bons, `paires` : (désignation, type, type brut) ->
+    [zone du bon, rang de la ligne budget dans cette zone (-1 : non attribué),
+    quantité cumulée]. Les quantités par ligne budget s'en déduisent sans
+    relire les bons. Les lignes de bons déjà cumulées sont contrôlées par
+    empreinte : si elles ont changé (et pas seulement été complétées), la
+    feuille est recalculée. Ce contrôle est sauté quand l'appelant fournit la
+    même `version` de chantier que lors du dernier calcul de la feuille.
+    """
+
+    def __init__(self):
+        self.budget = []
+        self.suivis = {feuille: _Suivi() for feuille in FEUILLES_BONS}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def depuis_json(cls, data):
+        d = json.loads(data)
+        etat = cls()
+        if d.get("version") != VERSION_SIDECAR: return etat
+        etat.budget = [tuple(b) for b in d["budget"]]
+        etat.suivis.update((f, _Suivi.depuis_dict(v)) for f, v in d["feuilles"].items() if f in FEUILLES_BONS)
+        return etat
+
+    def en_json(self):
+        with self.lock:
+            return json.dumps({
+                "version": VERSION_SIDECAR, "budget": self.budget,
+                "feuilles": {f: suivi.en_dict() for f, suivi in self.suivis.items()},
+            }, ensure_ascii=False).encode("utf-8")
+
+    def _attribuer(self, cles, index, rangs):
+        """cles : [(paires, clé)] ; chaque texte (désignation, type) distinct n'est attribué qu'une fois."""
+        if not cles: return
+        textes = {}
+        for paires, k in cles:
+            textes.setdefault(k[:2], paires[k][0])
+        positions = index.attribuer(
+            [_normaliser(n) for n, _ in textes], [_normaliser(t) for _, t in textes], np.array(list(textes.values()), dtype=object)
+        )
+        rang = {texte: rangs[j] if j >= 0 else -1 for texte, j in zip(textes, positions)}
+        for paires, k in cles:
+            paires[k][1] = rang[k[:2]]
+
+    def _cumuler(self, suivi, feuille, df):
+        """Ajoute au suivi les lignes de `df` au-delà de celles déjà cumulées ; retourne les clés inédites."""
+        col_type, col_qte = FEUILLES_BONS[feuille]
+        hashes = pd.util.hash_pandas_object(df[["Designation", col_qte, col_type]], index=False).to_numpy()
+        if len(hashes) < suivi.nb_bons or _empreinte(hashes[:suivi.nb_bons]) != suivi.empreinte:
+            suivi.nb_bons, suivi.paires = 0, {}
+        nouveaux = df.iloc[suivi.nb_bons:]
+        inedites = []
+        if len(nouveaux):
+            noms, types = _textes_bons(nouveaux, col_type)
+            ajout = pd.DataFrame({
+                "nom": noms.to_numpy(dtype=object), "type": types.to_numpy(dtype=object),
+                "brut": nouveaux[col_type].to_numpy(dtype=object), "qte": nouveaux[col_qte].to_numpy(dtype=np.float64),
+            })
+            for cle, qte in ajout.groupby(["nom", "type", "brut"], sort=False)["qte"].sum().items():
+                if cle in suivi.paires:
+                    suivi.paires[cle][2] += qte
+                else:
+                    suivi.paires[cle] = [detecter_zone_automatique(cle[0] + " " + cle[1]), -1, qte]
+                    inedites.append((suivi.paires, cle))
+        suivi.nb_bons, suivi.empreinte = len(hashes), _empreinte(hashes)
+        return inedites
+
+    def _actualiser(self, feuilles, df_prev, version):
+        index, budget = _budget(df_prev)
+        rangs = _rangs(budget)
+        a_attribuer = []
+        if budget != self.budget:
+            # Seules les zones dont la liste ordonnée de mots-clés a changé sont réattribuées
+            avant = {}
+            for m, z in self.budget: avant.setdefault(z, []).append(m)
+            apres = {}
+            for m, z in budget: apres.setdefault(z, []).append(m)
+            touchees = {z for z in avant.keys() | apres.keys() if avant.get(z) != apres.get(z)}
+            self.budget = budget
+            for suivi in self.suivis.values():
+                a_attribuer += [(suivi.paires, k) for k, v in suivi.paires.items() if v[0] in touchees]
+
+        for feuille, df in feuilles.items():
+            suivi = self.suivis[feuille]
+            if version is not None and version == suivi.version and len(df) == suivi.nb_bons:
+                continue
+            a_attribuer += self._cumuler(suivi, feuille, df)
+            suivi.version = version
+        # Textes inédits des deux feuilles et paires des zones touchées : une seule attribution
+        self._attribuer(a_attribuer, index, rangs)
+
+    def _quantites(self, suivi, fondation=False):
+        position = {(z, r): j for j, ((_, z), r) in enumerate(zip(self.budget, _rangs(self.budget)))}
+        quantites = np.zeros(len(self.budget), dtype=np.float64)
+        fondation_details = {}
+        for (_, _, brut), (zone, rang, qte) in suivi.paires.items():
+            if rang < 0: continue
+            j = position[(zone, rang)]
+            quantites[j] += qte
+            if fondation and self.budget[j][0] == "fondation":
+                cle = np.nan if brut is None else brut
+                fondation_details[cle] = fondation_details.get(cle, 0.0) + qte
+        return quantites, fondation_details
+
+    @chronometre("recap.incremental")
+    def recaps(self, df_beton, df_prev, df_etude_beton, df_acier=None, df_etude_acier=None, version=None):
+        """Même résultat que calculer_recaps (aux arrondis d'addition près), en incrémental.
+
+        `version` : identifiant du contenu des bons (sha du classeur + journal), s'il est connu.
+        """
+        if df_prev.empty:
+            return Recaps(pd.DataFrame(), {}, pd.DataFrame())
+        df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier = _typer(
+            df_beton, df_prev, df_etude_beton, typer_feuille("Acier", df_acier), df_etude_acier
+        )
+        with self.lock:
+            self._actualiser({"Beton": df_beton, "Acier": df_acier}, df_prev, version)
+            volume_reel, fondation_details = self._quantites(self.suivis["Beton"], fondation=True)
+            poids_reel, _ = self._quantites(self.suivis["Acier"])
+        df_target, df_etude_val = _preparer_cibles(df_prev, df_etude_beton)
+        df_target["Volume Reel"] = volume_reel
+        return Recaps(_finaliser(df_target, df_etude_val), fondation_details, _finaliser_acier(df_target, poids_reel, df_etude_acier))
+
+
+_ETATS = {}
+_lock_etats = threading.Lock()
+
+
+def chemin_sidecar(dossier_chantier):
+    return f"{dossier_chantier}/{NOM_SIDECAR}"
+
+
+def recap_materialise(stockage, dossier_chantier):
+    """État du chantier pour ce processus ; repris du sidecar au premier accès."""
+    etat = _ETATS.get(dossier_chantier)
+    if etat is not None:
+        return etat
+    try:
+        etat = RecapMaterialise.depuis_json(stockage.lire(chemin_sidecar(dossier_chantier)))
+    except Exception:
+        etat = RecapMaterialise()
+    with _lock_etats:
+        return _ETATS.setdefault(dossier_chantier, etat)
+
+
+def ecrire_sidecar(lot, dossier_chantier, etat):
+    # Fichier dérivé : écrasé sans contrôle, recalculé s'il ne correspond plus aux bons
+    lot.ecrire(chemin_sidecar(dossier_chantier), etat.en_json(), SANS_VERIFICATION)
@@ -0,0 +1,147 @@
+"""Structure des classeurs de chantier : dossiers, colonnes et types, prévisionnel standard.
+
+Aussi la (dé)sérialisation des classeurs, partagée par l'application et les outils hors Streamlit.
+Les feuilles sont typées une fois, à la lecture (`typer_feuille`) : textes
+répétitifs des bons en catégories, zones en catégories, quantités en float64
+(écrites telles quelles : le classeur ne perd aucun chiffre), valeurs absentes remplacées par le défaut de la colonne. Le reste du code
+travaille sur ces feuilles typées sans reconvertir.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from itb77.mesures import chronometre
+
+BASE_DIR = "CHANTIERS_ITB77"
+ZONES = ["INFRA", "SUPER"]
+
+# Genres de colonne : type en mémoire et valeur par défaut
+CATEGORIE, TEXTE, ZONE, QUANTITE = "categorie", "texte", "zone", "quantite"
+DEFAUTS = {CATEGORIE: "", TEXTE: "", ZONE: "INFRA", QUANTITE: 0.0}
+
+# Feuille -> {colonne: genre}, dans l'ordre des colonnes du classeur.
+# Désignations en catégories sur les bons (répétées) ; texte sur le prévisionnel et les études (une ligne par poste).
+SCHEMA = {
+    "Beton": {"Fournisseur": CATEGORIE, "Designation": CATEGORIE, "Type de Beton": CATEGORIE, "Volume (m3)": QUANTITE},
+    "Acier": {"Fournisseur": CATEGORIE, "Type d Acier": CATEGORIE, "Designation": CATEGORIE, "Poids (kg)": QUANTITE},
+    "Previsionnel": {"Designation": TEXTE, "Prevu (m3)": QUANTITE, "Zone": ZONE},
+    "Etude_Beton": {"Designation": TEXTE, "Etude (m3)": QUANTITE, "Zone": ZONE},
+    "Etude_Acier": {"Designation": TEXTE, "Acier HA": QUANTITE, "Acier TS": QUANTITE, "Zone": ZONE},
+}
+COLS_BETON = list(SCHEMA["Beton"])
+COLS_ACIER = list(SCHEMA["Acier"])
+COLS_PREV = list(SCHEMA["Previsionnel"])
+COLS_ETUDE_BETON = list(SCHEMA["Etude_Beton"])
+COLS_ETUDE_ACIER = list(SCHEMA["Etude_Acier"])
+COLS_QUANTITES = {c for cols in SCHEMA.values() for c, genre in cols.items() if genre == QUANTITE}
+
+# LISTE STANDARD POUR INITIALISATION
+STANDARD_ITEMS = [
+    {"Designation": "Pieux / Micropieu", "Zone": "INFRA"},
+    {"Designation": "Fondation", "Zone": "INFRA"},
+    {"Designation": "Semelle", "Zone": "INFRA"},
+    {"Designation": "Longrine", "Zone": "INFRA"},
+    {"Designation": "Voile", "Zone": "INFRA"},
+    {"Designation": "Poteau", "Zone": "INFRA"},
+    {"Designation": "Poutre", "Zone": "INFRA"},
+    {"Designation": "Dalle", "Zone": "INFRA"},
+    {"Designation": "Plancher Haut", "Zone": "INFRA"},
+    {"Designation": "Voile", "Zone": "SUPER"},
+    {"Designation": "Poteau", "Zone": "SUPER"},
+    {"Designation": "Poutre", "Zone": "SUPER"},
+    {"Designation": "Dalle", "Zone": "SUPER"},
+    {"Designation": "Acrotère", "Zone": "SUPER"},
+    {"Designation": "Édicule", "Zone": "SUPER"},
+    {"Designation": "Plancher Haut", "Zone": "SUPER"},
+    {"Designation": "Balcons", "Zone": "SUPER"},
+    {"Designation": "Divers", "Zone": "SUPER"},
+]
+
+
+def _est_type(serie, genre):
+    if genre == QUANTITE:
+        return serie.dtype == np.float64 and not serie.isna().any()
+    if genre == TEXTE:
+        return pd.api.types.is_string_dtype(serie.dtype) and not serie.isna().any()
+    return isinstance(serie.dtype, pd.CategoricalDtype) and not serie.isna().any()
+
+
+def _typer(serie, genre):
+    if genre == QUANTITE:
+        return pd.to_numeric(serie, errors='coerce').fillna(0).astype(np.float64)
+    textes = serie.astype(object).where(serie.notna(), DEFAUTS[genre]).astype(str)
+    if genre == TEXTE:
+        return textes
+    if genre == ZONE:
+        return pd.Categorical(textes, categories=ZONES + sorted(set(textes.unique()) - set(ZONES)))
+    return textes.astype("category")
+
+
+def typer_feuille(feuille, df=None):
+    """`df` aux types du schéma de `feuille` (vide si None) : colonnes manquantes ajoutées, valeurs absentes remplacées.
+
+    Les colonnes hors schéma sont gardées telles quelles ; une feuille déjà typée est retournée sans copie.
+    """
+    schema = SCHEMA.get(feuille)
+    if schema is None:
+        return df
+    if df is None:
+        df = pd.DataFrame(columns=list(schema))
+    a_typer = [c for c, genre in schema.items() if c not in df.columns or not _est_type(df[c], genre)]
+    if not a_typer:
+        return df
+    df = df.copy()
+    for c in a_typer:
+        df[c] = _typer(df[c] if c in df.columns else pd.Series(DEFAUTS[schema[c]], index=df.index), schema[c])
+    return df
+
+
+def typer_classeur(sheets):
+    return {feuille: typer_feuille(feuille, df) for feuille, df in sheets.items()}
+
+
+def concatener(feuille, df, lignes):
+    """`df` (typée) suivie de `lignes`, typées de même ; les catégories sont réunies sans retyper `df`."""
+    lignes = typer_feuille(feuille, lignes)
+    res = pd.concat([df, lignes], ignore_index=True)
+    for c, genre in SCHEMA.get(feuille, {}).items():
+        if genre in (CATEGORIE, ZONE) and c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype):
+            res[c] = union_categoricals([df[c], lignes[c]], ignore_order=True)
+    return res
+
+
+def valeurs_decimales(serie):
+    """Colonne float32 en float64 sans artefact d'arrondi (3.2 et non 3.2000000476837...) pour l'écriture."""
+    return serie.astype(str).astype(np.float64)
+
+
+def pour_ecriture(df):
+    """Copie de `df` prête à écrire : quantités en décimaux float64.
+
+    Les colonnes déjà en float64 sont écrites sans conversion ; seules les
+    colonnes float32 passent par leur représentation la plus courte.
+    """
+    conv = {}
+    for c in df.columns:
+        if df[c].dtype == np.float32:
+            conv[c] = valeurs_decimales(df[c])
+        elif c in COLS_QUANTITES and not pd.api.types.is_float_dtype(df[c].dtype):
+            conv[c] = pd.to_numeric(df[c], errors='coerce')
+    return df.assign(**conv) if conv else df
+
+
+@chronometre("excel.serialiser", octets=lambda data, sheets: len(data))
+def serialiser_classeur(sheets):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet, df in sheets.items():
+            pour_ecriture(df).to_excel(writer, sheet_name=sheet, index=False)
+    return output.getvalue()
+
+
+@chronometre("excel.lire", octets=lambda sheets, data: len(data))
+def lire_classeur(data):
+    """Feuilles du classeur, typées selon le schéma."""
+    return typer_classeur(pd.read_excel(io.BytesIO(data), sheet_name=None))
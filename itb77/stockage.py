@@ -0,0 +1,363 @@
+"""Accès aux fichiers des chantiers, derrière une interface commune.
+
+- StockageGithub : le dépôt GitHub via PyGithub (comportement historique).
+- StockageLocal : une copie de travail sur disque qui reproduit l'arborescence
+  `CHANTIERS_ITB77/` du dépôt. Lectures locales immédiates ; si un
+  StockageGithub lui est donné en `synchro`, chaque écriture est répliquée sur
+  GitHub par un thread de fond.
+
+Plusieurs écritures liées (scan + classeur) se groupent dans un Lot, publié
+d'un bloc : un seul commit sur GitHub (itb77.commits), toutes les écritures ou
+aucune en local.
+
+Les chemins sont toujours relatifs à la racine du dépôt, séparés par "/". Les
+sha de fichiers sont des sha de blob git dans les deux backends, donc les caches
+indexés par sha (classeurs, journal) restent valables quel que soit le backend.
+"""
+import base64
+import hashlib
+import os
+import queue
+import threading
+from collections import namedtuple
+
+# Mêmes attributs que les ContentFile PyGithub utilisés par l'application
+Entree = namedtuple("Entree", "name path type sha")
+
+
+# sha attendu d'une écriture de lot qui écrase sans contrôle (fichiers dérivés, ex. index)
+SANS_VERIFICATION = "*"
+
+
+class ConflitStockage(Exception):
+    """Le fichier a changé depuis la lecture (sha périmé) ou existe déjà."""
+
+
+def sha_blob(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class Lot:
+    """Écritures et suppressions collectées puis publiées ensemble.
+
+        with stockage.lot("Bon béton") as lot:
+            lot.ecrire(path_scan, data)
+            lot.ecrire(path_xlsx, contenu, sha)
+
+    Publié à la sortie du bloc s'il n'y a pas eu d'exception. `apres` reçoit des
+    fonctions appelées une fois la publication réussie (cache, etc.).
+    """
+
+    def __init__(self, stockage, message):
+        self.stockage = stockage
+        self.message = message
+        self.operations = {}  # path -> (bytes ou None pour supprimer, sha attendu)
+        self.apres = []
+
+    def __contains__(self, path):
+        return path in self.operations
+
+    def ecrire(self, path, data, sha=None):
+        """Retourne le sha du blob, connu avant publication."""
+        if isinstance(data, str): data = data.encode("utf-8")
+        self.operations[path] = (data, sha)
+        return sha_blob(data)
+
+    def supprimer(self, path, sha):
+        self.operations[path] = (None, sha)
+
+    def shas(self):
+        """{path: sha du blob après publication, None si supprimé}."""
+        return {p: sha_blob(data) if data is not None else None for p, (data, _) in self.operations.items()}
+
+    def publier(self):
+        if not self.operations: return None
+        res = self.stockage.publier(self.message, self.operations)
+        for fn in self.apres: fn()
+        return res
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.publier()
+        return False
+
+
+class StockageGithub:
+    def __init__(self, repo):
+        self.repo = repo
+
+    def lire(self, path):
+        content = self.repo.get_contents(path)
+        if content.encoding == "none" or not content.content:
+            # Fichiers > 1 Mo : l'API contents ne renvoie pas le contenu
+            return self._blob(content.sha)
+        return content.decoded_content
+
+    def _blob(self, sha):
+        blob = self.repo.get_git_blob(sha)
+        return base64.b64decode(blob.content) if blob.encoding == "base64" else blob.content.encode()
+
+    def lire_blob(self, path, sha):
+        return self._blob(sha)
+
+    def lister(self, path):
+        contents = self.repo.get_contents(path)
+        if not isinstance(contents, list): contents = [contents]
+        return [Entree(c.name, c.path, c.type, c.sha) for c in contents]
+
+    def lister_recursif(self, path):
+        """Fichiers sous `path` (chemins relatifs à `path`) en un seul appel d'arbre git."""
+        parent, nom = path.rsplit("/", 1) if "/" in path else ("", path)
+        for c in self.lister(parent):
+            if c.name == nom and c.type == "dir":
+                arbre = self.repo.get_git_tree(c.sha, recursive=True).tree
+                return [Entree(e.path.split("/")[-1], e.path, "file", e.sha) for e in arbre if e.type == "blob"]
+        return []
+
+    def sha(self, path):
+        # Le listing du dossier ne renvoie que les métadonnées (pas le contenu du fichier)
+        parent = path.rsplit("/", 1)[0] if "/" in path else ""
+        try:
+            for c in self.lister(parent):
+                if c.path == path: return c.sha
+        except Exception: pass
+        return None
+
+    def ecrire(self, path, data, message, sha=None):
+        from github import GithubException
+        try:
+            if sha: res = self.repo.update_file(path, message, data, sha)
+            else: res = self.repo.create_file(path, message, data)
+        except GithubException as e:
+            if e.status in (409, 422): raise ConflitStockage(str(e)) from e
+            raise
+        return res["content"].sha
+
+    def supprimer(self, path, message, sha):
+        self.repo.delete_file(path, message, sha)
+
+    def lot(self, message):
+        return Lot(self, message)
+
+    def publier(self, message, operations, verifier=True):
+        """Un seul commit pour tout le lot (API Git Data) ; retourne son sha."""
+        from itb77.commits import DepotGithub, publier_lot
+        return publier_lot(DepotGithub(self.repo), message, operations, verifier)
+
+
+class StockageLocal:
+    def __init__(self, racine, synchro=None):
+        self.racine = os.path.abspath(racine)
+        self.synchro = synchro
+        self._shas = {}  # chemin -> (mtime_ns, taille, sha)
+        self._lock_shas = threading.Lock()  # le cache seul ; _lock sérialise les écritures
+        self._lock = threading.Lock()
+        self._file = None
+        self.synchro_erreurs = []
+        if synchro is not None:
+            self._file = queue.Queue()
+            threading.Thread(target=self._boucle_synchro, name="synchro-github", daemon=True).start()
+
+    def _abs(self, path):
+        return os.path.join(self.racine, *path.split("/")) if path else self.racine
+
+    def lire(self, path):
+        with open(self._abs(path), "rb") as f:
+            return f.read()
+
+    def lire_blob(self, path, sha):
+        return self.lire(path)
+
+    def _sha_fichier(self, chemin):
+        st_ = os.stat(chemin)
+        with self._lock_shas:
+            connu = self._shas.get(chemin)
+        if connu is not None and connu[:2] == (st_.st_mtime_ns, st_.st_size):
+            return connu[2]
+        with open(chemin, "rb") as f:
+            sha = sha_blob(f.read())
+        with self._lock_shas:
+            self._shas[chemin] = (st_.st_mtime_ns, st_.st_size, sha)
+        return sha
+
+    def _noter_sha(self, chemin, data):
+        # Fichier que l'on vient d'écrire : son sha est connu, inutile de le relire
+        st_ = os.stat(chemin)
+        with self._lock_shas:
+            self._shas[chemin] = (st_.st_mtime_ns, st_.st_size, sha_blob(data))
+
+    def _sha_dossier(self, chemin):
+        # Jeton de version (pas un vrai sha d'arbre git) : date du dossier et de ses
+        # entrées directes. Les écritures passent par un renommage dans le dossier du
+        # fichier, qui change la date de ce dossier : sans parcourir tout le sous-arbre
+        h = hashlib.sha1(str(os.stat(chemin).st_mtime_ns).encode())
+        with os.scandir(chemin) as entrees:
+            for e in sorted(entrees, key=lambda e: e.name):
+                st_ = e.stat()
+                h.update(f"{e.name}:{st_.st_size}:{st_.st_mtime_ns}".encode())
+        return h.hexdigest()
+
+    def lister(self, path):
+        dossier = self._abs(path)
+        if not os.path.isdir(dossier):
+            raise FileNotFoundError(path)
+        entrees = []
+        for nom in sorted(os.listdir(dossier)):
+            chemin = os.path.join(dossier, nom)
+            p = f"{path}/{nom}" if path else nom
+            if os.path.isdir(chemin):
+                entrees.append(Entree(nom, p, "dir", self._sha_dossier(chemin)))
+            else:
+                entrees.append(Entree(nom, p, "file", self._sha_fichier(chemin)))
+        return entrees
+
+    def lister_recursif(self, path):
+        dossier = self._abs(path)
+        entrees = []
+        for racine, dirs, fichiers in os.walk(dossier):
+            dirs.sort()
+            for nom in sorted(fichiers):
+                chemin = os.path.join(racine, nom)
+                rel = os.path.relpath(chemin, dossier).replace(os.sep, "/")
+                entrees.append(Entree(nom, rel, "file", self._sha_fichier(chemin)))
+        return entrees
+
+    def sha(self, path):
+        chemin = self._abs(path)
+        return self._sha_fichier(chemin) if os.path.isfile(chemin) else None
+
+    def ecrire(self, path, data, message, sha=None):
+        if isinstance(data, str): data = data.encode("utf-8")
+        chemin = self._abs(path)
+        with self._lock:
+            actuel = self.sha(path)
+            if actuel is not None and actuel != sha:
+                raise ConflitStockage(f"{path} : sha {sha} périmé (actuel {actuel})")
+            if actuel is None and sha:
+                raise ConflitStockage(f"{path} n'existe plus")
+            os.makedirs(os.path.dirname(chemin), exist_ok=True)
+            tmp = f"{chemin}.tmp-{threading.get_ident()}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, chemin)
+            self._noter_sha(chemin, data)
+        if self._file is not None:
+            self._file.put(("ecrire", path, data, message))
+        return sha_blob(data)
+
+    def supprimer(self, path, message, sha):
+        with self._lock:
+            if self.sha(path) != sha:
+                raise ConflitStockage(f"{path} : sha {sha} périmé")
+            os.remove(self._abs(path))
+        if self._file is not None:
+            self._file.put(("supprimer", path, None, message))
+
+    def lot(self, message):
+        return Lot(self, message)
+
+    def publier(self, message, operations):
+        """Tout le lot ou rien : si une écriture échoue, les fichiers déjà remplacés sont restaurés."""
+        with self._lock:
+            for path, (_, attendu) in operations.items():
+                if attendu != SANS_VERIFICATION and self.sha(path) != attendu:
+                    raise ConflitStockage(f"{path} : sha {attendu} périmé")
+            suffixe = threading.get_ident()
+            # 1. Nouveaux contenus écrits à côté des fichiers : rien n'est encore modifié
+            temporaires = {}
+            try:
+                for path, (data, _) in operations.items():
+                    if data is None: continue
+                    chemin = self._abs(path)
+                    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+                    temporaires[path] = f"{chemin}.tmp-{suffixe}"
+                    with open(temporaires[path], "wb") as f:
+                        f.write(data)
+                # 2. Renommages : l'ancien fichier est mis de côté, puis remplacé ou laissé supprimé
+                faits = []  # (chemin, sauvegarde ou None si le fichier n'existait pas, nouveau fichier en place)
+                try:
+                    for path, (data, _) in operations.items():
+                        chemin = self._abs(path)
+                        sauvegarde = None
+                        if data is None or os.path.exists(chemin):
+                            sauvegarde = f"{chemin}.bak-{suffixe}"
+                            os.replace(chemin, sauvegarde)
+                        faits.append((chemin, sauvegarde, False))
+                        if data is not None:
+                            os.replace(temporaires[path], chemin)
+                            del temporaires[path]
+                            faits[-1] = (chemin, sauvegarde, True)
+                except BaseException:
+                    for chemin, sauvegarde, en_place in reversed(faits):
+                        if en_place: os.remove(chemin)
+                        if sauvegarde: os.replace(sauvegarde, chemin)
+                    raise
+            finally:
+                for tmp in temporaires.values():
+                    if os.path.exists(tmp): os.remove(tmp)
+            # 3. Publié : les sauvegardes ne servent plus
+            for chemin, sauvegarde, en_place in faits:
+                if sauvegarde:
+                    try: os.remove(sauvegarde)
+                    except OSError: pass
+            for path, (data, _) in operations.items():
+                if data is not None: self._noter_sha(self._abs(path), data)
+        if self._file is not None:
+            self._file.put(("lot", None, dict(operations), message))
+
+    def _boucle_synchro(self):
+        while True:
+            op, path, data, message = self._file.get()
+            # Écritures isolées publiées comme un lot d'un fichier : un commit sans
+            # relire le sha distant (pas de listing du dossier par fichier)
+            operations = data if op == "lot" else {path: (data, SANS_VERIFICATION)}
+            try:
+                try:
+                    # Dernier écrit gagne : aucun sha attendu n'est vérifié
+                    self.synchro.publier(message, operations, verifier=False)
+                except ConflitStockage:
+                    # La branche a avancé pendant la publication : une reprise sur la nouvelle tête
+                    self.synchro.publier(message, operations, verifier=False)
+            except Exception as e:
+                self.synchro_erreurs.append(f"{op} {path}: {e}")
+                print(f"Erreur synchro GitHub {op} {path}: {e}")
+            finally:
+                self._file.task_done()
+
+    def synchro_en_attente(self):
+        return self._file.qsize() if self._file is not None else 0
+
+
+def creer_stockage(backend, repo=None, racine=".", synchro_github=False):
+    """backend : "github" (défaut) ou "local" (copie de travail sous `racine`)."""
+    if backend == "local":
+        synchro = StockageGithub(repo) if synchro_github and repo is not None else None
+        return StockageLocal(racine, synchro)
+    return StockageGithub(repo)
+
+
+def ajouter_options_stockage(parser):
+    """Options --racine / --depot des outils en ligne de commande."""
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--racine", help="copie de travail locale du dépôt")
+    source.add_argument("--depot", help="dépôt GitHub owner/nom (jeton dans GITHUB_TOKEN)")
+
+
+def connecter_github(token, nom_depot):
+    """Dépôt PyGithub dont chaque appel est mesuré ; PyGithub n'est importé qu'ici."""
+    from itb77.demarrage import charger
+    from itb77.mesures import Instrumente, mesurer
+    github = charger("github")
+    with mesurer("github.connexion"):
+        return Instrumente(github.Github(auth=github.Auth.Token(token)).get_repo(nom_depot))
+
+
+def stockage_depuis_options(args, parser):
+    if args.depot:
+        token = os.environ.get("GITHUB_TOKEN")
+        if not token:
+            parser.error("GITHUB_TOKEN absent de l'environnement")
+        return creer_stockage("github", connecter_github(token, args.depot))
+    return creer_stockage("local", racine=args.racine)
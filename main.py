@@ -1,65 +1,110 @@
+import time
+_debut_imports = time.perf_counter()
 import streamlit as st
 import pandas as pd
-import base64
-import requests
-import json
-import io
-import unicodedata
-from github import Github, Auth
-from PIL import Image
-import pillow_heif
 from datetime import datetime
-from fpdf import FPDF
-import xlsxwriter
-import google.generativeai as genai
-import time
+import functools
+import uuid
+from itb77.cache_classeurs import CACHE_CLASSEURS
+from itb77.nettoyage import preparer_relecture, DECLENCHEURS_DITTO
+from itb77.ocr import LIMITEUR_OCR, OCR_WORKERS_DEFAUT, OCR_REQUETES_PAR_MINUTE_DEFAUT, RESOLVEUR_MODELE, MODELE_TTL_DEFAUT, configurer, extraire_bon, analyser_lot, schema_reponse
+from itb77.correspondance import index_budget
+from itb77.fusion import Delta, publier_avec_reprise, ESSAIS_DEFAUT as ESSAIS_FUSION_DEFAUT
+from itb77.recap import recap_materialise
+from itb77 import demarrage, doublons, exports, ingestion, mesures, rapports
+from itb77.ingestion import DOCUMENTS
+from itb77.cache_ocr import CACHE_OCR, OCTETS_MAX_DEFAUT as CACHE_OCR_OCTETS_DEFAUT
+from itb77.exports import generer_excel_stylise, generer_pdf_recap
+from itb77.images import pretraiter_image, blob_image, empreinte_perceptuelle, COTE_MAX_OCR
+from itb77.journal import ajouter_entree, lire_journal, fusionner, nb_entrees_en_attente, compacter
+from itb77.pointages import lister_photos, paginer, miniatures, ajouter_photo, supprimer_photo, PAR_PAGE_DEFAUT
+from itb77.portefeuille import charger_portefeuille, shas_journal, version_chantier, tableau as tableau_portefeuille
+from itb77.schema import (
+    BASE_DIR, COLS_BETON, COLS_ACIER, COLS_PREV, COLS_ETUDE_BETON, COLS_ETUDE_ACIER, STANDARD_ITEMS,
+    serialiser_classeur, lire_classeur, typer_feuille,
+)
+from itb77.stockage import StockageGithub, ConflitStockage, connecter_github, creer_stockage
+
+# --- 0. MESURES (un relevé par rerun, le précédent versé au cumul de la session) ---
+if 'perf_session' not in st.session_state:
+    st.session_state.perf_session = mesures.Releve("session")
+    st.session_state.perf_id = uuid.uuid4().hex[:8]
+    st.session_state.perf_nb_reruns = 0
+if 'perf_rerun' in st.session_state:
+    st.session_state.perf_session.fusionner(st.session_state.perf_rerun)
+    st.session_state.perf_precedent = st.session_state.perf_rerun
+st.session_state.perf_nb_reruns += 1
+st.session_state.perf_rerun = mesures.Releve(f"{st.session_state.perf_id}#{st.session_state.perf_nb_reruns}")
+mesures.activer(st.session_state.perf_rerun)
+# Imports du script : comptés au premier run du processus (import à froid), ensuite déjà en mémoire
+demarrage.noter_imports(time.perf_counter() - _debut_imports)
 
 # --- 1. CONFIGURATION GITHUB ET GOOGLE (Via Secrets) ---
+@st.cache_resource
+def depot_github(token, nom_depot):
+    # Un client et un get_repo par processus, pas à chaque rerun ; une erreur n'est pas mise en cache
+    return connecter_github(token, nom_depot)
+
+@st.cache_resource
+def stockage_local(racine, synchro_github, _repo=None):
+    # Une seule instance par processus (thread de synchro GitHub éventuel)
+    return creer_stockage("local", _repo, racine, synchro_github)
+
+repo = None
 try:
     GITHUB_TOKEN = st.secrets.get("GITHUB_TOKEN", "")
     REPO_NAME = st.secrets.get("REPO_NAME", "")
     GOOGLE_API_KEY = st.secrets.get("GOOGLE_API_KEY", "")
     # Récupération du mot de passe Admin
     ADMIN_PASSWORD = st.secrets.get("ADMIN_PASSWORD", "admin123") 
+    # "classeur" : chaque validation réécrit le .xlsx ; "journal" : ajout au journal JSONL du chantier
+    STOCKAGE_MODE = st.secrets.get("STOCKAGE_MODE", "classeur")
+    OCR_WORKERS = int(st.secrets.get("OCR_WORKERS", OCR_WORKERS_DEFAUT))
+    RESOLVEUR_MODELE.ttl = float(st.secrets.get("MODELE_TTL", MODELE_TTL_DEFAUT))
+    LIMITEUR_OCR.par_minute = float(st.secrets.get("OCR_REQUETES_PAR_MINUTE", OCR_REQUETES_PAR_MINUTE_DEFAUT))
+    # Pré-traitement des photos (OCR + archive) ; SCANS_ORIGINAUX archive les fichiers pleine résolution
+    OPTIONS_PRETRAITEMENT = {
+        "cote_max": int(st.secrets.get("SCANS_COTE_MAX", COTE_MAX_OCR)),
+        "niveaux_gris": bool(st.secrets.get("SCANS_NIVEAUX_GRIS", False)),
+        "contraste": bool(st.secrets.get("SCANS_CONTRASTE", False)),
+        "format": st.secrets.get("SCANS_FORMAT", "JPEG"),
+    }
+    SCANS_ORIGINAUX = bool(st.secrets.get("SCANS_ORIGINAUX", False))
+    # Réponses OCR gardées sur disque par contenu de l'image et prompt ; dossier vide = désactivé
+    CACHE_OCR.configurer(st.secrets.get("CACHE_OCR_DOSSIER", ".cache_ocr"), int(st.secrets.get("CACHE_OCR_OCTETS", CACHE_OCR_OCTETS_DEFAUT)))
+    # Distance (bits sur 64) sous laquelle une photo envoyée est signalée comme déjà archivée
+    DOUBLONS_SEUIL = int(st.secrets.get("DOUBLONS_SEUIL", doublons.SEUIL_DEFAUT))
+    POINTAGES_PAR_PAGE = int(st.secrets.get("POINTAGES_PAR_PAGE", PAR_PAGE_DEFAUT))
+    # Signes "idem" recopiant la ligne du dessus (ex. ["u", "U", "\"", "id", "idem"])
+    SIGNES_DITTO = tuple(st.secrets.get("SIGNES_DITTO", DECLENCHEURS_DITTO))
+    CACHE_CLASSEURS.taille_max = int(st.secrets.get("CACHE_CLASSEURS_TAILLE", CACHE_CLASSEURS.taille_max))
+    # "github" (défaut) ou "local" : copie de travail sous STOCKAGE_RACINE, synchronisée vers GitHub si demandé
+    STOCKAGE_BACKEND = st.secrets.get("STOCKAGE_BACKEND", "github")
+    # Publications tentées au plus quand un autre utilisateur enregistre le même chantier en même temps
+    ESSAIS_FUSION = int(st.secrets.get("ESSAIS_FUSION", ESSAIS_FUSION_DEFAUT))
+    # Fichier JSONL tournant des mesures (analyse hors ligne) ; vide = désactivé
+    MESURES_JOURNAL = st.secrets.get("MESURES_JOURNAL", "")
+    if MESURES_JOURNAL:
+        mesures.configurer_journal(MESURES_JOURNAL, int(st.secrets.get("MESURES_JOURNAL_OCTETS", mesures.OCTETS_JOURNAL_DEFAUT)))
     
     if GITHUB_TOKEN and REPO_NAME:
-        auth = Auth.Token(GITHUB_TOKEN)
-        g = Github(auth=auth)
-        repo = g.get_repo(REPO_NAME)
-    else:
+        # Chaque appel repo.* est chronométré (onglet Admin > Performance)
+        repo = depot_github(GITHUB_TOKEN, REPO_NAME)
+    elif STOCKAGE_BACKEND != "local":
         st.error("Configuration GitHub manquante dans les Secrets.")
+
+    if STOCKAGE_BACKEND == "local":
+        stockage = stockage_local(
+            st.secrets.get("STOCKAGE_RACINE", "."),
+            bool(st.secrets.get("STOCKAGE_SYNCHRO_GITHUB", False)) and repo is not None,
+            _repo=repo,
+        )
+    else:
+        stockage = StockageGithub(repo)
 except Exception as e:
     st.error(f"Erreur de configuration : {e}")
 
 # --- 2. CONFIGURATION PROJET ---
-BASE_DIR = "CHANTIERS_ITB77"
-COLS_BETON = ["Fournisseur", "Designation", "Type de Beton", "Volume (m3)"]
-COLS_ACIER = ["Fournisseur", "Type d Acier", "Designation", "Poids (kg)"]
-COLS_PREV = ["Designation", "Prevu (m3)", "Zone"]
-COLS_ETUDE_ACIER = ["Designation", "Acier HA", "Acier TS", "Zone"]
-
-# LISTE STANDARD POUR INITIALISATION
-STANDARD_ITEMS = [
-    {"Designation": "Pieux / Micropieu", "Zone": "INFRA"},
-    {"Designation": "Fondation", "Zone": "INFRA"},
-    {"Designation": "Semelle", "Zone": "INFRA"},
-    {"Designation": "Longrine", "Zone": "INFRA"},
-    {"Designation": "Voile", "Zone": "INFRA"},
-    {"Designation": "Poteau", "Zone": "INFRA"},
-    {"Designation": "Poutre", "Zone": "INFRA"},
-    {"Designation": "Dalle", "Zone": "INFRA"},
-    {"Designation": "Plancher Haut", "Zone": "INFRA"},
-    {"Designation": "Voile", "Zone": "SUPER"},
-    {"Designation": "Poteau", "Zone": "SUPER"},
-    {"Designation": "Poutre", "Zone": "SUPER"},
-    {"Designation": "Dalle", "Zone": "SUPER"},
-    {"Designation": "Acrotère", "Zone": "SUPER"},
-    {"Designation": "Édicule", "Zone": "SUPER"},
-    {"Designation": "Plancher Haut", "Zone": "SUPER"},
-    {"Designation": "Balcons", "Zone": "SUPER"},
-    {"Designation": "Divers", "Zone": "SUPER"},
-]
-
 st.set_page_config(page_title="Suivi béton", layout="wide")
 
 # --- AJOUT CSS GLOBAL (THEME SOMBRE) ---
@@ -101,266 +146,249 @@ st.markdown("""
 # --- 3. FONCTIONS ---
 def lire_excel_github(path):
     try:
-        content = repo.get_contents(path)
-        return pd.read_excel(io.BytesIO(content.decoded_content), sheet_name=None), content.sha
+        sha = stockage.sha(path)
+        if not sha: return None, None
+        sheets = CACHE_CLASSEURS.get(path, sha)
+        if sheets is not None: return sheets, sha
+        sheets = lire_classeur(stockage.lire_blob(path, sha))
+        CACHE_CLASSEURS.put(path, sha, sheets)
+        return sheets, sha
     except: return None, None
 
-def sauvegarder_excel_github(file_dict, path, sha=None):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for sheet, df in file_dict.items():
-            df.to_excel(writer, sheet_name=sheet, index=False)
-    content_bytes = output.getvalue()
-    if sha: repo.update_file(path, "Update", content_bytes, sha)
-    else: repo.create_file(path, "Create", content_bytes)
+def materialiser(lot, dossier, sheets, version):
+    ingestion.materialiser(lot, stockage, BASE_DIR, dossier, sheets, version)
+
+def sauvegarder_excel_github(file_dict, path, sha=None, lot=None, fichiers_journal=()):
+    content_bytes = serialiser_classeur(file_dict)
+    # Classeur + entrée du portefeuille dans le même commit (celui du lot appelant s'il y en a un)
+    propre = lot is None
+    if propre: lot = stockage.lot("Update" if sha else "Create")
+    new_sha = lot.ecrire(path, content_bytes, sha)
+    dossier = path.rsplit("/", 1)[0]
+    materialiser(lot, dossier, file_dict, version_chantier(new_sha, shas_journal(dossier, fichiers_journal, lot)))
+    # Write-through : on met en cache ce qu'une relecture du fichier renverrait, une fois publié
+    lot.apres.append(lambda: CACHE_CLASSEURS.put(path, new_sha, lire_classeur(content_bytes)))
+    if propre:
+        try:
+            lot.publier()
+        except:
+            CACHE_CLASSEURS.invalider(path)
+            raise
+    return new_sha
 
 def lister_chantiers():
+    return rapports.lister_chantiers(stockage, BASE_DIR)
+
+def recharger_chantier(nom):
+    # Classeur (+ journal) tel qu'il est publié : (sheets, (sha, fichiers de journal)) ; aucun appel Streamlit
+    dossier = f"{BASE_DIR}/{nom}"
+    sheets, sha = lire_excel_github(f"{dossier}/{nom}.xlsx")
+    fichiers = []
+    if sheets is not None and STOCKAGE_MODE == "journal":
+        journal, fichiers = lire_journal(stockage, dossier)
+        sheets = fusionner(sheets, journal)
+    return sheets, (sha, fichiers)
+
+def lire_chantier_portefeuille(nom):
+    # Appelé dans les threads du portefeuille
+    sheets, (sha, fichiers) = recharger_chantier(nom)
+    if sheets is None: return None, None
+    return sheets, version_chantier(sha, [f.sha for f in fichiers])
+
+def enregistrer_chantier(nom, delta, base, publier=None):
+    """Publie `base` + `delta` ; si un autre utilisateur a enregistré entre-temps, le delta est
+    réappliqué sur sa version (ESSAIS_FUSION publications au plus). Retourne les feuilles publiées."""
+    path = f"{BASE_DIR}/{nom}/{nom}.xlsx"
+    if publier is None:
+        def publier(sheets_f, etat):
+            sauvegarder_excel_github(sheets_f, path, etat[0], fichiers_journal=etat[1])
     try:
-        contents = repo.get_contents(BASE_DIR)
-        return sorted([c.name for c in contents if c.type == "dir"])
-    except: return []
+        sheets_f, reprises = publier_avec_reprise(delta, base, publier, lambda: recharger_chantier(nom), ESSAIS_FUSION)
+    except ConflitStockage:
+        CACHE_CLASSEURS.invalider(path)
+        st.error("Le chantier a été modifié entre-temps et la fusion a échoué : rien n'a été enregistré. Rechargez puis validez à nouveau.")
+        st.stop()
+    if reprises:
+        st.session_state.message_fusion = f"Enregistré après fusion avec les modifications d'un autre utilisateur ({reprises} reprise(s))."
+    return sheets_f
 
 def recuperer_fichier_github(path):
     try:
-        content = repo.get_contents(path)
-        return content.decoded_content
+        return stockage.lire(path)
     except: return None
 
-def sauvegarder_scan_github(uploaded_file, nom_chantier, type_doc):
+def cle_scan(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or uploaded_file.name
+
+def pretraiter_scan(uploaded_file):
+    # Pré-traitement unique par fichier : mêmes octets (data, ext) pour Gemini et pour l'archive
+    cle = cle_scan(uploaded_file)
+    if cle not in st.session_state.scans_pretraites:
+        image = pretraiter_image(uploaded_file.name, uploaded_file.getvalue(), **OPTIONS_PRETRAITEMENT)
+        st.session_state.scans_pretraites[cle] = (image.data, image.ext)
+    return st.session_state.scans_pretraites[cle]
+
+def sauvegarder_scan_github(uploaded_file, nom_chantier, type_doc, lot=None):
     try:
-        now = datetime.now()
-        date_str = now.strftime("%d-%m-%Y") 
-        heure_str = now.strftime("%H-%M-%S")
-        ext = uploaded_file.name.split('.')[-1].lower()
-        nom_clean = remove_accents(nom_chantier).replace(" ", "_")
-        new_filename = f"{date_str} -- {nom_clean} -- {heure_str}.{ext}"
-        folder_type = "SCANS_BETON" if "eton" in type_doc else "SCANS_ACIER"
-        path_github = f"{BASE_DIR}/{nom_chantier}/{folder_type}/{new_filename}"
-        repo.create_file(path_github, f"Ajout scan {type_doc}", uploaded_file.getvalue())
-        return True
+        pretraite = st.session_state.scans_pretraites.get(cle_scan(uploaded_file))
+        if pretraite and not SCANS_ORIGINAUX:
+            data, ext = pretraite
+        else:
+            data, ext = uploaded_file.getvalue(), uploaded_file.name.split('.')[-1].lower()
+        document = DOCUMENTS["Beton" if "eton" in type_doc else "Acier"]
+        path_github = ingestion.chemin_scan(BASE_DIR, nom_chantier, document.dossier_scans, ext, lot)
+        if lot is not None:
+            lot.ecrire(path_github, data)
+        else:
+            stockage.ecrire(path_github, data, f"Ajout scan {type_doc}")
+        return path_github
     except Exception as e:
         print(f"Erreur sauvegarde scan: {e}")
-        return False
-
-def get_best_available_model():
-    """
-    Cherche automatiquement un modèle disponible STABLE.
-    On a retiré les modèles expérimentaux (2.0-flash-exp) pour éviter l'erreur 429.
-    """
-    try:
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        
-        # Liste de préférence (UNIQUEMENT LES STABLES)
-        preferences = [
-            "models/gemini-1.5-flash",      # Priorité absolue : le plus stable et gratuit
-            "models/gemini-1.5-flash-001",
-            "models/gemini-1.5-flash-002",
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-pro"
-        ]
-        
-        for pref in preferences:
-            if pref in available_models:
-                return pref.replace("models/", "")
-        
-        # Si aucun favori n'est trouvé, on prend le premier qui contient "flash" (mais pas exp)
-        for m in available_models:
-            if "flash" in m and "exp" not in m:
-                return m.replace("models/", "")
-                
-        # Sinon le tout premier disponible
-        if available_models:
-            return available_models[0].replace("models/", "")
-            
-    except Exception:
-        pass
-    
-    # Fallback ultime (Stable)
-    return "gemini-1.5-flash"
+        return None
 
-def analyser_ia(uploaded_file, api_key, prompt):
+@mesures.chronometre("analyser_ia")
+def analyser_ia(uploaded_file, api_key, prompt, schema=None):
     if not api_key:
         st.error("La clé Google API est manquante.")
-        return None, "Clé manquante"
+        return pd.DataFrame(), "Clé manquante"
     
     try:
-        genai.configure(api_key=api_key)
-        # Sélection dynamique du modèle
-        model_name = get_best_available_model()
-        model = genai.GenerativeModel(model_name)
+        configurer(api_key)
     except Exception as e:
         st.error(f"Erreur config Gemini: {e}")
         return pd.DataFrame(), str(e)
 
     try:
-        file_ext = uploaded_file.name.lower()
-        if file_ext.endswith('.heic'):
-            heif_file = pillow_heif.read_heif(uploaded_file)
-            image = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw")
-        else:
-            image = Image.open(uploaded_file)
+        data, ext = pretraiter_scan(uploaded_file)
     except Exception as e:
         st.error(f"Erreur lecture image : {e}")
         return pd.DataFrame(), str(e)
 
-    # Prompt renforcé
-    prompt_complet = (
-        f"{prompt}. "
-        "IMPORTANT : Retourne UNIQUEMENT une liste JSON brute (tableau d'objets) compatible Python."
-        "Ne mets PAS de Markdown (pas de ```json ... ```)."
-        "Les clés du JSON doivent être EXACTEMENT celles demandées dans le prompt (respecte majuscules/accents)."
-        "Si une valeur est absente, mets null ou 0."
-        "Ajoute une clé 'Doute' (boolean) : true si incertain, sinon false."
-    )
+    return extraire_bon(blob_image(data, ext), prompt, schema=schema)
 
+def detecter_doublons(fichiers, dossier):
+    """Photos de l'envoi qui ressemblent à un scan déjà archivé du chantier ou à une autre photo de l'envoi."""
     try:
-        # Petit délai pour éviter le spam si l'utilisateur clique frénétiquement
-        time.sleep(1) 
-        response = model.generate_content([prompt_complet, image])
-        txt = response.text.strip()
-        
-        # Nettoyage Markdown
-        if txt.startswith("```json"): txt = txt.split("```json")[1]
-        elif txt.startswith("```"): txt = txt.split("```")[1]
-        if txt.endswith("```"): txt = txt[:-3]
-        
-        txt = txt.strip()
-        
-        # Tentative de chargement JSON
-        data = json.loads(txt)
-        
-        if isinstance(data, dict):
-            if "data" in data: data = data["data"]
-            elif "result" in data: data = data["result"]
-            else: data = [data]
+        index, _ = doublons.actualiser_index(stockage, dossier)
+    except Exception:
+        index = {}
+    st.session_state.index_scans = index
+    empreintes = []
+    for f in fichiers:
+        try:
+            data, ext = pretraiter_scan(f)
+            empreinte = empreinte_perceptuelle(f"scan.{ext}", data)
+        except Exception:
+            empreinte = None
+        st.session_state.empreintes_scans[cle_scan(f)] = empreinte
+        empreintes.append((f.name, empreinte))
+    return doublons.comparer(index, empreintes, DOUBLONS_SEUIL)
 
-        return pd.DataFrame(data), f"Modèle: {model_name}\n\n{txt}"
+def indexer_scans(lot, dossier, chemins):
+    # Empreintes des scans publiés par le lot : les prochains envois les comparent sans les retélécharger
+    empreintes = {p: st.session_state.empreintes_scans.get(c) for c, p in chemins.items() if p}
+    if st.session_state.index_scans is not None and any(e is not None for e in empreintes.values()):
+        doublons.indexer(lot, dossier, st.session_state.index_scans, empreintes)
 
-    except Exception as e:
-        # Affichage plus doux de l'erreur pour ne pas bloquer l'interface
-        return pd.DataFrame(), str(e)
+def afficher_doublons():
+    if st.session_state.doublons:
+        st.warning("⚠️ Bon(s) peut-être déjà enregistré(s) — le volume serait compté deux fois :\n\n" + "\n".join(
+            f"- **{nom}** ressemble à `{semblable}` ({'identique' if d == 0 else f'{d} bit(s) d’écart'})"
+            for nom, semblable, d in st.session_state.doublons
+        ))
 
-def remove_accents(input_str):
-    if not isinstance(input_str, str): return str(input_str)
-    nfkd_form = unicodedata.normalize('NFKD', input_str)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-
-def detecter_zone_automatique(texte):
-    texte = remove_accents(str(texte).lower().strip())
-    mots_infra = ["r-", "s-sol", "sous-sol", "fondation", "radier", "pieux", "semelle", "longrine", "infra", "gros beton"]
-    for mot in mots_infra:
-        if mot in texte:
-            return "INFRA"
-    return "SUPER"
-
-def appliquer_correction_u(df, colonnes_a_verifier):
-    for col in colonnes_a_verifier:
-        if col in df.columns:
-            for i in range(1, len(df)):
-                valeur_actuelle = str(df.at[i, col]).strip()
-                declencheurs = ["u", "U", '"']
-                if valeur_actuelle in declencheurs:
-                    df.at[i, col] = df.at[i-1, col]
-    return df
-
-def verifier_correspondance_budget(df_scan, df_budget, col_scan="Designation"):
-    library = [remove_accents(str(x).strip().lower()) for x in df_budget["Designation"].unique()]
-    if "Doute" not in df_scan.columns:
-        df_scan["Doute"] = False
-    termes_inconnus = []
-    for index, row in df_scan.iterrows():
-        valeur_scan = remove_accents(str(row.get(col_scan, "")).strip().lower())
-        valeur_scan_sing = valeur_scan[:-1] if valeur_scan.endswith('s') else valeur_scan
-        match_found = False
-        for ref in library:
-            ref_sing = ref[:-1] if ref.endswith('s') else ref
-            if valeur_scan == ref or valeur_scan_sing == ref_sing:
-                match_found = True
-                break
-        if not match_found:
-            df_scan.at[index, "Doute"] = True
-            termes_inconnus.append(row.get(col_scan, "Inconnu"))
-    return df_scan, termes_inconnus
-
-def generer_excel_stylise(dfs_dict):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        workbook = writer.book
-        for sheet_name, df in dfs_dict.items():
-            if df.empty: continue
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-            worksheet = writer.sheets[sheet_name]
-            (max_row, max_col) = df.shape
-            column_settings = [{'header': column} for column in df.columns]
-            worksheet.add_table(0, 0, max_row, max_col - 1, {'columns': column_settings, 'style': 'TableStyleMedium2', 'name': f"Table_{remove_accents(sheet_name).replace(' ', '_')}"})
-            for i, col in enumerate(df.columns):
-                max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                worksheet.set_column(i, i, max_len)
-    return output.getvalue()
-
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'RECAPITULATIF CHANTIER', 0, 1, 'C')
-        self.ln(5)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def generer_pdf_recap(df_target, nom_chantier):
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, f"Chantier : {nom_chantier}", 0, 1, 'L')
-    pdf.cell(0, 10, f"Date : {datetime.now().strftime('%d/%m/%Y')}", 0, 1, 'L')
-    pdf.ln(5)
-    for zone in ["INFRA", "SUPER"]:
-        pdf.set_font("Arial", 'B', 14)
-        pdf.set_fill_color(230, 126, 34)
-        pdf.cell(0, 10, f"{zone}STRUCTURE", 0, 1, 'L', fill=False)
-        pdf.ln(2)
-        df_zone = df_target[df_target["Zone"] == zone]
-        df_active = df_zone[(df_zone["Prevu (m3)"] > 0) | (df_zone["Volume Reel"] > 0) | (df_zone.get("Etude (m3)", 0) > 0)]
-        if df_active.empty:
-            pdf.set_font("Arial", 'I', 10)
-            pdf.cell(0, 10, "Aucune donnée.", 0, 1)
-        else:
-            pdf.set_font("Arial", 'B', 10)
-            pdf.cell(50, 8, "Désignation", 1)
-            pdf.cell(30, 8, "Budget", 1, 0, 'C')
-            pdf.cell(30, 8, "Conso", 1, 0, 'C')
-            pdf.cell(30, 8, "Etude", 1, 0, 'C')
-            pdf.cell(30, 8, "Reste", 1, 0, 'C')
-            pdf.cell(20, 8, "%", 1, 1, 'C')
-            pdf.set_font("Arial", size=10)
-            for _, row in df_active.iterrows():
-                nom = str(row['Designation']).encode('latin-1', 'replace').decode('latin-1')
-                prev = row['Prevu (m3)']
-                reel = row['Volume Reel']
-                etude = row.get('Etude (m3)', 0.0)
-                delta = prev - reel 
-                pct = (reel / prev * 100) if prev > 0 else 0.0
-                pdf.cell(50, 8, nom, 1)
-                pdf.cell(30, 8, f"{prev:.1f}", 1, 0, 'C')
-                pdf.cell(30, 8, f"{reel:.1f}", 1, 0, 'C')
-                pdf.cell(30, 8, f"{etude:.1f}", 1, 0, 'C')
-                if delta < 0:
-                    pdf.set_text_color(255, 0, 0)
-                else:
-                    pdf.set_text_color(0, 0, 0)
-                pdf.cell(30, 8, f"{delta:.1f}", 1, 0, 'C')
-                pdf.cell(20, 8, f"{pct:.0f}%", 1, 1, 'C')
-                pdf.set_text_color(0, 0, 0)
-        pdf.ln(5)
-    return pdf.output(dest='S').encode('latin-1')
+def analyser_bons(fichiers, prompt, colonnes, cols_texte, col_num, cols_ditto, df_budget):
+    """Analyse un ou plusieurs bons et prépare une seule grille de relecture (colonne "Bon" = fichier source)."""
+    if not GOOGLE_API_KEY:
+        st.error("La clé Google API est manquante.")
+        return pd.DataFrame(), [], "Clé manquante"
+    lot_multiple = len(fichiers) > 1
+    # Sortie JSON structurée aux colonnes de la feuille (quantités en nombres)
+    schema = schema_reponse(colonnes)
+    if lot_multiple:
+        progression = st.progress(0.0, text=f"0/{len(fichiers)} bons analysés")
+        apercu = st.empty()
+        resultats = analyser_lot(
+            [(f.name, f.getvalue()) for f in fichiers], GOOGLE_API_KEY, prompt, OCR_WORKERS,
+            pretraiter=functools.partial(pretraiter_image, **OPTIONS_PRETRAITEMENT), schema=schema
+        )
+    else:
+        with st.spinner("IA en cours..."):
+            res, debug = analyser_ia(fichiers[0], GOOGLE_API_KEY, prompt, schema)
+        resultats = [(0, fichiers[0].name, res, debug, None)]
+
+    parts, debugs, inconnus = {}, {}, []
+    for i, nom, res, debug, image in resultats:
+        debugs[i] = f"--- {nom} ---\n{debug}" if lot_multiple else debug
+        if image is not None:
+            st.session_state.scans_pretraites[cle_scan(fichiers[i])] = (image.data, image.ext)
+        if not res.empty:
+            # Nettoyage bon par bon : un "u" ne reprend jamais la valeur du bon précédent
+            res, termes = preparer_relecture(res, colonnes, cols_texte, col_num, cols_ditto, df_budget, SIGNES_DITTO)
+            parts[i] = res.assign(Bon=nom)
+            inconnus.extend(termes)
+        if lot_multiple:
+            progression.progress(len(debugs) / len(fichiers), text=f"{len(debugs)}/{len(fichiers)} bons analysés")
+            if parts:
+                apercu.dataframe(pd.concat([parts[k] for k in sorted(parts)], ignore_index=True), width='stretch')
+
+    raw_debug = "\n\n".join(debugs[k] for k in sorted(debugs))
+    if not parts:
+        return pd.DataFrame(columns=["Doute"] + colonnes), [], raw_debug
+    return pd.concat([parts[k] for k in sorted(parts)], ignore_index=True), inconnus, raw_debug
+
+def appliquer_suggestion(terme, designation):
+    df = st.session_state.relecture
+    lignes = df["Designation"] == terme
+    df.loc[lignes, "Designation"] = designation
+    df.loc[lignes, "Doute"] = False
+    st.session_state.termes_inconnus = [t for t in st.session_state.termes_inconnus if t != terme]
+    st.session_state.suggestions.pop(terme, None)
+
+def proposer_corrections():
+    # Correction en un clic : remplace le terme sur toutes les lignes de la relecture
+    for terme, propositions in st.session_state.suggestions.items():
+        if not propositions: continue
+        cols = st.columns([2] + [2] * len(propositions) + [4 - len(propositions)])
+        cols[0].markdown(f"**{terme}** →")
+        for col, (designation, score) in zip(cols[1:], propositions):
+            col.button(
+                f"{designation} ({score:.0%})", key=f"sugg_{terme}_{designation}", width='stretch',
+                on_click=appliquer_suggestion, args=(terme, designation),
+            )
+
+def afficher_export(label, cle, fn, args, nom_fichier, mime, lourd=False):
+    # Export généré seulement sur demande, puis mémorisé par empreinte des données
+    statut, data = exports.etat(cle)
+    if statut == "pret":
+        st.download_button(label, data, nom_fichier, mime, key=f"dl_{cle}", use_container_width=True)
+    elif statut == "en_cours":
+        @st.fragment(run_every=1)
+        def attendre_export():
+            if exports.etat(cle)[0] != "en_cours": st.rerun()
+            st.caption("⏳ Génération...")
+        attendre_export()
+    else:
+        if statut == "erreur": st.error(f"Erreur export : {data}")
+        if st.button(label.replace("📥", "⚙️"), key=f"gen_{cle}", use_container_width=True):
+            if lourd:
+                exports.lancer(cle, fn, *args)
+            else:
+                with st.spinner("Génération..."):
+                    exports.generer(cle, fn, *args)
+            st.rerun()
 
 # --- 4. INTERFACE ---
 if 'page' not in st.session_state: st.session_state.page = "Accueil"
 if 'relecture' not in st.session_state: st.session_state.relecture = None
 if 'termes_inconnus' not in st.session_state: st.session_state.termes_inconnus = []
+if 'suggestions' not in st.session_state: st.session_state.suggestions = {}
 if 'is_admin' not in st.session_state: st.session_state.is_admin = False
 if 'raw_debug' not in st.session_state: st.session_state.raw_debug = ""
+if 'scans_pretraites' not in st.session_state: st.session_state.scans_pretraites = {}
+if 'empreintes_scans' not in st.session_state: st.session_state.empreintes_scans = {}
+if 'index_scans' not in st.session_state: st.session_state.index_scans = None
+if 'doublons' not in st.session_state: st.session_state.doublons = []
 
 # --- BARRE LATERALE (CONNEXION ADMIN) ---
 with st.sidebar:
@@ -376,6 +404,24 @@ with st.sidebar:
                 st.error("Mot de passe incorrect")
         else:
             st.session_state.is_admin = False
+        if st.session_state.is_admin:
+            stats_cache = CACHE_CLASSEURS.stats()
+            st.caption(
+                f"Cache classeurs : {stats_cache['hits']} hits / {stats_cache['misses']} miss "
+                f"({stats_cache['taux_hit']:.0f} %) — {stats_cache['entrees']}/{stats_cache['taille_max']} entrées, "
+                f"{stats_cache['evictions']} évictions"
+            )
+            stats_ocr = CACHE_OCR.stats()
+            if stats_ocr["actif"]:
+                st.caption(
+                    f"Cache OCR : {stats_ocr['hits']} hits / {stats_ocr['misses']} miss ({stats_ocr['taux_hit']:.0f} %) — "
+                    f"{stats_ocr['octets'] / 1e6:.1f}/{stats_ocr['octets_max'] / 1e6:.0f} Mo, {stats_ocr['evictions']} évictions"
+                )
+            if hasattr(stockage, "synchro_en_attente"):
+                st.caption(
+                    f"Stockage local : {stockage.synchro_en_attente()} écriture(s) en attente de synchro GitHub, "
+                    f"{len(stockage.synchro_erreurs)} erreur(s)"
+                )
 
 st.markdown('<h1 style="color:#E67E22; text-align:center;">GESTION ITB77</h1>', unsafe_allow_html=True)
 
@@ -391,9 +437,35 @@ if st.session_state.page == "Accueil":
     with col_refresh:
         if st.button("🔄 Actualiser", width='stretch', key="refresh_home"): st.rerun()
 
+    chantiers = lister_chantiers()
+    if st.toggle("📊 Vue portefeuille (Prévu / Consommé / Étude / Reste)", key="vue_portefeuille"):
+        verifier = st.button("🔎 Vérifier les chantiers modifiés", key="verif_portefeuille")
+        index_pf, recharges = charger_portefeuille(
+            stockage, BASE_DIR, chantiers, lire_chantier_portefeuille, verifier, STOCKAGE_MODE == "journal"
+        )
+        if index_pf:
+            st.dataframe(tableau_portefeuille(index_pf), hide_index=True, width='stretch')
+            maj = min(e["maj"] for e in index_pf.values())
+            st.caption(f"Plus ancienne mise à jour de l'index : {maj.replace('T', ' ')}" + (f" — {len(recharges)} chantier(s) rechargé(s)" if recharges else ""))
+        else:
+            st.info("Aucun prévisionnel à afficher.")
+
+    with st.expander("📦 Rapports de tous les chantiers (ZIP)"):
+        avec_excel = st.checkbox("Inclure l'Excel de chaque chantier", key="rapports_excel")
+        if st.button("Générer les rapports", key="gen_rapports") and chantiers:
+            with st.spinner(f"Rapports de {len(chantiers)} chantier(s)..."):
+                # Les sheets passent par recharger_chantier : cache des classeurs et journal comme à l'affichage
+                st.session_state.rapports = rapports.generer_rapports(chantiers, lambda nom: recharger_chantier(nom)[0], avec_excel)
+        if "rapports" in st.session_state:
+            data_zip, durees = st.session_state.rapports
+            st.download_button("📥 ZIP", data_zip, f"Rapports_{datetime.now():%Y-%m}.zip", "application/zip", key="dl_rapports")
+            st.dataframe(durees, hide_index=True, width='stretch', column_config={
+                c: st.column_config.NumberColumn(format="%.0f") for c in durees.columns if c not in ("Chantier", "Statut")
+            })
+
     c1, c2 = st.columns([6, 4])
     with c1:
-        for c in lister_chantiers():
+        for c in chantiers:
             if st.button(f"🏢 {c}", key=f"sel_{c}", width='stretch'):
                 st.session_state.page = c
                 st.rerun()
@@ -403,14 +475,14 @@ if st.session_state.page == "Accueil":
         if st.button("Creer Chantier") and n:
             p = f"{BASE_DIR}/{n}/{n}.xlsx"
             try:
-                temp = repo.get_contents("template_itb77.xlsx")
-                repo.create_file(p, f"Init {n}", temp.decoded_content)
+                temp = stockage.lire("template_itb77.xlsx")
+                stockage.ecrire(p, temp, f"Init {n}")
             except:
                 d = {
                     "Beton": pd.DataFrame(columns=COLS_BETON), 
                     "Acier": pd.DataFrame(columns=COLS_ACIER), 
                     "Previsionnel": pd.DataFrame(columns=COLS_PREV),
-                    "Etude_Beton": pd.DataFrame(columns=["Designation", "Etude (m3)", "Zone"]),
+                    "Etude_Beton": pd.DataFrame(columns=COLS_ETUDE_BETON),
                     "Etude_Acier": pd.DataFrame(columns=COLS_ETUDE_ACIER)
                 }
                 sauvegarder_excel_github(d, p)
@@ -423,6 +495,8 @@ else:
     col_titre_c, col_act_c, col_ret_c = st.columns([6, 2, 2])
     with col_titre_c:
         st.header(f"📍 {nom_c}")
+    if 'message_fusion' in st.session_state:
+        st.info(st.session_state.pop('message_fusion'))
     with col_act_c:
         if st.button("🔄 Actualiser", key="refresh_site", width='stretch'):
             st.rerun()
@@ -431,11 +505,21 @@ else:
             st.session_state.page = "Accueil"
             st.session_state.relecture = None
             st.session_state.termes_inconnus = []
+            st.session_state.suggestions = {}
             st.session_state.raw_debug = ""
+            st.session_state.scans_pretraites = {}
+            st.session_state.empreintes_scans = {}
+            st.session_state.doublons = []
             st.rerun()
 
-    path_f = f"{BASE_DIR}/{nom_c}/{nom_c}.xlsx"
+    dossier_c = f"{BASE_DIR}/{nom_c}"
+    path_f = f"{dossier_c}/{nom_c}.xlsx"
     sheets, sha = lire_excel_github(path_f)
+    journal, fichiers_journal = {}, []
+    if sheets is not None and STOCKAGE_MODE == "journal":
+        journal, fichiers_journal = lire_journal(stockage, dossier_c)
+        sheets_instantane = sheets
+        sheets = fusionner(sheets, journal)
     
     if sheets is not None:
         # --- GESTION DES ONGLETS AVEC ADMIN ---
@@ -448,66 +532,19 @@ else:
         # On récupère les onglets standards
         tab_recap, tab_beton, tab_acier, tab_prev, tab_etude = all_tabs[:5]
         
-        df_beton = sheets.get("Beton", pd.DataFrame(columns=COLS_BETON))
-        if df_beton.empty: df_beton = pd.DataFrame(columns=COLS_BETON)
-        
-        df_acier = sheets.get("Acier", pd.DataFrame(columns=COLS_ACIER))
-        if df_acier.empty: df_acier = pd.DataFrame(columns=COLS_ACIER)
-
-        df_prev = sheets.get("Previsionnel", pd.DataFrame(columns=COLS_PREV))
-        if not df_prev.empty and "Zone" not in df_prev.columns:
-            df_prev["Zone"] = "INFRA"
-        if df_prev.empty: df_prev = pd.DataFrame(columns=COLS_PREV)
-
-        df_etude_beton = sheets.get("Etude_Beton", pd.DataFrame(columns=["Designation", "Etude (m3)", "Zone"]))
-        df_etude_acier = sheets.get("Etude_Acier", pd.DataFrame(columns=COLS_ETUDE_ACIER))
+        # Feuilles typées à la lecture (schema.SCHEMA) ; absentes : feuilles vides typées
+        df_beton = typer_feuille("Beton", sheets.get("Beton"))
+        df_acier = typer_feuille("Acier", sheets.get("Acier"))
+        df_prev = typer_feuille("Previsionnel", sheets.get("Previsionnel"))
+        df_etude_beton = typer_feuille("Etude_Beton", sheets.get("Etude_Beton"))
+        df_etude_acier = typer_feuille("Etude_Acier", sheets.get("Etude_Acier"))
 
         # --- CALCUL DU RECAP ---
-        df_recap_final = pd.DataFrame()
-        if not df_prev.empty:
-            df_calc = df_beton.copy()
-            df_calc["Volume (m3)"] = pd.to_numeric(df_calc["Volume (m3)"], errors='coerce').fillna(0)
-            
-            df_target = df_prev.copy()
-            df_target["Prevu (m3)"] = pd.to_numeric(df_target["Prevu (m3)"], errors='coerce').fillna(0)
-            if "Zone" not in df_target.columns: df_target["Zone"] = "INFRA"
-            df_target["Zone"] = df_target["Zone"].fillna("INFRA")
-            df_target["Volume Reel"] = 0.0
-            
-            df_etude_val = df_etude_beton.copy()
-            if not df_etude_val.empty and "Etude (m3)" in df_etude_val.columns:
-                df_etude_val["Etude (m3)"] = pd.to_numeric(df_etude_val["Etude (m3)"], errors='coerce').fillna(0)
-            else:
-                df_etude_val["Etude (m3)"] = 0.0
-            
-            fondation_details = {}
-
-            for _, row_reel in df_calc.iterrows():
-                nom_reel = str(row_reel["Designation"]).strip()
-                type_reel = str(row_reel.get("Type de Beton", "")).strip()
-                vol_reel = row_reel["Volume (m3)"]
-                texte_pour_zone = nom_reel + " " + type_reel
-                zone_du_bon = detecter_zone_automatique(texte_pour_zone)
-                nom_reel_clean = remove_accents(nom_reel.lower())
-                type_reel_clean = remove_accents(type_reel.lower())
-                for idx_prev, row_prev in df_target.iterrows():
-                    nom_budget_raw = str(row_prev["Designation"]).strip()
-                    mot_cle_budget = remove_accents(nom_budget_raw.lower())
-                    zone_budget = row_prev["Zone"]
-                    if zone_du_bon == zone_budget:
-                        if mot_cle_budget in nom_reel_clean or mot_cle_budget in type_reel_clean:
-                            df_target.at[idx_prev, "Volume Reel"] += vol_reel
-                            if mot_cle_budget == "fondation":
-                                type_beton_reel = row_reel.get("Type de Beton", "Non spécifié")
-                                if type_beton_reel not in fondation_details:
-                                    fondation_details[type_beton_reel] = 0.0
-                                fondation_details[type_beton_reel] += vol_reel
-                            break 
-            
-            df_target = pd.merge(df_target, df_etude_val[["Designation", "Zone", "Etude (m3)"]], on=["Designation", "Zone"], how="left").fillna(0)
-            df_target["Reste (m3)"] = df_target["Prevu (m3)"] - df_target["Volume Reel"]
-            df_target["Avancement (%)"] = df_target.apply(lambda x: (x["Volume Reel"] / x["Prevu (m3)"] * 100) if x["Prevu (m3)"] > 0 else 0, axis=1)
-            df_recap_final = df_target
+        # Récap matérialisé : seuls les bons (béton et acier) ajoutés depuis le dernier affichage sont traités
+        recaps = recap_materialise(stockage, dossier_c).recaps(
+            df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier, version=version_chantier(sha, [f.sha for f in fichiers_journal])
+        )
+        df_recap_final, fondation_details, df_recap_acier = recaps
 
         # --- 1. RÉCAPITULATIF ---
         with tab_recap:
@@ -518,19 +555,13 @@ else:
             with col_dl_recap:
                 c_pdf, c_xls = st.columns(2)
                 with c_pdf:
-                    pdf_bytes = generer_pdf_recap(df_recap_final, nom_c)
-                    st.download_button("📥 PDF", pdf_bytes, f"Recap_{nom_c}.pdf", "application/pdf", use_container_width=True)
+                    # La date du jour est imprimée dans le PDF : elle fait partie de la clé
+                    cle_pdf = "pdf_" + exports.empreinte(df_recap_final, df_recap_acier, nom_c, datetime.now().date())
+                    afficher_export("📥 PDF", cle_pdf, generer_pdf_recap, (df_recap_final, nom_c, df_recap_acier), f"Recap_{nom_c}.pdf", "application/pdf", lourd=exports.est_lourd(df_recap_final, df_recap_acier))
                 with c_xls:
-                    data_export = {
-                        "Récapitulatif": df_recap_final,
-                        "Béton": df_beton,
-                        "Acier": df_acier,
-                        "Prévisionnel": df_prev,
-                        "Étude Béton": df_etude_beton,
-                        "Étude Acier": df_etude_acier
-                    }
-                    xls_bytes = generer_excel_stylise(data_export)
-                    st.download_button("📥 Excel", xls_bytes, f"Donnees_{nom_c}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+                    data_export = exports.donnees_excel(recaps, df_beton, df_prev, df_etude_beton, df_acier, df_etude_acier)
+                    cle_xls = "xlsx_" + exports.empreinte(data_export)
+                    afficher_export("📥 Excel", cle_xls, generer_excel_stylise, (data_export,), f"Donnees_{nom_c}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", lourd=exports.est_lourd(*data_export.values()))
 
             for zone_name in ["INFRA", "SUPER"]:
                 st.markdown(f"## 🏗️ {zone_name}STRUCTURE")
@@ -593,44 +624,35 @@ else:
                 else:
                     st.info(f"Aucun élément actif en {zone_name}.")
                 st.write("") 
+
+            st.markdown("## 🔩 ACIER")
+            if not df_recap_acier.empty:
+                df_acier_actif = df_recap_acier[(df_recap_acier["Etude (kg)"] > 0) | (df_recap_acier["Poids Reel (kg)"] > 0)]
+            else:
+                df_acier_actif = df_recap_acier
+            if not df_acier_actif.empty:
+                st.dataframe(
+                    df_acier_actif, hide_index=True, width='stretch',
+                    column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ["Acier HA", "Acier TS", "Etude (kg)", "Poids Reel (kg)", "Reste (kg)", "Avancement (%)"]}
+                )
+            else:
+                st.info("Aucun élément acier actif.")
         
         # --- 2. BÉTON ---
         with tab_beton:
-            up_b = st.file_uploader("Scan Bon Beton", type=['jpg','png','heic'], key="up_b")
+            up_b = st.file_uploader("Scan Bon Beton", type=['jpg','png','heic'], key="up_b", accept_multiple_files=True)
             if up_b and st.session_state.relecture is None:
-                if st.button("Envoyer Bon", key="btn_b", type="primary"):
-                    with st.spinner("IA en cours..."):
-                        res, raw_debug = analyser_ia(up_b, GOOGLE_API_KEY, f"Donnees beton JSON. Colonnes: {COLS_BETON}")
-                        st.session_state.raw_debug = raw_debug # Stockage pour debug
-                        
-                        # --- BLOC DE NETTOYAGE ET CONVERSION ---
-                        if not res.empty:
-                            # 1. Conversion des colonnes TEXTE (str) pour éviter l'erreur FLOAT
-                            for col in ["Fournisseur", "Designation", "Type de Beton"]:
-                                if col in res.columns:
-                                    res[col] = res[col].fillna("").astype(str).replace('nan', '')
-                                else:
-                                    res[col] = "" # Force creation si manquant
-                            
-                            # 2. Conversion des colonnes NUMERIQUES (float)
-                            if "Volume (m3)" in res.columns:
-                                res["Volume (m3)"] = pd.to_numeric(res["Volume (m3)"], errors='coerce').fillna(0.0).astype(float)
-                            else:
-                                res["Volume (m3)"] = 0.0
-                            
-                            # 3. Colonne Doute
-                            if "Doute" not in res.columns:
-                                res["Doute"] = False
-                            else:
-                                res["Doute"] = res["Doute"].astype(bool)
-
-                        cols_temp = ["Doute"] + COLS_BETON 
-                        res = res.reindex(columns=cols_temp)
-                        res = appliquer_correction_u(res, ["Designation", "Type de Beton"])
-                        res, inconnus = verifier_correspondance_budget(res, df_prev, col_scan="Designation")
-                        st.session_state.termes_inconnus = inconnus
-                        st.session_state.relecture = res
-                        st.rerun()
+                if st.button(f"Envoyer {len(up_b)} Bon(s)", key="btn_b", type="primary"):
+                    doc = DOCUMENTS["Beton"]
+                    res, inconnus, raw_debug = analyser_bons(
+                        up_b, doc.prompt, doc.colonnes, doc.cols_texte, doc.col_num, doc.cols_ditto, df_prev
+                    )
+                    st.session_state.raw_debug = raw_debug # Stockage pour debug
+                    st.session_state.termes_inconnus = inconnus
+                    st.session_state.suggestions = index_budget(df_prev).suggerer(inconnus)
+                    st.session_state.relecture = res
+                    st.session_state.doublons = detecter_doublons(up_b, dossier_c)
+                    st.rerun()
             
             # Message si c'est vide (DEBUG)
             if st.session_state.relecture is not None and st.session_state.relecture.empty:
@@ -639,15 +661,17 @@ else:
                     st.code(st.session_state.raw_debug)
 
             if st.session_state.relecture is not None and not st.session_state.relecture.empty:
+                afficher_doublons()
                 if st.session_state.termes_inconnus:
                     st.warning(f"⚠️ Termes inconnus détectés : {', '.join(set(st.session_state.termes_inconnus))}. Veuillez corriger les lignes cochées.")
+                    proposer_corrections()
                 else:
                     st.info("Vérifiez les lignes.")
 
                 df_m = st.data_editor(
                     st.session_state.relecture, 
                     key="edit_b",
-                    disabled=["Doute"],
+                    disabled=["Doute", "Bon"],
                     use_container_width=True,
                     column_config={
                         "Doute": st.column_config.CheckboxColumn("⚠️", default=False, width="small"),
@@ -655,59 +679,49 @@ else:
                         "Designation": st.column_config.TextColumn("Désignation", width="large"),
                         "Type de Beton": st.column_config.TextColumn("Type de Beton", width="medium"),
                         "Volume (m3)": st.column_config.NumberColumn("Volume (m3)", width="medium"),
+                        "Bon": st.column_config.TextColumn("Bon", width="small"),
                     }
                 )
                 if st.button("Valider et Sauvegarder", key="save_b"):
-                    # SAUVEGARDE PHOTO SUR GITHUB
-                    if up_b is not None:
-                        sauvegarder_scan_github(up_b, nom_c, "Béton")
-                        
-                    df_clean = df_m.drop(columns=["Doute"], errors="ignore")
-                    sheets["Beton"] = pd.concat([df_beton, df_clean], ignore_index=True)
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    # SAUVEGARDE PHOTO + DONNÉES EN UN SEUL COMMIT (tout ou rien)
+                    df_clean = df_m.drop(columns=["Doute", "Bon"], errors="ignore")
+
+                    def publier_bons_beton(sheets_f, etat):
+                        sha_f, fichiers_f = etat
+                        with stockage.lot(f"Ajout {len(up_b or [])} bon(s) béton {nom_c}") as lot:
+                            chemins = {cle_scan(scan): sauvegarder_scan_github(scan, nom_c, "Béton", lot) for scan in up_b or []}
+                            indexer_scans(lot, dossier_c, chemins)
+                            if STOCKAGE_MODE == "journal":
+                                ajouter_entree(stockage, dossier_c, "Beton", df_clean, lot)
+                                materialiser(lot, dossier_c, sheets_f, version_chantier(sha_f, shas_journal(dossier_c, fichiers_f, lot)))
+                            else:
+                                sauvegarder_excel_github(sheets_f, path_f, sha_f, lot, fichiers_f)
+                    enregistrer_chantier(nom_c, Delta().ajouter("Beton", df_clean, COLS_BETON), (sheets, (sha, fichiers_journal)), publier_bons_beton)
                     st.session_state.relecture = None
                     st.session_state.termes_inconnus = []
+                    st.session_state.suggestions = {}
+                    st.session_state.scans_pretraites = {}
+                    st.session_state.empreintes_scans = {}
+                    st.session_state.doublons = []
                     st.rerun()
             st.divider()
             st.dataframe(df_beton, width='stretch')
 
         # --- 3. ACIER ---
         with tab_acier:
-            up_a = st.file_uploader("Bon acier", type=['jpg','png','heic'], key="up_a")
+            up_a = st.file_uploader("Bon acier", type=['jpg','png','heic'], key="up_a", accept_multiple_files=True)
             if up_a and st.session_state.relecture is None:
-                if st.button("Envoyer Bon", key="btn_a", type="primary"):
-                    with st.spinner("IA en cours..."):
-                        res, raw_debug = analyser_ia(up_a, GOOGLE_API_KEY, f"Donnees acier JSON. Colonnes: {COLS_ACIER}")
-                        st.session_state.raw_debug = raw_debug
-                        
-                        # --- BLOC DE NETTOYAGE ET CONVERSION ---
-                        if not res.empty:
-                            # 1. Conversion des colonnes TEXTE (str)
-                            for col in ["Fournisseur", "Designation", "Type d Acier"]:
-                                if col in res.columns:
-                                    res[col] = res[col].fillna("").astype(str).replace('nan', '')
-                                else:
-                                    res[col] = ""
-                            
-                            # 2. Conversion des colonnes NUMERIQUES (float)
-                            if "Poids (kg)" in res.columns:
-                                res["Poids (kg)"] = pd.to_numeric(res["Poids (kg)"], errors='coerce').fillna(0.0).astype(float)
-                            else:
-                                res["Poids (kg)"] = 0.0
-
-                            # 3. Colonne Doute
-                            if "Doute" not in res.columns:
-                                res["Doute"] = False
-                            else:
-                                res["Doute"] = res["Doute"].astype(bool)
-
-                        cols_temp = ["Doute"] + COLS_ACIER
-                        res = res.reindex(columns=cols_temp)
-                        res = appliquer_correction_u(res, ["Designation"])
-                        res, inconnus = verifier_correspondance_budget(res, df_prev, col_scan="Designation")
-                        st.session_state.termes_inconnus = inconnus
-                        st.session_state.relecture = res
-                        st.rerun()
+                if st.button(f"Envoyer {len(up_a)} Bon(s)", key="btn_a", type="primary"):
+                    doc = DOCUMENTS["Acier"]
+                    res, inconnus, raw_debug = analyser_bons(
+                        up_a, doc.prompt, doc.colonnes, doc.cols_texte, doc.col_num, doc.cols_ditto, df_prev
+                    )
+                    st.session_state.raw_debug = raw_debug
+                    st.session_state.termes_inconnus = inconnus
+                    st.session_state.suggestions = index_budget(df_prev).suggerer(inconnus)
+                    st.session_state.relecture = res
+                    st.session_state.doublons = detecter_doublons(up_a, dossier_c)
+                    st.rerun()
 
             if st.session_state.relecture is not None and st.session_state.relecture.empty:
                  st.warning("L'IA n'a retourné aucune donnée. Vérifiez le format JSON ci-dessous.")
@@ -715,33 +729,47 @@ else:
                     st.code(st.session_state.raw_debug)
 
             if st.session_state.relecture is not None and not st.session_state.relecture.empty:
+                afficher_doublons()
                 if st.session_state.termes_inconnus:
                     st.warning(f"⚠️ Termes inconnus détectés : {', '.join(set(st.session_state.termes_inconnus))}. Veuillez corriger les lignes cochées.")
+                    proposer_corrections()
                 else:
                     st.info("Vérifiez les lignes.")
                     
                 df_m = st.data_editor(
                     st.session_state.relecture, 
                     key="edit_a",
-                    disabled=["Doute"],
+                    disabled=["Doute", "Bon"],
                     use_container_width=True,
                     column_config={
                         "Doute": st.column_config.CheckboxColumn("⚠️", default=False, width="small"),
                         "Fournisseur": st.column_config.TextColumn("Fournisseur", width="medium"),
                         "Designation": st.column_config.TextColumn("Désignation", width="large"),
                         "Poids (kg)": st.column_config.NumberColumn("Poids (kg)", width="medium"),
+                        "Bon": st.column_config.TextColumn("Bon", width="small"),
                     }
                 )
                 if st.button("Valider et Sauvegarder", key="save_a"):
-                    # SAUVEGARDE PHOTO SUR GITHUB
-                    if up_a is not None:
-                        sauvegarder_scan_github(up_a, nom_c, "Acier")
-                        
-                    df_clean = df_m.drop(columns=["Doute"], errors="ignore")
-                    sheets["Acier"] = pd.concat([df_acier, df_clean], ignore_index=True)
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    # SAUVEGARDE PHOTO + DONNÉES EN UN SEUL COMMIT (tout ou rien)
+                    df_clean = df_m.drop(columns=["Doute", "Bon"], errors="ignore")
+
+                    def publier_bons_acier(sheets_f, etat):
+                        sha_f, fichiers_f = etat
+                        with stockage.lot(f"Ajout {len(up_a or [])} bon(s) acier {nom_c}") as lot:
+                            chemins = {cle_scan(scan): sauvegarder_scan_github(scan, nom_c, "Acier", lot) for scan in up_a or []}
+                            indexer_scans(lot, dossier_c, chemins)
+                            if STOCKAGE_MODE == "journal":
+                                ajouter_entree(stockage, dossier_c, "Acier", df_clean, lot)
+                                materialiser(lot, dossier_c, sheets_f, version_chantier(sha_f, shas_journal(dossier_c, fichiers_f, lot)))
+                            else:
+                                sauvegarder_excel_github(sheets_f, path_f, sha_f, lot, fichiers_f)
+                    enregistrer_chantier(nom_c, Delta().ajouter("Acier", df_clean, COLS_ACIER), (sheets, (sha, fichiers_journal)), publier_bons_acier)
                     st.session_state.relecture = None
                     st.session_state.termes_inconnus = []
+                    st.session_state.suggestions = {}
+                    st.session_state.scans_pretraites = {}
+                    st.session_state.empreintes_scans = {}
+                    st.session_state.doublons = []
                     st.rerun()
             st.divider()
             st.dataframe(df_acier, width='stretch')
@@ -759,44 +787,39 @@ else:
                     submitted = st.form_submit_button("Ajouter (+)")
                     if submitted and new_des:
                         new_row = pd.DataFrame([{"Designation": new_des, "Prevu (m3)": new_vol, "Zone": new_zone}])
-                        sheets["Previsionnel"] = pd.concat([df_prev, new_row], ignore_index=True)
-                        sauvegarder_excel_github(sheets, path_f, sha)
+                        enregistrer_chantier(nom_c, Delta().ajouter("Previsionnel", new_row, COLS_PREV), (sheets, (sha, fichiers_journal)))
                         st.rerun()
 
             with col_standard:
                 st.subheader("Grille de Saisie Standard")
                 if not df_prev.empty:
-                    df_prev["_key"] = df_prev["Designation"].astype(str) + "_" + df_prev["Zone"].astype(str)
-                    existing_keys = df_prev["_key"].tolist()
+                    # Clés calculées à part : une colonne ajoutée ici finirait dans le classeur publié
+                    existing_keys = (df_prev["Designation"].astype(str) + "_" + df_prev["Zone"].astype(str)).tolist()
                     rows_to_add = []
                     for item in STANDARD_ITEMS:
                         key = item["Designation"] + "_" + item["Zone"]
                         if key not in existing_keys:
                             rows_to_add.append({"Designation": item["Designation"], "Prevu (m3)": 0.0, "Zone": item["Zone"]})
                     if rows_to_add:
-                        new_standard_df = pd.DataFrame(rows_to_add)
-                        df_prev = pd.concat([df_prev, new_standard_df], ignore_index=True)
-                        if "_key" in df_prev.columns: df_prev = df_prev.drop(columns=["_key"])
-                        sheets["Previsionnel"] = df_prev
-                        sauvegarder_excel_github(sheets, path_f, sha)
+                        # Lignes standard à 0 : sans effet sur une ligne déjà ajoutée par un autre utilisateur
+                        df_complet = pd.concat([df_prev, pd.DataFrame(rows_to_add)], ignore_index=True)
+                        enregistrer_chantier(nom_c, Delta().modifier("Previsionnel", df_prev, df_complet), (sheets, (sha, fichiers_journal)))
                         st.rerun()
-                    if "_key" in df_prev.columns: df_prev = df_prev.drop(columns=["_key"])
                 else:
-                    df_prev = pd.DataFrame(STANDARD_ITEMS)
-                    df_prev["Prevu (m3)"] = 0.0
-                    sheets["Previsionnel"] = df_prev
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    df_standard = pd.DataFrame(STANDARD_ITEMS)
+                    df_standard["Prevu (m3)"] = 0.0
+                    enregistrer_chantier(nom_c, Delta().modifier("Previsionnel", df_prev, df_standard), (sheets, (sha, fichiers_journal)))
                     st.rerun()
 
                 st.markdown("### INFRA")
-                df_infra = df_prev[df_prev["Zone"] == "INFRA"].sort_values(by="Designation")
+                df_infra = df_prev[df_prev["Zone"] == "INFRA"].sort_values(by="Designation", kind="stable")
                 edited_infra = st.data_editor(
                     df_infra, key="edit_infra", use_container_width=True, disabled=["Designation", "Zone"], hide_index=True,
                     column_config={"Designation": st.column_config.TextColumn("Elément", width="medium"), "Zone": None, "Prevu (m3)": st.column_config.NumberColumn("Quantité (m3)", width="small", required=True)}
                 )
 
                 st.markdown("### SUPER")
-                df_super = df_prev[df_prev["Zone"] == "SUPER"].sort_values(by="Designation")
+                df_super = df_prev[df_prev["Zone"] == "SUPER"].sort_values(by="Designation", kind="stable")
                 edited_super = st.data_editor(
                     df_super, key="edit_super", use_container_width=True, disabled=["Designation", "Zone"], hide_index=True,
                     column_config={"Designation": st.column_config.TextColumn("Elément", width="medium"), "Zone": None, "Prevu (m3)": st.column_config.NumberColumn("Quantité (m3)", width="small", required=True)}
@@ -805,8 +828,8 @@ else:
                 if st.button("Enregistrer les Quantités", key="save_std_list", type="primary"):
                     df_others = df_prev[~df_prev["Zone"].isin(["INFRA", "SUPER"])]
                     df_final_prev = pd.concat([edited_infra, edited_super, df_others], ignore_index=True)
-                    sheets["Previsionnel"] = df_final_prev
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    # Seules les quantités modifiées ici sont reportées sur le classeur publié
+                    enregistrer_chantier(nom_c, Delta().modifier("Previsionnel", df_prev, df_final_prev), (sheets, (sha, fichiers_journal)))
                     st.success("Budget mis à jour !")
                     st.rerun()
 
@@ -835,8 +858,7 @@ else:
                     }
                 )
                 if st.button("Sauvegarder Étude Béton", key="save_etude_beton"):
-                    sheets["Etude_Beton"] = edited_etude_beton
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    enregistrer_chantier(nom_c, Delta().modifier("Etude_Beton", df_etude_beton, edited_etude_beton), (sheets, (sha, fichiers_journal)))
                     st.success("Données Béton sauvegardées")
 
             with col_a:
@@ -868,20 +890,22 @@ else:
                             "Acier TS": new_ts, 
                             "Zone": new_zone_a
                         }])
-                        df_etude_acier = pd.concat([edited_etude_acier, new_row_a], ignore_index=True)
-                        sheets["Etude_Acier"] = df_etude_acier
-                        sauvegarder_excel_github(sheets, path_f, sha)
+                        df_complet_a = pd.concat([edited_etude_acier, new_row_a], ignore_index=True)
+                        enregistrer_chantier(nom_c, Delta().modifier("Etude_Acier", df_etude_acier, df_complet_a), (sheets, (sha, fichiers_journal)))
                         st.rerun()
                 if st.button("Sauvegarder Tableau Acier", key="save_etude_acier_global"):
-                    sheets["Etude_Acier"] = edited_etude_acier
-                    sauvegarder_excel_github(sheets, path_f, sha)
+                    enregistrer_chantier(nom_c, Delta().modifier("Etude_Acier", df_etude_acier, edited_etude_acier), (sheets, (sha, fichiers_journal)))
                     st.success("Données Acier sauvegardées")
         
         # --- 6. ADMIN (ONGLET CACHÉ) ---
         if st.session_state.is_admin:
             with all_tabs[5]:
                 st.header("⚙️ Administration & Configurations")
-                tab_pointage, tab_aco = st.tabs(["Pointages", "ACO"])
+                onglets_admin = ["Pointages", "ACO", "Performance"]
+                if STOCKAGE_MODE == "journal":
+                    onglets_admin.append("Journal")
+                admin_tabs = st.tabs(onglets_admin)
+                tab_pointage, tab_aco, tab_perf = admin_tabs[:3]
 
                 with tab_pointage:
                     st.subheader("📸 Gestion des Pointages")
@@ -889,7 +913,7 @@ else:
                     path_pointages = f"{BASE_DIR}/{nom_c}/POINTAGES"
                     dossiers_existants = []
                     try:
-                        contents = repo.get_contents(path_pointages)
+                        contents = stockage.lister(path_pointages)
                         dossiers_existants = [c.name for c in contents if c.type == "dir"]
                     except:
                         pass
@@ -906,7 +930,7 @@ else:
                         st.markdown("### 📂 Menu")
                         if st.button(f"➕ {nom_dossier_actuel}", use_container_width=True):
                             try:
-                                repo.create_file(f"{path_pointages}/{nom_dossier_actuel}/.init", "Init", "")
+                                stockage.ecrire(f"{path_pointages}/{nom_dossier_actuel}/.init", b"", "Init")
                                 st.success(f"Dossier {nom_dossier_actuel} créé !")
                                 st.rerun()
                             except:
@@ -931,29 +955,37 @@ else:
                             img_up = st.file_uploader("Ajouter une photo", type=['png', 'jpg', 'jpeg'])
                             if img_up:
                                 if st.button("Sauvegarder la photo"):
-                                    file_path = f"{path_img_folder}/{img_up.name}"
                                     try:
-                                        repo.create_file(file_path, f"Add img {img_up.name}", img_up.getvalue())
+                                        ajouter_photo(stockage, path_img_folder, img_up.name, img_up.getvalue())
                                         st.success("Photo envoyée !")
                                         st.rerun()
                                     except Exception as e:
                                         st.error(f"Erreur: {e}")
 
-                            # Affichage Liste Fichiers (SANS IMAGE - JUSTE NOM ET BOUTONS)
+                            # Affichage Liste Fichiers : une page à la fois, vignettes seulement
                             st.divider()
-                            st.write(f"Fichiers dans {choix_dossier} :")
                             try:
-                                imgs = repo.get_contents(path_img_folder)
-                                valid_imgs = [i for i in imgs if i.name.lower().endswith(('.png', '.jpg', '.jpeg', '.heic'))]
+                                valid_imgs = lister_photos(stockage, path_img_folder)
                                 
                                 if not valid_imgs:
                                     st.info("Aucun fichier.")
                                 else:
-                                    for img in valid_imgs:
-                                        # On utilise des colonnes pour pousser à droite
-                                        # Filename (Gros) | Download (Moyen) | Delete (Moyen)
-                                        c1, c2, c3 = st.columns([6, 2, 2])
+                                    nb_pages = paginer(valid_imgs, 1, POINTAGES_PAR_PAGE)[1]
+                                    c_info, c_page = st.columns([6, 2])
+                                    with c_info:
+                                        st.write(f"{len(valid_imgs)} fichier(s) dans {choix_dossier} :")
+                                    with c_page:
+                                        num_page = st.number_input("Page", 1, nb_pages, 1, key=f"page_{choix_dossier}", label_visibility="collapsed") if nb_pages > 1 else 1
+                                    page_imgs, _ = paginer(valid_imgs, num_page, POINTAGES_PAR_PAGE)
+                                    vignettes = miniatures(stockage, path_img_folder, page_imgs)
+                                    for img in page_imgs:
+                                        # Vignette (Petit) | Filename (Gros) | Download (Moyen) | Delete (Moyen)
+                                        c0, c1, c2, c3 = st.columns([1, 5, 2, 2])
                                         
+                                        with c0:
+                                            if vignettes.get(img.name):
+                                                st.image(vignettes[img.name], width='stretch')
+
                                         with c1:
                                             # On aligne verticalement le texte pour qu'il soit au niveau des boutons
                                             st.markdown(f"<div style='padding-top: 5px;'>📄 <b>{img.name}</b></div>", unsafe_allow_html=True)
@@ -961,7 +993,8 @@ else:
                                         with c2:
                                             st.download_button(
                                                 label="⬇️",
-                                                data=img.decoded_content,
+                                                # Contenu lu seulement au clic
+                                                data=functools.partial(stockage.lire, img.path),
                                                 file_name=img.name,
                                                 key=f"dl_{img.sha}",
                                                 use_container_width=True # Prend toute la largeur de la petite colonne
@@ -970,7 +1003,7 @@ else:
                                         with c3:
                                             if st.button("🗑️", key=f"del_{img.sha}", use_container_width=True):
                                                 try:
-                                                    repo.delete_file(img.path, f"Delete {img.name}", img.sha)
+                                                    supprimer_photo(stockage, path_img_folder, img)
                                                     st.toast(f"Fichier {img.name} supprimé !")
                                                     st.rerun()
                                                 except Exception as e:
@@ -983,6 +1016,61 @@ else:
 
                 with tab_aco:
                     st.write("En attente...")
+
+                with tab_perf:
+                    st.subheader("⏱️ Performance")
+                    releves = {
+                        "Rerun précédent": st.session_state.get("perf_precedent"),
+                        "Rerun en cours (jusqu'ici)": st.session_state.perf_rerun,
+                        "Session": st.session_state.perf_session,
+                        "Processus (toutes sessions)": mesures.CUMUL_PROCESSUS,
+                    }
+                    vue = st.radio("Relevé", list(releves), horizontal=True, key="perf_vue", label_visibility="collapsed")
+                    releve = releves[vue]
+                    if releve is None or not releve.stats:
+                        st.info("Aucune mesure.")
+                    else:
+                        if vue == "Rerun précédent":
+                            st.caption(f"Durée du rerun : {releve.duree * 1000:.0f} ms" if releve.duree is not None
+                                       else "Rerun interrompu (st.rerun / st.stop) : durée totale inconnue")
+                        elif vue == "Session":
+                            st.caption(f"{st.session_state.perf_nb_reruns - 1} rerun(s) cumulé(s)")
+                        st.dataframe(
+                            releve.tableau(), hide_index=True, width='stretch',
+                            column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ["Total (ms)", "Moyenne (ms)", "Max (ms)", "Ko"]},
+                        )
+                    if demarrage.DUREE_IMPORTS is not None:
+                        st.caption(f"Imports du script au démarrage du processus : {demarrage.DUREE_IMPORTS * 1000:.0f} ms "
+                                   "(dépendances lourdes : mesures import.*, au premier usage)")
+                    journaux = mesures.journal_actif()
+                    st.caption(f"Journal JSONL : {', '.join(journaux)}" if journaux else "Journal JSONL désactivé (secret MESURES_JOURNAL).")
+                    if st.button("Remettre à zéro la session", key="perf_raz"):
+                        st.session_state.perf_session = mesures.Releve("session")
+                        st.session_state.perf_nb_reruns = 0
+                        st.session_state.pop("perf_precedent", None)
+                        st.rerun()
+
+                if STOCKAGE_MODE == "journal":
+                    with admin_tabs[3]:
+                        st.subheader("🗒️ Journal des bons")
+                        en_attente = nb_entrees_en_attente(sheets_instantane, journal)
+                        if any(en_attente.values()):
+                            for feuille, nb in en_attente.items():
+                                st.write(f"{feuille} : {nb} bon(s) non repliés dans {nom_c}.xlsx")
+                        else:
+                            st.info("Aucune entrée en attente.")
+                        st.caption(f"{len(fichiers_journal)} fichier(s) de journal.")
+                        if fichiers_journal and st.button("Compacter le journal", key="compacter_journal", type="primary"):
+                            try:
+                                nb_supp = compacter(stockage, dossier_c, sheets, fichiers_journal, path_f, sha, sauvegarder_excel_github)
+                            except ConflitStockage:
+                                CACHE_CLASSEURS.invalider(path_f)
+                                st.error("Le chantier a été modifié entre-temps : rien n'a été compacté. Rechargez puis compactez à nouveau.")
+                                st.stop()
+                            st.success(f"Journal replié dans le classeur ({nb_supp} fichier(s) de journal supprimé(s)).")
+                            st.rerun()
                 
     else:
         st.error("Fichier introuvable.")
+
+st.session_state.perf_rerun.terminer()
@@ -0,0 +1,19 @@
+import json
+
+from bench.perf import ETAPES, REFERENCE, TAILLES_DEFAUT, comparer
+
+
+def test_reference_couvre_toutes_les_etapes():
+    with open(REFERENCE, encoding="utf-8") as f:
+        reference = json.load(f)
+    assert sorted(reference["resultats"]) == sorted(map(str, TAILLES_DEFAUT))
+    for etapes in reference["resultats"].values():
+        assert set(etapes) == set(ETAPES)
+
+
+def test_comparer_signale_les_regressions():
+    reference = {"resultats": {"100": {"recap": {"s": 0.1}, "idem": {"s": 0.001}}}}
+    actuel = {"resultats": {"100": {"recap": {"s": 0.2}, "idem": {"s": 0.01}}}}
+    # idem reste sous la durée minimale comparée : le bruit domine
+    assert comparer(actuel, reference) == [("100", "recap", 0.1, 0.2)]
+    assert comparer(reference, reference) == []
@@ -0,0 +1,38 @@
+from bench.modele_factice import ModeleFactice, installer, reponse_bon
+from itb77.cache_ocr import CacheOCR
+from itb77.ocr import LimiteurDebit, extraire_bon, schema_reponse
+from itb77.schema import COLS_BETON
+
+LIMITEUR = LimiteurDebit(par_minute=10 ** 6, rafale=10 ** 6)
+
+
+def _extraire(data, cache):
+    return extraire_bon({"mime_type": "image/jpeg", "data": data}, "bon", LIMITEUR, cache, schema_reponse(COLS_BETON))
+
+
+def test_reponse_relue_puis_invalidee(tmp_path):
+    cache = CacheOCR(str(tmp_path / "ocr"))
+    modele = ModeleFactice(lambda contenu, config: reponse_bon(COLS_BETON, 3, seed=len(contenu[1]["data"])))
+    with installer(modele):
+        frais, _ = _extraire(b"photo", cache)
+        relu, debug = _extraire(b"photo", cache)
+        assert sum(modele.appels.values()) == 1
+        assert "cache OCR" in debug
+        assert relu.equals(frais)
+        # Autre image (contenu différent) : nouvelle clé, le modèle est rappelé
+        autre, _ = _extraire(b"autre photo", cache)
+    assert sum(modele.appels.values()) == 2
+    assert not autre.equals(frais)
+    assert (cache.hits, cache.misses) == (1, 2)
+    # Un cache neuf sur le même dossier relit les réponses gardées
+    with installer(ModeleFactice([500])):
+        assert _extraire(b"photo", CacheOCR(cache.dossier))[0].equals(frais)
+
+
+def test_reponse_tronquee_non_gardee(tmp_path):
+    cache = CacheOCR(str(tmp_path / "ocr"))
+    tronquee = reponse_bon(COLS_BETON, 5)[:-40]
+    with installer(ModeleFactice([tronquee, reponse_bon(COLS_BETON, 5)])) as modele:
+        _extraire(b"photo", cache)
+        df, _ = _extraire(b"photo", cache)
+    assert sum(modele.appels.values()) == 2 and len(df) == 5
@@ -0,0 +1,45 @@
+import io
+
+from PIL import Image
+
+from itb77 import doublons
+from itb77.doublons import actualiser_index, comparer, indexer
+from itb77.images import empreinte_perceptuelle
+from itb77.stockage import StockageLocal
+
+DOSSIER = "CHANTIERS/A"
+
+
+def _photo(angle, taille=(320, 240)):
+    sortie = io.BytesIO()
+    Image.linear_gradient("L").rotate(angle).resize(taille).convert("RGB").save(sortie, format="JPEG")
+    return sortie.getvalue()
+
+
+def test_index_des_scans_repris_puis_invalide(tmp_path, monkeypatch):
+    stockage = StockageLocal(tmp_path)
+    stockage.ecrire(f"{DOSSIER}/SCANS_BETON/a.jpg", _photo(0), "scan")
+    stockage.ecrire(f"{DOSSIER}/SCANS_BETON/b.jpg", _photo(90), "scan")
+    monkeypatch.setattr(doublons, "_par_sha", {})
+    index, modifie = actualiser_index(stockage, DOSSIER)
+    assert modifie
+    assert index["SCANS_BETON/a.jpg"] == [stockage.sha(f"{DOSSIER}/SCANS_BETON/a.jpg"), f"{empreinte_perceptuelle('a.jpg', _photo(0)):016x}"]
+    with stockage.lot("Index scans") as lot:
+        indexer(lot, DOSSIER, index, {})
+
+    # Index publié et à jour : aucun scan n'est relu ni haché
+    monkeypatch.setattr(doublons, "_par_sha", {})
+    relus = []
+    lire_blob = stockage.lire_blob
+    monkeypatch.setattr(stockage, "lire_blob", lambda path, sha: relus.append(path) or lire_blob(path, sha))
+    repris, modifie = actualiser_index(stockage, DOSSIER)
+    assert (repris, modifie, relus) == (index, False, [])
+    assert comparer(repris, [("envoi.jpg", empreinte_perceptuelle("envoi.jpg", _photo(0, (160, 120))))])[0][:2] == ("envoi.jpg", "SCANS_BETON/a.jpg")
+
+    # Scan remplacé : son sha change, seule son entrée est recalculée
+    path = f"{DOSSIER}/SCANS_BETON/a.jpg"
+    stockage.ecrire(path, _photo(45), "scan", stockage.sha(path))
+    recalcule, modifie = actualiser_index(stockage, DOSSIER)
+    assert modifie and relus == [path]
+    assert recalcule["SCANS_BETON/a.jpg"] == [stockage.sha(path), f"{empreinte_perceptuelle('a.jpg', _photo(45)):016x}"]
+    assert recalcule["SCANS_BETON/b.jpg"] == index["SCANS_BETON/b.jpg"]
@@ -0,0 +1,94 @@
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from itb77 import exports
+from itb77.exports import empreinte, etat, generer, largeurs_colonnes, lancer
+
+
+def _cle():
+    return uuid.uuid4().hex
+
+
+def _attendre(cle):
+    statut, data = etat(cle)
+    while statut == "en_cours":
+        threading.Event().wait(0.01)
+        statut, data = etat(cle)
+    return statut, data
+
+
+def test_largeurs_colonnes():
+    df = pd.DataFrame({"Designation": ["Voile", "Plancher Haut", "Voile", None],
+                       "Volume (m3)": [1.5, np.nan, 123.25, 1.5], "N": [1, 2, 3, 4]})
+    assert largeurs_colonnes(df) == [15, 13, 3]
+    # Même résultat que la conversion de toutes les cellules
+    longueurs = df.astype(str).apply(lambda s: s.str.len()).max().fillna(0)
+    assert largeurs_colonnes(df) == [int(max(l, len(c))) + 2 for c, l in zip(df.columns, longueurs)]
+    assert largeurs_colonnes(df.iloc[:0]) == [13, 13, 3]
+    assert largeurs_colonnes(pd.DataFrame({"Bon": [None, np.nan]})) == [5]
+
+
+def test_empreinte_suit_le_contenu():
+    df = pd.DataFrame({"Designation": ["Voile"], "Volume (m3)": [1.5]})
+    assert empreinte(df, "A") == empreinte(df.copy(), "A")
+    modifie = df.copy()
+    modifie.loc[0, "Volume (m3)"] = 2.0
+    assert empreinte(modifie, "A") != empreinte(df, "A")
+    assert empreinte(df, "B") != empreinte(df, "A")
+
+
+def test_generer_memorise():
+    appels = []
+
+    def fn(x):
+        appels.append(x)
+        return f"pdf {x}".encode()
+
+    cle = _cle()
+    assert etat(cle) == ("absent", None)
+    assert generer(cle, fn, 1) == b"pdf 1"
+    assert generer(cle, fn, 1) == b"pdf 1"
+    assert appels == [1]
+    assert etat(cle) == ("pret", b"pdf 1")
+
+
+def test_memoire_bornee(monkeypatch):
+    monkeypatch.setattr(exports, "TAILLE_MEMO", 2)
+    cles = [_cle() for _ in range(3)]
+    for i, cle in enumerate(cles):
+        generer(cle, bytes, i)
+    assert etat(cles[0]) == ("absent", None)
+    assert etat(cles[2])[0] == "pret"
+
+
+def test_lancer_en_arriere_plan_sur_une_copie():
+    feu = threading.Event()
+    appels = []
+
+    def fn(df):
+        feu.wait(5)
+        appels.append(1)
+        return df["Designation"].iloc[0].encode()
+
+    cle = _cle()
+    df = pd.DataFrame({"Designation": ["Voile"]})
+    lancer(cle, fn, df)
+    lancer(cle, fn, df)  # déjà en cours : pas de second calcul
+    df.loc[0, "Designation"] = "Dalle"  # la page modifie ses données pendant la génération
+    assert etat(cle) == ("en_cours", None)
+    feu.set()
+    assert _attendre(cle) == ("pret", b"Voile")
+    assert appels == [1]
+
+
+def test_erreur_en_arriere_plan_remontee():
+    def fn():
+        raise ValueError("police absente")
+
+    cle = _cle()
+    lancer(cle, fn)
+    statut, exc = _attendre(cle)
+    assert statut == "erreur" and isinstance(exc, ValueError)
@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+
+from itb77.fusion import Delta, publier_avec_reprise
+from itb77.stockage import ConflitStockage
+
+
+def _prev(*lignes):
+    return pd.DataFrame(list(lignes), columns=["Designation", "Zone", "Prevu (m3)"])
+
+
+def _bons(*designations):
+    return pd.DataFrame({"Designation": list(designations), "Volume (m3)": [1.0] * len(designations)})
+
+
+def _lignes(df):
+    return df.values.tolist()
+
+
+def test_ajouts_concurrents_conserves():
+    delta = Delta().ajouter("Beton", _bons("Dalle"))
+    distant = {"Beton": _bons("Voile", "Poteau")}  # un bon ajouté ailleurs entre-temps
+    fusion = delta.appliquer(distant)
+    assert fusion["Beton"]["Designation"].tolist() == ["Voile", "Poteau", "Dalle"]
+    assert distant["Beton"]["Designation"].tolist() == ["Voile", "Poteau"]
+
+
+def test_cellules_differentes_de_la_meme_feuille():
+    avant = _prev(["Voile", "INFRA", 10.0], ["Dalle", "SUPER", 5.0])
+    delta = Delta().modifier("Previsionnel", avant, _prev(["Voile", "INFRA", 12.0], ["Dalle", "SUPER", 5.0]))
+    distant = {"Previsionnel": _prev(["Voile", "INFRA", 10.0], ["Dalle", "SUPER", 7.0])}
+    assert _lignes(delta.appliquer(distant)["Previsionnel"]) == [["Voile", "INFRA", 12.0], ["Dalle", "SUPER", 7.0]]
+
+
+def test_suppression_d_une_ligne_de_meme_cle():
+    avant = _prev(["Voile", "INFRA", 10.0], ["Voile", "INFRA", 20.0], ["Dalle", "SUPER", 5.0])
+    # La première ligne "Voile" supprimée : la seconde prend son rang
+    apres = _prev(["Voile", "INFRA", 20.0], ["Dalle", "SUPER", 5.0])
+    delta = Delta().modifier("Previsionnel", avant, apres)
+    assert _lignes(delta.appliquer({"Previsionnel": avant})["Previsionnel"]) == _lignes(apres)
+    distant = _prev(["Voile", "INFRA", 10.0], ["Voile", "INFRA", 20.0], ["Dalle", "SUPER", 8.0])
+    assert _lignes(delta.appliquer({"Previsionnel": distant})["Previsionnel"]) == [["Voile", "INFRA", 20.0], ["Dalle", "SUPER", 8.0]]
+
+
+def test_ligne_ajoutee_des_deux_cotes():
+    colonnes = ["Designation", "Acier HA", "Acier TS", "Zone"]
+    avant = pd.DataFrame([["Voile", 100.0, 10.0, "INFRA"]], columns=colonnes)
+    apres = pd.DataFrame([["Voile", 100.0, 10.0, "INFRA"], ["Mur", 80.0, 0.0, "SUPER"]], columns=colonnes)
+    delta = Delta().modifier("Etude_Acier", avant, apres)
+    distant = pd.DataFrame([["Voile", 100.0, 10.0, "INFRA"], ["Mur", 50.0, 30.0, "SUPER"]], columns=colonnes)
+    # Seules les valeurs renseignées sont reportées : 0 compte comme vide, le TS distant reste
+    assert _lignes(delta.appliquer({"Etude_Acier": distant})["Etude_Acier"]) == [["Voile", 100.0, 10.0, "INFRA"], ["Mur", 80.0, 30.0, "SUPER"]]
+
+
+def test_ligne_modifiee_supprimee_ailleurs_recreee():
+    avant = _prev(["Voile", "INFRA", 10.0], ["Dalle", "SUPER", 5.0])
+    delta = Delta().modifier("Previsionnel", avant, _prev(["Voile", "INFRA", 10.0], ["Dalle", "SUPER", 6.0]))
+    distant = {"Previsionnel": _prev(["Voile", "INFRA", 10.0])}
+    assert _lignes(delta.appliquer(distant)["Previsionnel"]) == [["Voile", "INFRA", 10.0], ["Dalle", "SUPER", 6.0]]
+
+
+def test_delta_vide():
+    avant = _prev(["Voile", "INFRA", 10.0])
+    assert not Delta().modifier("Previsionnel", avant, avant.copy())
+
+
+def test_reprise_sur_le_classeur_recharge():
+    publies = []
+
+    def publier(sheets, etat):
+        publies.append((sheets["Beton"]["Designation"].tolist(), etat))
+        if len(publies) == 1:
+            raise ConflitStockage("sha périmé")
+
+    delta = Delta().ajouter("Beton", _bons("Dalle"))
+    fusion, reprises = publier_avec_reprise(delta, ({"Beton": _bons("Voile")}, "sha1"), publier,
+                                            lambda: ({"Beton": _bons("Voile", "Poteau")}, "sha2"), attente=0)
+    assert reprises == 1
+    assert publies == [(["Voile", "Dalle"], "sha1"), (["Voile", "Poteau", "Dalle"], "sha2")]
+    assert fusion["Beton"]["Designation"].tolist() == ["Voile", "Poteau", "Dalle"]
+
+
+def test_reprise_abandonnee_apres_essais():
+    appels = {"publier": 0, "recharger": 0}
+
+    def publier(sheets, etat):
+        appels["publier"] += 1
+        raise ConflitStockage("sha périmé")
+
+    def recharger():
+        appels["recharger"] += 1
+        return {"Beton": _bons("Voile")}, "sha"
+
+    with pytest.raises(ConflitStockage):
+        publier_avec_reprise(Delta().ajouter("Beton", _bons("Dalle")), ({"Beton": _bons("Voile")}, "sha"),
+                             publier, recharger, essais=3, attente=0)
+    assert appels == {"publier": 3, "recharger": 2}
+
+
+def test_classeur_disparu_au_rechargement():
+    def publier(sheets, etat):
+        raise ConflitStockage("sha périmé")
+
+    with pytest.raises(ConflitStockage, match="introuvable"):
+        publier_avec_reprise(Delta().ajouter("Beton", _bons("Dalle")), ({}, None), publier, lambda: (None, None), attente=0)
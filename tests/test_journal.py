@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from itb77.journal import FEUILLE_IDS, ajouter_entree, compacter, fusionner, lire_journal, nb_entrees_en_attente
+from itb77.schema import lire_classeur, serialiser_classeur, typer_classeur
+from itb77.stockage import ConflitStockage, StockageLocal
+
+DOSSIER = "CHANTIERS/A"
+PATH = f"{DOSSIER}/A.xlsx"
+
+
+def _bon(designation, volume):
+    return pd.DataFrame({"Fournisseur": ["F"], "Designation": [designation], "Type de Beton": ["C25/30"], "Volume (m3)": [volume]})
+
+
+def _sauvegarder(sheets, path, sha, lot=None):
+    return lot.ecrire(path, serialiser_classeur(sheets), sha)
+
+
+@pytest.fixture
+def stockage(tmp_path):
+    stockage = StockageLocal(tmp_path)
+    stockage.ecrire(PATH, serialiser_classeur(typer_classeur({"Beton": _bon("Voile", 2.0)})), "Create")
+    ajouter_entree(stockage, DOSSIER, "Beton", _bon("Dalle", 3.0))
+    ajouter_entree(stockage, DOSSIER, "Beton", _bon("Poteau", 1.5))
+    return stockage
+
+
+def _lire(stockage):
+    sheets = lire_classeur(stockage.lire(PATH))
+    journal, fichiers = lire_journal(stockage, DOSSIER)
+    return sheets, journal, fichiers
+
+
+def test_ajout_lecture_compactage(stockage):
+    sheets, journal, fichiers = _lire(stockage)
+    assert nb_entrees_en_attente(sheets, journal) == {"Beton": 2}
+    fusion = fusionner(sheets, journal)
+    assert fusion["Beton"]["Designation"].tolist() == ["Voile", "Dalle", "Poteau"]
+
+    assert compacter(stockage, DOSSIER, fusion, fichiers, PATH, stockage.sha(PATH), _sauvegarder) == 1
+    sheets, journal, fichiers = _lire(stockage)
+    assert fichiers == [] and journal == {}
+    assert sheets["Beton"]["Designation"].tolist() == ["Voile", "Dalle", "Poteau"]
+    assert len(sheets[FEUILLE_IDS]) == 2
+
+
+def test_journal_modifie_avant_compactage(stockage):
+    sheets, journal, fichiers = _lire(stockage)
+    sha = stockage.sha(PATH)
+    ajouter_entree(stockage, DOSSIER, "Beton", _bon("Semelle", 4.0))  # ajouté par une autre session
+    classeur = stockage.lire(PATH)
+    with pytest.raises(ConflitStockage):
+        compacter(stockage, DOSSIER, fusionner(sheets, journal), fichiers, PATH, sha, _sauvegarder)
+    # Rien n'est publié : classeur inchangé, les trois entrées restent au journal
+    assert stockage.lire(PATH) == classeur
+    sheets, journal, _ = _lire(stockage)
+    assert nb_entrees_en_attente(sheets, journal) == {"Beton": 3}
+
+
+def test_classeur_modifie_avant_compactage(stockage):
+    sheets, journal, fichiers = _lire(stockage)
+    sha = stockage.sha(PATH)
+    stockage.ecrire(PATH, serialiser_classeur(typer_classeur({"Beton": _bon("Radier", 9.0)})), "Update", sha)
+    with pytest.raises(ConflitStockage):
+        compacter(stockage, DOSSIER, fusionner(sheets, journal), fichiers, PATH, sha, _sauvegarder)
+    assert [f.sha for f in lire_journal(stockage, DOSSIER)[1]] == [f.sha for f in fichiers]
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from itb77.nettoyage import DECLENCHEURS_DITTO, appliquer_correction_u
+
+
+def correction_u_boucle(df, colonnes_a_verifier, declencheurs=DECLENCHEURS_DITTO):
+    """Boucle historique de main.py, référence de sémantique."""
+    for col in colonnes_a_verifier:
+        if col in df.columns:
+            for i in range(1, len(df)):
+                valeur_actuelle = str(df.at[i, col]).strip()
+                if valeur_actuelle in declencheurs:
+                    df.at[i, col] = df.at[i-1, col]
+    return df
+
+
+@pytest.mark.parametrize("declencheurs", [DECLENCHEURS_DITTO, ("u", "U", '"', "id", "idem")])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_correction_u_identique_a_la_boucle(declencheurs, seed):
+    rng = np.random.default_rng(seed)
+    choix = np.array(["Voile R+1", "Dalle", "  u ", "U", '"', "Poteau", None, 3.5, "idem"], dtype=object)
+    df = pd.DataFrame({c: rng.choice(choix, 2000) for c in ["Designation", "Type de Beton"]})
+    colonnes = ["Designation", "Type de Beton", "Absente"]
+    vect = appliquer_correction_u(df.copy(), colonnes, declencheurs)
+    pd.testing.assert_frame_equal(vect, correction_u_boucle(df.copy(), colonnes, declencheurs))
+
+
+def test_premiere_ligne_jamais_remplacee():
+    df = pd.DataFrame({"Designation": ["u", "u", "Dalle", '"', "u"]})
+    assert appliquer_correction_u(df, ["Designation"])["Designation"].tolist() == ["u", "u", "Dalle", "Dalle", "Dalle"]
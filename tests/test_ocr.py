@@ -0,0 +1,100 @@
+import pytest
+
+from bench.modele_factice import DEFAUTS_ABIMES, ModeleFactice, abimer, installer, reponse_bon
+from itb77 import ocr
+from itb77.cache_ocr import CACHE_OCR, CacheOCR
+from itb77.images import ImagePretraitee
+from itb77.ocr import LimiteurDebit, analyser_lot, extraire_bon, schema_reponse
+from itb77.schema import COLS_BETON
+
+BLOB = {"mime_type": "image/jpeg", "data": b"bon"}
+
+
+def _extraire(modele):
+    with installer(modele):
+        return extraire_bon(BLOB, "bon", LimiteurDebit(par_minute=10 ** 6, rafale=10 ** 6), CacheOCR(), schema_reponse(COLS_BETON))
+
+
+@pytest.mark.parametrize("defaut", DEFAUTS_ABIMES)
+def test_reponse_abimee_lue(defaut):
+    df, debug = _extraire(ModeleFactice([abimer(reponse_bon(COLS_BETON, 5), defaut)]))
+    assert not df.empty, debug
+    assert set(COLS_BETON) <= set(df.columns)
+
+
+def test_modele_sans_sortie_structuree_rappele_sans_schema():
+    modele = ModeleFactice([reponse_bon(COLS_BETON, 3)], schema_accepte=False)
+    df, debug = _extraire(modele)
+    assert len(df) == 3, debug
+    assert modele.configs[-1] is None
+
+
+def test_reponse_illisible_donne_un_tableau_vide():
+    df, debug = _extraire(ModeleFactice(["Je ne peux pas lire ce bon."]))
+    assert df.empty
+    assert "illisible" in debug
+
+
+def _lot(fichiers, modele):
+    with installer(modele):
+        resultats = analyser_lot(fichiers, "cle", "bon", workers=3, limiteur=LimiteurDebit(par_minute=10 ** 6, rafale=10 ** 6),
+                                 pretraiter=lambda nom, data: ImagePretraitee(None, data, "JPEG", len(data), 0),
+                                 schema=schema_reponse(COLS_BETON))
+        return {nom: df for _, nom, df, _, _ in resultats}
+
+
+def test_lot_relu_depuis_le_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, "configurer", lambda api_key: None)
+    monkeypatch.setattr(CACHE_OCR, "dossier", str(tmp_path / "ocr"))
+    monkeypatch.setattr(CACHE_OCR, "_octets", None)
+    fichiers = [(f"bon{i}.jpg", f"photo {i}".encode()) for i in range(4)]
+    modele = ModeleFactice(lambda contenu, config: reponse_bon(COLS_BETON, 2, seed=contenu[1]["data"][-1]))
+    frais = _lot(fichiers, modele)
+    assert sum(modele.appels.values()) == 4
+
+    # Même lot renvoyé : aucun appel au modèle, mêmes lignes
+    relu = _lot(fichiers, modele)
+    assert sum(modele.appels.values()) == 4
+    assert all(relu[nom].equals(df) for nom, df in frais.items())
+
+    # Un bon re-photographié : seul lui repart au modèle
+    fichiers[1] = ("bon1.jpg", b"photo 1 bis")
+    _lot(fichiers, modele)
+    assert sum(modele.appels.values()) == 5
+
+
+def test_resolveur_modele_garde_la_liste(monkeypatch):
+    listages = []
+
+    def lister():
+        listages.append(1)
+        return ["models/gemini-pro", "models/gemini-1.5-flash", "models/gemini-1.5-flash-002"]
+
+    horloge = [1000.0]
+    monkeypatch.setattr(ocr.time, "monotonic", lambda: horloge[0])
+    resolveur = ocr.ResolveurModele(ttl=60, lister=lister)
+    assert resolveur.modele() == "gemini-1.5-flash"
+    assert resolveur.modele() == "gemini-1.5-flash"
+    assert (len(listages), resolveur.hits) == (1, 1)
+
+    # Quota dépassé : bascule sur le suivant sans relister, puis retour après la mise à l'écart
+    assert resolveur.basculer("gemini-1.5-flash", 30) == "gemini-1.5-flash-002"
+    assert resolveur.modele() == "gemini-1.5-flash-002" and len(listages) == 1
+    horloge[0] += 31
+    assert resolveur.modele() == "gemini-1.5-flash"
+
+    # TTL écoulé ou invalidation : nouveau listage
+    horloge[0] += 60
+    resolveur.modele()
+    resolveur.invalider()
+    resolveur.modele()
+    assert len(listages) == 3
+
+
+def test_resolveur_modele_secours_si_listage_impossible():
+    def lister():
+        raise ConnectionError("réseau")
+
+    resolveur = ocr.ResolveurModele(lister=lister)
+    assert resolveur.modele() == ocr.MODELE_SECOURS
+    assert resolveur.basculer(ocr.MODELE_SECOURS) is None
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from itb77.portefeuille import charger_portefeuille, lire_index, resumer, version_chantier
+from itb77.schema import lire_classeur, serialiser_classeur, typer_classeur
+from itb77.stockage import StockageLocal
+
+BASE = "CHANTIERS"
+
+
+def _classeur(volume):
+    return typer_classeur({
+        "Beton": pd.DataFrame({"Fournisseur": ["F"], "Designation": ["Voile"], "Type de Beton": ["C25/30"], "Volume (m3)": [volume]}),
+        "Previsionnel": pd.DataFrame({"Designation": ["Voile", "Dalle"], "Zone": ["SUPER", "SUPER"], "Prevu (m3)": [20.0, 8.0]}),
+    })
+
+
+def _lecteur(stockage, lus):
+    def lire_chantier(nom):
+        lus.append(nom)
+        path = f"{BASE}/{nom}/{nom}.xlsx"
+        return lire_classeur(stockage.lire(path)), version_chantier(stockage.sha(path))
+    return lire_chantier
+
+
+def test_index_relu_puis_perime(tmp_path):
+    stockage = StockageLocal(tmp_path)
+    for nom, volume in (("A", 5.0), ("B", 7.0)):
+        stockage.ecrire(f"{BASE}/{nom}/{nom}.xlsx", serialiser_classeur(_classeur(volume)), "Create")
+    lus = []
+    lire_chantier = _lecteur(stockage, lus)
+
+    index, recharges = charger_portefeuille(stockage, BASE, ["A", "B"], lire_chantier)
+    assert sorted(recharges) == ["A", "B"] and sorted(lire_index(stockage, BASE)) == ["A", "B"]
+    assert index["A"]["zones"] == resumer(_classeur(5.0)) == {"SUPER": {"prevu": 28.0, "consomme": 5.0, "etude": 0.0, "reste": 23.0}}
+
+    # Index à jour : une lecture, aucun chantier rechargé, mêmes totaux
+    lus.clear()
+    relu, recharges = charger_portefeuille(stockage, BASE, ["A", "B"], lire_chantier, verifier=True)
+    assert recharges == [] and lus == []
+    assert relu == index
+
+    # Classeur modifié hors de l'application : nouveau sha, seule son entrée est recalculée
+    path = f"{BASE}/A/A.xlsx"
+    stockage.ecrire(path, serialiser_classeur(_classeur(9.0)), "Update", stockage.sha(path))
+    relu, recharges = charger_portefeuille(stockage, BASE, ["A", "B"], lire_chantier, verifier=True)
+    assert recharges == ["A"] and lus == ["A"]
+    assert relu["A"]["zones"] == resumer(_classeur(9.0))
+    assert relu["A"]["version"] == version_chantier(stockage.sha(path))
+    assert relu["B"] == index["B"]
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench.perf import generer_chantier
+from itb77 import recap
+from itb77.nettoyage import detecter_zone_automatique, remove_accents
+from itb77.portefeuille import version_chantier
+from itb77.recap import (RecapMaterialise, calculer_recap, calculer_recaps, ecrire_sidecar, feuilles_acier, feuilles_recap,
+                         recap_materialise)
+from itb77.schema import serialiser_classeur, typer_classeur
+from itb77.stockage import StockageLocal
+
+
+def recap_boucle(df_beton, df_prev, df_etude_beton):
+    """Calcul historique de main.py (double boucle bons x lignes budget), référence de sémantique."""
+    df_calc = df_beton.copy()
+    df_calc["Volume (m3)"] = pd.to_numeric(df_calc["Volume (m3)"], errors='coerce').fillna(0)
+    df_target = df_prev.copy()
+    df_target["Prevu (m3)"] = pd.to_numeric(df_target["Prevu (m3)"], errors='coerce').fillna(0)
+    df_target["Zone"] = df_target["Zone"].fillna("INFRA")
+    df_target["Volume Reel"] = 0.0
+    df_etude_val = df_etude_beton.copy()
+    df_etude_val["Etude (m3)"] = pd.to_numeric(df_etude_val["Etude (m3)"], errors='coerce').fillna(0)
+    fondation_details = {}
+
+    for _, row_reel in df_calc.iterrows():
+        nom_reel = str(row_reel["Designation"]).strip()
+        type_reel = str(row_reel.get("Type de Beton", "")).strip()
+        vol_reel = row_reel["Volume (m3)"]
+        zone_du_bon = detecter_zone_automatique(nom_reel + " " + type_reel)
+        nom_reel_clean = remove_accents(nom_reel.lower())
+        type_reel_clean = remove_accents(type_reel.lower())
+        for idx_prev, row_prev in df_target.iterrows():
+            mot_cle_budget = remove_accents(str(row_prev["Designation"]).strip().lower())
+            if zone_du_bon == row_prev["Zone"]:
+                if mot_cle_budget in nom_reel_clean or mot_cle_budget in type_reel_clean:
+                    df_target.at[idx_prev, "Volume Reel"] += vol_reel
+                    if mot_cle_budget == "fondation":
+                        type_beton_reel = row_reel.get("Type de Beton", "Non spécifié")
+                        fondation_details[type_beton_reel] = fondation_details.get(type_beton_reel, 0.0) + vol_reel
+                    break
+
+    df_target = pd.merge(df_target, df_etude_val[["Designation", "Zone", "Etude (m3)"]], on=["Designation", "Zone"], how="left").fillna(0)
+    df_target["Reste (m3)"] = df_target["Prevu (m3)"] - df_target["Volume Reel"]
+    df_target["Avancement (%)"] = df_target.apply(lambda x: (x["Volume Reel"] / x["Prevu (m3)"] * 100) if x["Prevu (m3)"] > 0 else 0, axis=1)
+    return df_target, fondation_details
+
+
+COLONNES = ["Prevu (m3)", "Volume Reel", "Etude (m3)", "Reste (m3)", "Avancement (%)"]
+
+
+def _chantier(nb_bons, seed):
+    sheets = generer_chantier(nb_bons, nb_lignes_budget=60, seed=seed, taux_fautes=0.3)
+    # Bons hors budget, accentués ou incomplets
+    extra = pd.DataFrame({"Fournisseur": ["X"] * 4, "Designation": ["Élévation R-1", "Local technique", None, "FONDATION"],
+                          "Type de Beton": ["C25/30", None, "Gros béton", "C30/37"], "Volume (m3)": [2.5, 1.0, 3.0, None]})
+    sheets["Beton"] = pd.concat([sheets["Beton"], extra], ignore_index=True)
+    return sheets
+
+
+def _comparer(df_recap, fondation, reference):
+    df_ref, fondation_ref = reference
+    assert df_recap[["Designation", "Zone"]].values.tolist() == df_ref[["Designation", "Zone"]].values.tolist()
+    for col in COLONNES:
+        np.testing.assert_allclose(df_recap[col].to_numpy(dtype=np.float64), df_ref[col].to_numpy(dtype=np.float64),
+                                   rtol=1e-6, atol=1e-9, err_msg=col)
+    assert fondation.keys() == fondation_ref.keys()
+    for type_beton, volume in fondation_ref.items():
+        assert fondation[type_beton] == pytest.approx(volume, rel=1e-6)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_recap_identique_a_la_boucle(seed):
+    sheets = _chantier(400, seed)
+    reference = recap_boucle(sheets["Beton"], sheets["Previsionnel"], sheets["Etude_Beton"])
+    assert reference[1]  # le chantier exerce bien le détail des fondations
+    _comparer(*calculer_recap(*feuilles_recap(sheets)), reference)
+
+
+def test_recap_materialise_identique_a_la_boucle():
+    sheets = _chantier(400, 3)
+    etat = RecapMaterialise()
+    df_beton, df_prev, df_etude = feuilles_recap(sheets)
+    # Premier calcul sur une partie des bons, puis ajout incrémental du reste
+    etat.recaps(df_beton.iloc[:250], df_prev, df_etude)
+    recaps = etat.recaps(df_beton, df_prev, df_etude)
+    _comparer(recaps.beton, recaps.fondation, recap_boucle(sheets["Beton"], sheets["Previsionnel"], sheets["Etude_Beton"]))
+
+
+def recap_acier_boucle(df_acier, df_prev, df_etude_acier):
+    """Référence acier : {(Designation, Zone): [étude kg, poids livré]}, postes du prévisionnel et de l'étude."""
+    lignes = {}
+    for _, row_prev in df_prev.iterrows():
+        lignes.setdefault((row_prev["Designation"], row_prev["Zone"]), [0.0, 0.0])
+    for _, row in df_etude_acier.iterrows():
+        cle = (row["Designation"], row["Zone"])
+        lignes.setdefault(cle, [0.0, 0.0])[0] += float(row["Acier HA"]) + float(row["Acier TS"])
+    for _, row_reel in df_acier.iterrows():
+        nom = str(row_reel["Designation"]).strip()
+        type_acier = str(row_reel["Type d Acier"]).strip()
+        zone = detecter_zone_automatique(nom + " " + type_acier)
+        for _, row_prev in df_prev.iterrows():
+            mot_cle = remove_accents(str(row_prev["Designation"]).strip().lower())
+            if zone == row_prev["Zone"] and (mot_cle in remove_accents(nom.lower()) or mot_cle in remove_accents(type_acier.lower())):
+                lignes[(row_prev["Designation"], row_prev["Zone"])][1] += float(row_reel["Poids (kg)"])
+                break
+    return lignes
+
+
+def _comparer_acier(df_recap_acier, reference):
+    obtenu = {(d, z): [e, p] for d, z, e, p in df_recap_acier[["Designation", "Zone", "Etude (kg)", "Poids Reel (kg)"]].values}
+    assert obtenu.keys() == reference.keys()
+    for cle, (etude, poids) in reference.items():
+        assert obtenu[cle] == pytest.approx([etude, poids], rel=1e-6), cle
+
+
+def test_etude_acier_hors_previsionnel_gardee():
+    sheets = {
+        "Previsionnel": pd.DataFrame({"Designation": ["Voile"], "Zone": ["INFRA"], "Prevu (m3)": [10.0]}),
+        "Etude_Acier": pd.DataFrame({"Designation": ["Voile", "Poutre"], "Acier HA": [80.0, 500.0],
+                                     "Acier TS": [20.0, 50.0], "Zone": ["INFRA", "SUPER"]}),
+        "Acier": pd.DataFrame({"Fournisseur": ["A"], "Type d Acier": ["HA"], "Designation": ["Voile R-1"], "Poids (kg)": [40.0]}),
+    }
+    acier = calculer_recaps(*feuilles_recap(sheets), *feuilles_acier(sheets)).acier
+    assert acier["Etude (kg)"].sum() == 650.0
+    _comparer_acier(acier, recap_acier_boucle(sheets["Acier"], sheets["Previsionnel"], sheets["Etude_Acier"]))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_recap_acier_identique_a_la_boucle(seed):
+    sheets = _chantier(400, seed)
+    # Postes d'étude sans ligne au prévisionnel
+    sheets["Etude_Acier"] = pd.concat([sheets["Etude_Acier"], pd.DataFrame(
+        {"Designation": ["Cage d'escalier", "Voile"], "Acier HA": [300.0, 10.0], "Acier TS": [0.0, 5.0], "Zone": ["SUPER", "INFRA"]})],
+        ignore_index=True)
+    reference = recap_acier_boucle(sheets["Acier"], sheets["Previsionnel"], sheets["Etude_Acier"])
+    _comparer_acier(calculer_recaps(*feuilles_recap(sheets), *feuilles_acier(sheets)).acier, reference)
+    etat = RecapMaterialise()
+    _comparer_acier(etat.recaps(*feuilles_recap(sheets), *feuilles_acier(sheets)).acier, reference)
+
+
+def _publier_chantier(stockage, sheets, dossier="CHANTIERS/A"):
+    """Classeur et sidecar dans le même lot, comme une sauvegarde de l'application."""
+    path = f"{dossier}/A.xlsx"
+    with stockage.lot("Bench") as lot:
+        sha = lot.ecrire(path, serialiser_classeur(sheets), stockage.sha(path))
+        etat = recap_materialise(stockage, dossier)
+        etat.recaps(*feuilles_recap(sheets), *feuilles_acier(sheets), version=version_chantier(sha))
+        ecrire_sidecar(lot, dossier, etat)
+    return sha
+
+
+def test_sidecar_repris_puis_invalide(tmp_path, monkeypatch):
+    monkeypatch.setattr(recap, "_ETATS", {})
+    stockage = StockageLocal(tmp_path)
+    sheets = typer_classeur(_chantier(300, 4))
+    sha = _publier_chantier(stockage, sheets)
+    attendu = calculer_recaps(*feuilles_recap(sheets), *feuilles_acier(sheets))
+
+    # Nouveau processus : l'état est repris du sidecar, sans recumuler les bons de la même version
+    monkeypatch.setattr(recap, "_ETATS", {})
+    etat = recap_materialise(stockage, "CHANTIERS/A")
+    assert etat.suivis["Beton"].nb_bons == len(sheets["Beton"])
+    cumuler = RecapMaterialise._cumuler
+    appels = []
+    monkeypatch.setattr(RecapMaterialise, "_cumuler", lambda self, *a: appels.append(a[0]) or cumuler(self, *a))
+    repris = etat.recaps(*feuilles_recap(sheets), *feuilles_acier(sheets), version=version_chantier(sha))
+    assert appels == []
+    pd.testing.assert_frame_equal(repris.beton, attendu.beton)
+    pd.testing.assert_frame_equal(repris.acier, attendu.acier)
+
+    # Un bon déjà cumulé modifié : nouveau sha, l'empreinte ne correspond plus, la feuille est recalculée
+    sheets["Beton"].loc[0, "Volume (m3)"] += 100
+    sha = _publier_chantier(stockage, sheets)
+    monkeypatch.setattr(recap, "_ETATS", {})
+    recalcule = recap_materialise(stockage, "CHANTIERS/A").recaps(*feuilles_recap(sheets), *feuilles_acier(sheets),
+                                                                  version=version_chantier(sha))
+    assert appels
+    frais = calculer_recaps(*feuilles_recap(sheets), *feuilles_acier(sheets))
+    _comparer(recalcule.beton, recalcule.fondation, (frais.beton, frais.fondation))
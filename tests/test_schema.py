@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from itb77.correspondance import index_budget
+from itb77.recap import IndexBudget
+from itb77.schema import lire_classeur, pour_ecriture, serialiser_classeur, typer_feuille
+
+
+def test_quantites_relues_sans_perte():
+    volumes = [123456.789, 1234567.891, 3.2]
+    sheets = {"Beton": pd.DataFrame({"Fournisseur": ["A"] * 3, "Designation": ["Voile"] * 3,
+                                     "Type de Beton": ["C25"] * 3, "Volume (m3)": volumes})}
+    relu = lire_classeur(serialiser_classeur({"Beton": typer_feuille("Beton", sheets["Beton"])}))
+    assert relu["Beton"]["Volume (m3)"].dtype == np.float64
+    assert relu["Beton"]["Volume (m3)"].tolist() == volumes
+    # Un second enregistrement ne dégrade pas davantage
+    assert lire_classeur(serialiser_classeur(relu))["Beton"]["Volume (m3)"].tolist() == volumes
+
+
+def test_float32_ecrit_sans_artefact():
+    df = pd.DataFrame({"Prevu (m3)": np.array([3.2, 0.1], dtype=np.float32)})
+    assert pour_ecriture(df)["Prevu (m3)"].tolist() == [3.2, 0.1]
+
+
+def test_designation_vide_du_budget_n_attribue_rien():
+    budget = typer_feuille("Previsionnel", pd.DataFrame({"Designation": [None, "Voile"], "Zone": ["INFRA", "INFRA"]}))
+    positions = IndexBudget(budget).attribuer(["voile", "dalle"], ["", ""], np.array(["INFRA", "INFRA"], dtype=object))
+    assert positions.tolist() == [1, -1]
+    assert not index_budget(budget).est_connu("")
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from bench.depot_memoire import DepotMemoire
+from itb77 import stockage as module_stockage
+from itb77.stockage import ConflitStockage, StockageGithub, StockageLocal, sha_blob
+
+
+@pytest.fixture
+def stockage():
+    return StockageGithub(DepotMemoire({"CHANTIERS/A/A.xlsx": b"v1", "CHANTIERS/A/scan.jpg": b"img"}))
+
+
+def test_ecriture_puis_relecture(stockage):
+    sha = stockage.sha("CHANTIERS/A/A.xlsx")
+    assert sha == sha_blob(b"v1")
+    assert stockage.ecrire("CHANTIERS/A/A.xlsx", b"v2", "maj", sha) == sha_blob(b"v2")
+    assert stockage.lire("CHANTIERS/A/A.xlsx") == b"v2"
+    assert sorted(e.name for e in stockage.lister("CHANTIERS/A")) == ["A.xlsx", "scan.jpg"]
+
+
+def test_sha_perime_refuse(stockage):
+    with pytest.raises(ConflitStockage):
+        stockage.ecrire("CHANTIERS/A/A.xlsx", b"v2", "maj", sha_blob(b"ancien"))
+
+
+def test_lot_publie_en_un_commit(stockage):
+    depot = stockage.repo
+    with stockage.lot("Bon béton") as lot:
+        lot.ecrire("CHANTIERS/A/A.xlsx", b"v2", stockage.sha("CHANTIERS/A/A.xlsx"))
+        lot.ecrire("CHANTIERS/A/scan2.jpg", b"img2")
+        lot.supprimer("CHANTIERS/A/scan.jpg", sha_blob(b"img"))
+    assert depot.appels["create_git_commit"] == 1
+    assert depot.fichiers == {"CHANTIERS/A/A.xlsx": sha_blob(b"v2"), "CHANTIERS/A/scan2.jpg": sha_blob(b"img2")}
+
+
+@pytest.fixture
+def local(tmp_path):
+    stockage = StockageLocal(tmp_path)
+    stockage.ecrire("CHANTIERS/A/A.xlsx", b"v1", "init")
+    stockage.ecrire("CHANTIERS/A/scan.jpg", b"img", "init")
+    return stockage
+
+
+def _fichiers(racine):
+    return {os.path.relpath(os.path.join(d, f), racine): open(os.path.join(d, f), "rb").read()
+            for d, _, fs in os.walk(racine) for f in fs}
+
+
+def test_lot_local_tout_ou_rien(local, monkeypatch):
+    avant = _fichiers(local.racine)
+    remplacer = os.replace
+
+    def replace_defaillant(src, dst):
+        if dst.endswith("scan2.jpg"): raise OSError("disque plein")
+        remplacer(src, dst)
+
+    monkeypatch.setattr(module_stockage.os, "replace", replace_defaillant)
+    with pytest.raises(OSError):
+        with local.lot("Bon béton") as lot:
+            lot.ecrire("CHANTIERS/A/A.xlsx", b"v2", sha_blob(b"v1"))
+            lot.supprimer("CHANTIERS/A/scan.jpg", sha_blob(b"img"))
+            lot.ecrire("CHANTIERS/A/scan2.jpg", b"img2")
+    assert _fichiers(local.racine) == avant
+    assert local.sha("CHANTIERS/A/A.xlsx") == sha_blob(b"v1")
+
+
+def test_lot_local_publie(local):
+    with local.lot("Bon béton") as lot:
+        lot.ecrire("CHANTIERS/A/A.xlsx", b"v2", sha_blob(b"v1"))
+        lot.supprimer("CHANTIERS/A/scan.jpg", sha_blob(b"img"))
+        lot.ecrire("CHANTIERS/A/SCANS/scan2.jpg", b"img2")
+    assert _fichiers(local.racine) == {os.path.join("CHANTIERS", "A", "A.xlsx"): b"v2",
+                                       os.path.join("CHANTIERS", "A", "SCANS", "scan2.jpg"): b"img2"}
+
+
+def test_version_de_dossier_suit_les_ecritures(local):
+    local.ecrire("CHANTIERS/A/SCANS/s1.jpg", b"1", "scan")
+    version = {e.name: e.sha for e in local.lister("CHANTIERS")}["A"]
+    local.ecrire("CHANTIERS/A/SCANS/s2.jpg", b"2", "scan")
+    assert {e.name: e.sha for e in local.lister("CHANTIERS")}["A"] != version
+
+
+def test_synchro_publie_sans_relire_les_sha(tmp_path):
+    depot = DepotMemoire({"CHANTIERS/A/A.xlsx": b"v1"})
+    local = StockageLocal(tmp_path, StockageGithub(depot))
+    local._file.join()
+    local.ecrire("CHANTIERS/A/B.xlsx", b"b", "Create")
+    local.ecrire("CHANTIERS/A/B.xlsx", b"b2", "Update", sha_blob(b"b"))
+    local.ecrire("CHANTIERS/A/C.xlsx", b"c", "Create")
+    local.supprimer("CHANTIERS/A/C.xlsx", "Delete", sha_blob(b"c"))
+    local._file.join()
+    assert not local.synchro_erreurs
+    assert depot.fichiers == {"CHANTIERS/A/A.xlsx": sha_blob(b"v1"), "CHANTIERS/A/B.xlsx": sha_blob(b"b2")}
+    assert depot.appels["create_git_commit"] == 4
+    assert depot.appels["get_contents"] == 0